@@ -0,0 +1,89 @@
+import asyncio
+import os
+import threading
+
+#----------------------------------------------------------------------------#
+# Async read path.
+#
+# With ASYNC_READS on, the venue/artist detail payloads load their
+# independent queries (the entity row and its show rows) concurrently, each
+# on its own connection of an asyncio engine: asyncpg on postgres, aiosqlite
+# on sqlite. An asyncio engine's pool belongs to the event loop that
+# created it, so each process runs one loop in a daemon thread; request
+# threads hand it their statements and block until all of them are done.
+# That works the same under sync, threaded and preforked workers.
+#----------------------------------------------------------------------------#
+
+ASYNC_DRIVERS = {
+    'postgresql': 'postgresql+asyncpg',
+    'postgres': 'postgresql+asyncpg',
+    'sqlite': 'sqlite+aiosqlite',
+}
+
+def async_url(url):
+    # the asyncio driver URL for a sync one, e.g. postgresql://... ->
+    # postgresql+asyncpg://...
+    scheme, separator, rest = url.partition('://')
+    dialect = scheme.split('+')[0]
+    if dialect not in ASYNC_DRIVERS:
+        raise ValueError('no asyncio driver known for %s URLs, set ASYNC_DATABASE_URL' % scheme)
+    return ASYNC_DRIVERS[dialect] + separator + rest
+
+
+class AsyncReads(object):
+
+    def __init__(self, url, engine_options=None, timeout=None):
+        self.url = url
+        self.engine_options = engine_options or {}
+        self.timeout = timeout
+        self.loop = None
+        self.engine = None
+        self.pid = None
+        self.lock = threading.Lock()
+
+    def start(self):
+        # on first use in each process: a forked worker must not use the
+        # loop or the connections of its parent
+        with self.lock:
+            if self.loop is not None and self.pid == os.getpid():
+                return
+            from sqlalchemy.ext.asyncio import create_async_engine
+            loop = asyncio.new_event_loop()
+            threading.Thread(target=loop.run_forever, name='async-reads', daemon=True).start()
+
+            async def create():
+                return create_async_engine(self.url, **self.engine_options)
+
+            self.engine = asyncio.run_coroutine_threadsafe(create(), loop).result()
+            self.loop = loop
+            self.pid = os.getpid()
+
+    async def first(self, statement):
+        # the first entity of an ORM select, e.g. select(Venue), or None;
+        # the instance is detached with its columns loaded
+        from sqlalchemy.ext.asyncio import AsyncSession
+        async with AsyncSession(self.engine) as session:
+            return (await session.execute(statement)).scalars().first()
+
+    async def all(self, statement):
+        # every row of a column select
+        async with self.engine.connect() as connection:
+            return (await connection.execute(statement)).all()
+
+    def gather(self, *calls):
+        # runs the first()/all() calls concurrently on the loop and returns
+        # their results in order
+        self.start()
+
+        async def run():
+            return await asyncio.gather(*calls)
+
+        return asyncio.run_coroutine_threadsafe(run(), self.loop).result(self.timeout)
+
+    def dispose(self):
+        with self.lock:
+            if self.loop is None or self.pid != os.getpid():
+                return
+            asyncio.run_coroutine_threadsafe(self.engine.dispose(), self.loop).result(self.timeout)
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self.loop = self.engine = self.pid = None
@@ -5,15 +5,41 @@
 import json
 import dateutil.parser
 import babel
-from flask import Flask, render_template, request, Response, flash, redirect, url_for
+import babel.dates
+import functools
+from flask import Flask, Blueprint, render_template, request, Response, flash, redirect, url_for, abort, jsonify, stream_with_context
 from flask_moment import Moment
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event, inspect, exc, or_
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import column_property
+from sqlalchemy.dialects.postgresql import ExcludeConstraint
+from sqlalchemy.sql.expression import ClauseElement, Executable
+from sqlalchemy.ext.compiler import compiles
 import logging
 from logging import Formatter, FileHandler
-from flask_wtf import Form
 from forms import *
-from flask_migrate import Migrate, MigrateCommand
+from search import Search
+from pagination import paginate
+from rows import ShowRow, VenueShowRow, ArtistShowRow, ArtistRow, CalendarRow, row_columns, fetch_rows
+from cache import make_cache, make_page_cache, make_facet_cache, make_feed_cache
+from facets import Facets, make_filters, replace_genres, NO_FILTERS
+from matching import Matching
+from metrics import Metrics
+from replicas import ReplicaRouter, RoutingSession
+from clock import Clock
+from boundaries import BoundaryScheduler
+from assets import Assets
+from writes import UnitOfWork, WriteError
+from aio import AsyncReads, async_url
+from schedule import Conflict, ScheduleIndex, DEFAULT_DURATION, MAX_DURATION, show_end_time, overlap_clauses, describe, sweep_conflicts
+import bulk
+import ical
+from flask_migrate import Migrate
+import calendar
 import datetime
+import math
+import click
 #----------------------------------------------------------------------------#
 # App Config.
 #----------------------------------------------------------------------------#
@@ -22,21 +48,44 @@ app = Flask(__name__)
 moment = Moment(app)
 app.config.from_object('config')
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS']=False
-db = SQLAlchemy(app)
+# before the engine is created: metrics swaps in a pool class that times checkouts
+metrics = Metrics(app)
+assets = Assets(app)
+db = SQLAlchemy(app, session_options={'class_': RoutingSession})
+replicas = ReplicaRouter(app)
 
 migrate = Migrate(app, db)
+clock = Clock(app.config['SHOW_TIMEZONE'])
+
+if app.config['DATABASE_PGBOUNCER'] and app.config['DATABASE_STATEMENT_TIMEOUT']:
+    # PgBouncer drops session settings between transactions, so set the
+    # timeout at the start of each one
+    @event.listens_for(Engine, 'begin')
+    def set_statement_timeout(connection):
+        if connection.dialect.name == 'postgresql':
+            connection.execute(db.text('SET LOCAL statement_timeout = %d' % app.config['DATABASE_STATEMENT_TIMEOUT']))
 
 # TODO: connect to a local postgresql database (Done)
 #----------------------------------------------------------------------------#
 # Models.
 #----------------------------------------------------------------------------#
 
+# genre lists: a postgres array, a JSON list on sqlite (test runs, the
+# in-process search index, the replica stand-ins)
+GenreList = db.ARRAY(db.String).with_variant(db.JSON, 'sqlite')
+
 class Venue(db.Model):
     __tablename__ = 'Venue'
+    __table_args__ = (
+        db.Index('ix_Venue_city_state', 'city', 'state'),
+        db.Index('ix_Venue_name_trgm', 'name', postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'}),
+        # matching candidates: venues seeking talent in a state
+        db.Index('ix_Venue_state_seeking_talent', 'state', 'seeking_talent'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String)
-    genres = db.Column(db.ARRAY(db.String))
+    genres = db.Column(GenreList)
     city = db.Column(db.String(120))
     state = db.Column(db.String(120))
     address = db.Column(db.String(120))
@@ -65,9 +114,11 @@ class Venue(db.Model):
     def get_by_id(id):
         return Venue.query.filter_by(id=id).first()
 
-    def exhaustive_format(self):
-        past_shows = past_show_venue(self.id)
-        upcoming_shows = upcoming_show_venue(self.id)
+    def exhaustive_format(self, now=None, shows=None):
+        # shows: VenueShowRow tuples, loaded with venue_show_rows() if not given
+        if shows is None:
+            shows = venue_show_rows(self.id)
+        past_shows, upcoming_shows = split_shows(shows, now)
 
         return {
             'id': self.id,
@@ -84,14 +135,14 @@ class Venue(db.Model):
             'image_link': self.image_link,
             'past_shows': [{
                 'artist_id': show.artist_id,
-                "artist_name": Artist.get_by_id(show.artist_id).name,
-                "artist_image_link": Artist.get_by_id(show.artist_id).image_link,
+                "artist_name": show.artist_name,
+                "artist_image_link": show.artist_image_link,
                 "start_time": show.start_time.strftime("%m/%d/%Y, %H:%M")
             } for show in past_shows],
             'upcoming_shows': [{
-                'artist_id': show.artist.id,
-                'artist_name': Artist.get_by_id(show.artist_id).name,
-                'artist_image_link': Artist.get_by_id(show.artist_id).image_link,
+                'artist_id': show.artist_id,
+                'artist_name': show.artist_name,
+                'artist_image_link': show.artist_image_link,
                 'start_time': show.start_time.strftime("%m/%d/%Y, %H:%M")
             } for show in upcoming_shows],
             'past_shows_count': len(past_shows),
@@ -102,10 +153,14 @@ class Venue(db.Model):
 
 class Artist(db.Model):
     __tablename__ = 'Artist'
+    __table_args__ = (
+        db.Index('ix_Artist_name_trgm', 'name', postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'}),
+        db.Index('ix_Artist_state_seeking_venue', 'state', 'seeking_venue'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String)
-    genres = db.Column(db.ARRAY(db.String))
+    genres = db.Column(GenreList)
     city = db.Column(db.String(120))
     state = db.Column(db.String(120))
     phone = db.Column(db.String(120))
@@ -133,9 +188,11 @@ class Artist(db.Model):
     def get_by_id(id):
         return Artist.query.filter_by(id=id).first()
 
-    def exhaustive_format(self):
-        past_shows = past_show_artist(self.id)
-        upcoming_shows = upcoming_show_artist(self.id)
+    def exhaustive_format(self, now=None, shows=None):
+        # shows: ArtistShowRow tuples, loaded with artist_show_rows() if not given
+        if shows is None:
+            shows = artist_show_rows(self.id)
+        past_shows, upcoming_shows = split_shows(shows, now)
 
         return {
             "id": self.id,
@@ -151,27 +208,44 @@ class Artist(db.Model):
             "image_link": self.image_link,
             "past_shows": [{
               "venue_id": show.venue_id,
-              "venue_name": Venue.get_by_id(show.venue_id).name,
-              "venue_image_link": Venue.get_by_id(show.venue_id).image_link,
+              "venue_name": show.venue_name,
+              "venue_image_link": show.venue_image_link,
               "start_time": show.start_time.strftime("%m/%d/%Y, %H:%M")
             } for show in past_shows],
             "upcoming_shows": [{
                 "venue_id": show.venue_id,
-                "venue_name": Venue.get_by_id(show.venue_id).name,
-                "venue_image_link": Venue.get_by_id(show.venue_id).image_link,
+                "venue_name": show.venue_name,
+                "venue_image_link": show.venue_image_link,
                 "start_time": show.start_time.strftime("%m/%d/%Y, %H:%M")
             } for show in upcoming_shows],
             "past_shows_count": len(past_shows),
             "upcoming_shows_count": len(upcoming_shows)
         }
 
+# the shows the booking exclusion constraints cover
+BOOKED = db.text('start_time IS NOT NULL AND end_time IS NOT NULL')
+
 class Show(db.Model):
     __tablename__='Show'
+    __table_args__ = (
+        db.Index('ix_Show_venue_id_start_time', 'venue_id', 'start_time'),
+        db.Index('ix_Show_artist_id_start_time', 'artist_id', 'start_time'),
+        # postgres refuses overlapping bookings of a venue or an artist
+        # itself, even from concurrent requests or plain SQL; shows without
+        # a start time book nothing (their unbounded range would overlap all)
+        ExcludeConstraint(('venue_id', '='), (db.func.tsrange(db.column('start_time'), db.column('end_time')), '&&'),
+                          name='ex_Show_venue_booking', using='gist', where=BOOKED).ddl_if(dialect='postgresql'),
+        ExcludeConstraint(('artist_id', '='), (db.func.tsrange(db.column('start_time'), db.column('end_time')), '&&'),
+                          name='ex_Show_artist_booking', using='gist', where=BOOKED).ddl_if(dialect='postgresql'),
+    )
 
+    # active_history: show_updated needs the old values to move the show
+    # counts, even when the instance was expired by a commit before the edit
     id = db.Column(db.Integer, primary_key=True)
-    start_time = db.Column(db.DateTime)
-    artist_id = db.Column(db.Integer, db.ForeignKey('Artist.id'), nullable=False)
-    venue_id = db.Column(db.Integer, db.ForeignKey('Venue.id'), nullable=False)
+    start_time = column_property(db.Column(db.DateTime, index=True), active_history=True)
+    end_time = db.Column(db.DateTime)
+    artist_id = column_property(db.Column(db.Integer, db.ForeignKey('Artist.id'), nullable=False), active_history=True)
+    venue_id = column_property(db.Column(db.Integer, db.ForeignKey('Venue.id'), nullable=False), active_history=True)
     artist = db.relationship('Artist', backref=db.backref('shows',cascade="all,delete"))
     venue = db.relationship('Venue', backref=db.backref('shows', cascade="all,delete"))
 
@@ -179,6 +253,7 @@ class Show(db.Model):
         return ({
             'id': self.id,
             'start_time': self.start_time,
+            'end_time': self.end_time,
             'artist_id': self.artist_id,
             'venue_id': self.venue_id,
         })
@@ -186,37 +261,543 @@ class Show(db.Model):
     def get_by_id(id):
         return Show.query.filter_by(id=id).first()
 
-def past_show_venue(venue_id):
-    past_shows = Show.query.filter(Show.start_time < datetime.datetime.now(),Show.venue_id==venue_id).all()
-    return past_shows
+# Per-venue and per-artist upcoming/past show counts. A show counts as past
+# once its start_time is at or before ShowCountRefresh.refreshed_at; the
+# refresh-show-counts command advances that watermark and moves only the shows
+# that crossed it, and show inserts/deletes adjust the counts in their own
+# flush. Listing pages read one row per entity instead of counting shows.
+class VenueShowCount(db.Model):
+    __tablename__ = 'VenueShowCount'
 
-def upcoming_show_venue(venue_id):
-    upcoming_shows = Show.query.filter(Show.start_time > datetime.datetime.now(),Show.venue_id==venue_id).all()
-    return upcoming_shows
+    venue_id = db.Column(db.Integer, primary_key=True)
+    upcoming = db.Column(db.Integer, nullable=False, default=0)
+    past = db.Column(db.Integer, nullable=False, default=0)
 
-def past_show_artist(artist_id):
-    past_shows = Show.query.filter(Show.start_time < datetime.datetime.now(),Show.artist_id==artist_id).all()
-    return past_shows
+class ArtistShowCount(db.Model):
+    __tablename__ = 'ArtistShowCount'
 
-def upcoming_show_artist(artist_id):
-    upcoming_shows = Show.query.filter(Show.start_time > datetime.datetime.now(),Show.artist_id==artist_id).all()
-    return upcoming_shows
+    artist_id = db.Column(db.Integer, primary_key=True)
+    upcoming = db.Column(db.Integer, nullable=False, default=0)
+    past = db.Column(db.Integer, nullable=False, default=0)
 
-    # TODO: implement any missing fields, as a database migration using Flask-Migrate (Done)
+class ShowCountRefresh(db.Model):
+    __tablename__ = 'ShowCountRefresh'
+
+    id = db.Column(db.Integer, primary_key=True)
+    refreshed_at = db.Column(db.DateTime, nullable=False)
+
+def shift_show_counts(connection, venue_id, artist_id, start_time, delta):
+    # add delta (+1/-1) to the counters of one show inside the current flush
+    if start_time is None:
+        return
+    refresh = ShowCountRefresh.__table__
+    watermark = connection.execute(
+        refresh.select().where(refresh.c.id == 1).with_for_update(read=True)
+    ).first()
+    if watermark is None:
+        # counts were never built; refresh-show-counts --full will build them
+        return
+    column = 'upcoming' if start_time > watermark.refreshed_at else 'past'
+    for table, key, id in ((VenueShowCount.__table__, 'venue_id', venue_id),
+                           (ArtistShowCount.__table__, 'artist_id', artist_id)):
+        result = connection.execute(
+            table.update().where(table.c[key] == id).values({column: table.c[column] + delta})
+        )
+        if result.rowcount == 0 and delta > 0:
+            connection.execute(table.insert().values({key: id, 'upcoming': 0, 'past': 0, column: delta}))
+
+@event.listens_for(Show, 'after_insert')
+def show_inserted(mapper, connection, show):
+    shift_show_counts(connection, show.venue_id, show.artist_id, show.start_time, 1)
+
+@event.listens_for(Show, 'after_delete')
+def show_deleted(mapper, connection, show):
+    shift_show_counts(connection, show.venue_id, show.artist_id, show.start_time, -1)
+
+@event.listens_for(Show, 'after_update')
+def show_updated(mapper, connection, show):
+    state = inspect(show)
+    old = {}
+    for name in ('venue_id', 'artist_id', 'start_time'):
+        history = state.attrs[name].history
+        old[name] = history.deleted[0] if history.deleted else getattr(show, name)
+    if old != {'venue_id': show.venue_id, 'artist_id': show.artist_id, 'start_time': show.start_time}:
+        shift_show_counts(connection, old['venue_id'], old['artist_id'], old['start_time'], -1)
+        shift_show_counts(connection, show.venue_id, show.artist_id, show.start_time, 1)
+
+@event.listens_for(Venue, 'after_delete')
+def venue_deleted(mapper, connection, venue):
+    table = VenueShowCount.__table__
+    connection.execute(table.delete().where(table.c.venue_id == venue.id))
+
+@event.listens_for(Artist, 'after_delete')
+def artist_deleted(mapper, connection, artist):
+    table = ArtistShowCount.__table__
+    connection.execute(table.delete().where(table.c.artist_id == artist.id))
+
+# Genre index: one (genre, venue/artist) row per listed genre, rewritten by the
+# events below whenever an entity's genres change. Genre filters and facet
+# counts read these tables (see facets.py) instead of the genres arrays.
+class VenueGenre(db.Model):
+    __tablename__ = 'VenueGenre'
+    __table_args__ = (
+        db.Index('ix_VenueGenre_venue_id', 'venue_id'),
+    )
+
+    genre = db.Column(db.String(120), primary_key=True)
+    venue_id = db.Column(db.Integer, primary_key=True)
+
+class ArtistGenre(db.Model):
+    __tablename__ = 'ArtistGenre'
+    __table_args__ = (
+        db.Index('ix_ArtistGenre_artist_id', 'artist_id'),
+    )
+
+    genre = db.Column(db.String(120), primary_key=True)
+    artist_id = db.Column(db.Integer, primary_key=True)
+
+@event.listens_for(Venue, 'after_insert')
+@event.listens_for(Venue, 'after_update')
+def venue_genres_written(mapper, connection, venue):
+    if inspect(venue).attrs.genres.history.has_changes():
+        replace_genres(connection, VenueGenre.__table__, 'venue_id', venue.id, venue.genres)
+
+@event.listens_for(Venue, 'after_delete')
+def venue_genres_deleted(mapper, connection, venue):
+    replace_genres(connection, VenueGenre.__table__, 'venue_id', venue.id, None)
+
+@event.listens_for(Artist, 'after_insert')
+@event.listens_for(Artist, 'after_update')
+def artist_genres_written(mapper, connection, artist):
+    if inspect(artist).attrs.genres.history.has_changes():
+        replace_genres(connection, ArtistGenre.__table__, 'artist_id', artist.id, artist.genres)
+
+@event.listens_for(Artist, 'after_delete')
+def artist_genres_deleted(mapper, connection, artist):
+    replace_genres(connection, ArtistGenre.__table__, 'artist_id', artist.id, None)
+
+def refresh_show_counts(now=None, full=False):
+    # Incremental: move shows with watermark < start_time <= now from upcoming
+    # to past. Full: rebuild every counter from the Show table.
+    if now is None:
+        now = clock.naive()
+    watermark = ShowCountRefresh.query.filter_by(id=1).with_for_update().first()
+    counters = ((VenueShowCount, VenueShowCount.venue_id, Show.venue_id),
+                (ArtistShowCount, ArtistShowCount.artist_id, Show.artist_id))
+    moved = 0
+    if full or watermark is None:
+        for model, key, show_key in counters:
+            model.query.delete()
+            rows = db.session.query(
+                show_key,
+                db.func.count(Show.id).filter(Show.start_time > now),
+                db.func.count(Show.id).filter(Show.start_time <= now)
+            ).filter(Show.start_time.isnot(None)).group_by(show_key).all()
+            db.session.bulk_insert_mappings(model, [
+                {key.key: id, 'upcoming': upcoming, 'past': past} for id, upcoming, past in rows
+            ])
+        if watermark is None:
+            watermark = ShowCountRefresh(id=1, refreshed_at=now)
+            db.session.add(watermark)
+    elif now > watermark.refreshed_at:
+        # claim the window first: a concurrent refresh that read the same
+        # watermark (the cron command, another process) then updates no row
+        # and moves nothing. FOR UPDATE already serializes this on postgres;
+        # sqlite ignores it but serializes the writes.
+        since = watermark.refreshed_at
+        claimed = ShowCountRefresh.query.filter_by(id=1, refreshed_at=since).update(
+            {ShowCountRefresh.refreshed_at: now}, synchronize_session=False)
+        if not claimed:
+            db.session.rollback()
+            return 0
+        crossed = (Show.start_time > since, Show.start_time <= now)
+        moved = Show.query.filter(*crossed).count()
+        for model, key, show_key in counters:
+            rows = db.session.query(show_key, db.func.count(Show.id)).filter(*crossed).group_by(show_key).all()
+            for id, count in rows:
+                model.query.filter(key == id).update({
+                    model.upcoming: model.upcoming - count,
+                    model.past: model.past + count
+                }, synchronize_session=False)
+    watermark.refreshed_at = max(now, watermark.refreshed_at)
+    db.session.commit()
+    if full or moved:
+        page_cache.bump()
+    return moved
+
+def split_shows(shows, now=None):
+    # partition already-loaded shows into (past, upcoming) against a single "now";
+    # sorting the start_time ordered rows of venue_show_rows() is linear
+    if now is None:
+        now = clock.naive()
+    past_shows = []
+    upcoming_shows = []
+    for show in sorted((s for s in shows if s.start_time is not None), key=lambda s: s.start_time):
+        # a show starting right now is past, as in the show counts: the
+        # boundary scheduler rebuilds the payloads at exactly that instant
+        if show.start_time <= now:
+            past_shows.append(show)
+        else:
+            upcoming_shows.append(show)
+    return past_shows, upcoming_shows
+
+# Detail pages load the entity, then its shows joined with the counterpart's
+# name and image as compact rows: two queries no matter how many shows the
+# entity has, and no Show/Artist/Venue instances for them.
+def venue_show_query(venue_id):
+    return db.session.query(*row_columns(
+        VenueShowRow, start_time=Show.start_time, artist_id=Show.artist_id,
+        artist_name=Artist.name, artist_image_link=Artist.image_link
+    )).join(Artist, Show.artist_id == Artist.id).filter(
+        Show.venue_id == venue_id, Show.start_time.isnot(None)
+    ).order_by(Show.start_time)
+
+def venue_show_rows(venue_id):
+    return list(fetch_rows(venue_show_query(venue_id), VenueShowRow, batch_size=1000))
+
+def artist_show_query(artist_id):
+    return db.session.query(*row_columns(
+        ArtistShowRow, start_time=Show.start_time, venue_id=Show.venue_id,
+        venue_name=Venue.name, venue_image_link=Venue.image_link
+    )).join(Venue, Show.venue_id == Venue.id).filter(
+        Show.artist_id == artist_id, Show.start_time.isnot(None)
+    ).order_by(Show.start_time)
+
+def artist_show_rows(artist_id):
+    return list(fetch_rows(artist_show_query(artist_id), ArtistShowRow, batch_size=1000))
+
+def venue_areas(filters=NO_FILTERS, after=None, before=None, limit=50):
+    # a page of the venues matching filters with their upcoming show count
+    # from the summary table, keyset-paginated in city/state/name order so
+    # that venues of the same area are adjacent
+    query = db.session.query(
+        Venue.id, Venue.name, Venue.city, Venue.state,
+        db.func.coalesce(VenueShowCount.upcoming, 0).label('num_upcoming_shows')
+    ).outerjoin(VenueShowCount, VenueShowCount.venue_id == Venue.id)
+    query = venue_facets.filter(query, filters)
+    page = paginate(query, (Venue.city, Venue.state, Venue.name, Venue.id), after, before, limit)
+
+    areas = []
+    for row in page.items:
+        if not areas or (areas[-1]['city'], areas[-1]['state']) != (row.city, row.state):
+            areas.append({'city': row.city, 'state': row.state, 'venues': []})
+        areas[-1]['venues'].append({
+            'id': row.id,
+            'name': row.name,
+            'num_upcoming_shows': row.num_upcoming_shows
+        })
+    return areas, page
+
+def show_listing_query():
+    # ShowRow columns: shows joined with the venue/artist columns the listing displays
+    return db.session.query(*row_columns(
+        ShowRow, id=Show.id, start_time=Show.start_time,
+        venue_id=Show.venue_id, venue_name=Venue.name,
+        artist_id=Show.artist_id, artist_name=Artist.name, artist_image_link=Artist.image_link
+    )).join(Venue, Show.venue_id == Venue.id).join(Artist, Show.artist_id == Artist.id)
+
+#----------------------------------------------------------------------------#
+# Cache.
+#----------------------------------------------------------------------------#
 
-# TODO Implement Show and Artist models, and complete all model relationships and properties, as a database migration. (Done)
+entity_cache = make_cache(app.config)
+metrics.gauge('entity_cache_hits_total', 'Entity payload cache hits.', lambda: entity_cache.hits, 'counter')
+metrics.gauge('entity_cache_misses_total', 'Entity payload cache misses.', lambda: entity_cache.misses, 'counter')
+# A page rendered from a lagging replica right after a write would be stored
+# under the bumped version, so missed pages are rendered from the primary,
+# and a client that just wrote skips the cache until it is off the primary.
+page_cache = make_page_cache(app.config, bypass=replicas.is_sticky, fresh=replicas.primary)
+page_cache.watch(RoutingSession, (Venue, Artist, Show))
+metrics.gauge('page_cache_hits_total', 'Rendered page cache hits.', lambda: page_cache.hits, 'counter')
+metrics.gauge('page_cache_misses_total', 'Rendered page cache misses.', lambda: page_cache.misses, 'counter')
+metrics.gauge('page_cache_not_modified_total', 'Page requests answered with 304.', lambda: page_cache.not_modified, 'counter')
+facet_cache = make_facet_cache(app.config)
+facet_cache.watch(RoutingSession, {Venue: 'venue', Artist: 'artist'})
+metrics.gauge('facet_cache_hits_total', 'Genre/area facet cache hits.', lambda: facet_cache.hits, 'counter')
+metrics.gauge('facet_cache_misses_total', 'Genre/area facet cache misses.', lambda: facet_cache.misses, 'counter')
+feed_cache = make_feed_cache(app.config)
+metrics.gauge('feed_cache_hits_total', 'Calendar feed cache hits.', lambda: feed_cache.hits, 'counter')
+metrics.gauge('feed_cache_misses_total', 'Calendar feed cache misses.', lambda: feed_cache.misses, 'counter')
+metrics.gauge('db_replica_reads_total', 'Read-only requests routed to a replica.', lambda: replicas.decisions['replica'], 'counter')
+metrics.gauge('db_replica_sticky_total', 'Read-only requests kept on the primary after a write.', lambda: replicas.decisions['sticky'], 'counter')
+metrics.gauge('db_replica_fallbacks_total', 'Read-only requests sent to the primary for lack of a usable replica.', lambda: replicas.decisions['fallback'], 'counter')
+
+# Payloads are loaded from the primary even on replica-routed pages: a read
+# from a lagging replica right after an invalidation would cache stale data.
+# Detail payloads split shows into past and upcoming, so they expire when
+# the first upcoming show starts at the latest.
+# With ASYNC_READS, a detail payload's entity and show rows are two
+# independent queries run concurrently on the async engine (aio.py), which
+# only ever reads the primary.
+
+async_reads = None
+if app.config['ASYNC_READS']:
+    async_reads = AsyncReads(app.config['ASYNC_DATABASE_URL'] or async_url(app.config['SQLALCHEMY_DATABASE_URI']),
+                             app.config['ASYNC_ENGINE_OPTIONS'], app.config['ASYNC_READ_TIMEOUT'])
+
+def seconds_until_next_show(shows, now, limit):
+    upcoming = [show.start_time for show in shows if show.start_time is not None and show.start_time > now]
+    if not upcoming:
+        return limit
+    return max(1, min(limit, int(math.ceil((min(upcoming) - now).total_seconds()))))
+
+def load_detail(model, entity_id, show_query, row_type):
+    # (entity or None, show rows)
+    if async_reads is not None:
+        entity, rows = async_reads.gather(
+            async_reads.first(db.select(model).where(model.id == entity_id)),
+            async_reads.all(show_query(entity_id).statement))
+        return entity, [row_type._make(row) for row in rows]
+    entity = model.get_by_id(entity_id)
+    if entity is None:
+        return None, []
+    return entity, list(fetch_rows(show_query(entity_id), row_type, batch_size=1000))
+
+def cached_payload(kind, entity_id, model, show_query, row_type, detail):
+    now = clock.naive()
+    ttl = {'seconds': entity_cache.ttl}
+    def load():
+        with replicas.primary():
+            if not detail:
+                entity = model.get_by_id(entity_id)
+                return entity.format() if entity is not None else None
+            entity, shows = load_detail(model, entity_id, show_query, row_type)
+            if entity is None:
+                return None
+            ttl['seconds'] = seconds_until_next_show(shows, now, entity_cache.ttl)
+            return entity.exhaustive_format(now, shows)
+    return entity_cache.get_or_load(kind, entity_id, load, 'detail' if detail else 'format', lambda: ttl['seconds'])
+
+def cached_venue(venue_id, detail=False):
+    # format() or exhaustive_format() payload of a venue, None if it does not exist
+    return cached_payload('venue', venue_id, Venue, venue_show_query, VenueShowRow, detail)
+
+def cached_artist(artist_id, detail=False):
+    return cached_payload('artist', artist_id, Artist, artist_show_query, ArtistShowRow, detail)
+
+def linked_artist_ids(venue_id):
+    return [id for id, in db.session.query(Show.artist_id).filter(Show.venue_id == venue_id).distinct()]
+
+def linked_venue_ids(artist_id):
+    return [id for id, in db.session.query(Show.venue_id).filter(Show.artist_id == artist_id).distinct()]
+
+def invalidate_venue(venue_id, artist_ids=None):
+    # a venue's payloads and those of the artists whose shows list it
+    if artist_ids is None:
+        artist_ids = linked_artist_ids(venue_id)
+    entity_cache.invalidate('venue', [venue_id])
+    entity_cache.invalidate('artist', artist_ids)
+    feed_cache.touch('venue', [venue_id])
+    feed_cache.touch('artist', artist_ids)
+
+def invalidate_artist(artist_id, venue_ids=None):
+    if venue_ids is None:
+        venue_ids = linked_venue_ids(artist_id)
+    entity_cache.invalidate('artist', [artist_id])
+    entity_cache.invalidate('venue', venue_ids)
+    feed_cache.touch('artist', [artist_id])
+    feed_cache.touch('venue', venue_ids)
+
+#  Show boundaries
+#  ----------------------------------------------------------------
+#  Background thread that, when a venue's or artist's next show starts,
+#  moves the show counters, drops the entity's cached payloads and bumps
+#  the page cache, so time-dependent pages stay exact between writes.
+
+def next_show_boundaries(now, keys=None):
+    # {(kind, id): first show start after now} for every venue and artist,
+    # or only for keys
+    boundaries = {}
+    for kind, column in (('venue', Show.venue_id), ('artist', Show.artist_id)):
+        query = db.session.query(column, db.func.min(Show.start_time)).filter(Show.start_time > now)
+        if keys is not None:
+            ids = [id for key_kind, id in keys if key_kind == kind]
+            if not ids:
+                continue
+            query = query.filter(column.in_(ids))
+        for id, start_time in query.group_by(column):
+            boundaries[(kind, id)] = start_time
+    return boundaries
+
+def show_boundaries_passed(keys, now):
+    refresh_show_counts(now)
+    entity_cache.invalidate('venue', [id for kind, id in keys if kind == 'venue'])
+    entity_cache.invalidate('artist', [id for kind, id in keys if kind == 'artist'])
+    page_cache.bump()
+
+show_boundaries = BoundaryScheduler(clock, next_show_boundaries, show_boundaries_passed, app.app_context,
+                                    reload_interval=app.config['SHOW_BOUNDARY_RELOAD_INTERVAL'], logger=app.logger,
+                                    lock_path=app.config['SHOW_BOUNDARY_LOCK'])
+
+@event.listens_for(Show, 'after_insert')
+@event.listens_for(Show, 'after_update')
+def show_boundary_written(mapper, connection, show):
+    show_boundaries.offer('venue', show.venue_id, show.start_time)
+    show_boundaries.offer('artist', show.artist_id, show.start_time)
+
+@app.before_request
+def start_show_boundaries():
+    # started by the first request rather than at import, so CLI commands
+    # do not spawn it
+    if app.config['SHOW_BOUNDARY_SCHEDULER']:
+        show_boundaries.start()
+
+# pages whose past/upcoming split or upcoming counts change as time passes;
+# with the scheduler running they only change at a show boundary
+time_page_ttl = app.config['PAGE_CACHE_TTL' if app.config['SHOW_BOUNDARY_SCHEDULER'] else 'PAGE_CACHE_TIME_TTL']
+
+#  Booking conflicts
+#  ----------------------------------------------------------------
+#  A new show may not overlap another show of its venue or its artist.
+#  Single shows are checked with one range query on the start_time
+#  indexes; imported schedules against a ScheduleIndex of the rows already
+#  accepted plus the existing shows around them, loaded once per chunk.
+
+def show_conflicts(venue_id, artist_id, start_time, end_time):
+    # the existing shows the booking would overlap, as Conflicts
+    conflicts = []
+    for kind, column, key in (('venue', Show.venue_id, venue_id), ('artist', Show.artist_id, artist_id)):
+        query = db.session.query(Show.id, Show.start_time, Show.end_time).filter(
+            *overlap_clauses(column, key, Show.start_time, Show.end_time, start_time, end_time)
+        ).order_by(Show.start_time)
+        for id, other_start, other_end in query:
+            conflicts.append(Conflict(kind, key, None, start_time, end_time, ('show', id), other_start, other_end))
+    return conflicts
+
+def load_bookings(index, records, before_id, loaded):
+    # adds the shows with id <= before_id that could overlap any of the
+    # records to index, in one query; before_id leaves out the rows this
+    # import inserted itself, which are in index already, and loaded the
+    # shows an earlier chunk added
+    starts = [record['start_time'] for record in records]
+    venue_ids = set(record['venue_id'] for record in records)
+    artist_ids = set(record['artist_id'] for record in records)
+    query = db.session.query(Show.id, Show.venue_id, Show.artist_id, Show.start_time, Show.end_time).filter(
+        or_(Show.venue_id.in_(venue_ids), Show.artist_id.in_(artist_ids)),
+        Show.start_time >= min(starts) - MAX_DURATION,
+        Show.start_time < max(record['end_time'] for record in records),
+        Show.id <= before_id
+    )
+    for id, venue_id, artist_id, start_time, end_time in query:
+        if id in loaded or end_time is None:
+            continue
+        loaded.add(id)
+        index.add('venue', venue_id, start_time, end_time, ('show', id))
+        index.add('artist', artist_id, start_time, end_time, ('show', id))
+
+#  Calendars
+#  ----------------------------------------------------------------
+#  iCal feeds and month pages of a venue's or an artist's shows, each read
+#  with one range scan of its (venue_id, start_time) or (artist_id,
+#  start_time) index. Feeds are cached per entity and rebuilt only when
+#  that entity's shows, or the entity itself, change.
+
+def calendar_rows(kind, entity_id, start_time, end_time=None):
+    # the entity's shows starting in [start_time, end_time), in start order
+    key = Show.venue_id if kind == 'venue' else Show.artist_id
+    query = db.session.query(*row_columns(
+        CalendarRow, id=Show.id, start_time=Show.start_time, end_time=Show.end_time, venue_id=Show.venue_id,
+        venue_name=Venue.name, venue_address=Venue.address, venue_city=Venue.city, venue_state=Venue.state,
+        artist_id=Show.artist_id, artist_name=Artist.name
+    )).join(Venue, Show.venue_id == Venue.id).join(Artist, Show.artist_id == Artist.id).filter(
+        key == entity_id, Show.start_time >= start_time
+    )
+    if end_time is not None:
+        query = query.filter(Show.start_time < end_time)
+    return list(fetch_rows(query.order_by(Show.start_time), CalendarRow))
+
+def calendar_feed(kind, entity_id, name):
+    # the iCal feed of the shows of the last CALENDAR_PAST_DAYS days and
+    # every upcoming one
+    since = clock.naive().replace(hour=0, minute=0, second=0, microsecond=0) - datetime.timedelta(
+        days=app.config['CALENDAR_PAST_DAYS'])
+    stamp = datetime.datetime.fromtimestamp(feed_cache.changed(kind, entity_id), clock.zone)
+    events = []
+    for row in calendar_rows(kind, entity_id, since):
+        if kind == 'venue':
+            url = url_for('show_artist', artist_id=row.artist_id, _external=True)
+        else:
+            url = url_for('show_venue', venue_id=row.venue_id, _external=True)
+        location = ', '.join(part for part in (row.venue_name, row.venue_address, row.venue_city, row.venue_state) if part)
+        events.append(ical.event(
+            'show-%d@fyyur' % row.id, clock.aware(row.start_time),
+            clock.aware(row.end_time or row.start_time + DEFAULT_DURATION),
+            '%s at %s' % (row.artist_name, row.venue_name), location, url, stamp
+        ))
+    return ical.calendar(name, events)
+
+def feed_response(kind, entity_id, name):
+    # served with Last-Modified and an ETag; clients revalidate every time
+    # and get a 304 straight from the cache while the feed is unchanged
+    entry = feed_cache.get_or_load(kind, entity_id, 'ical', lambda: calendar_feed(kind, entity_id, name))
+    response = Response(entry['body'], mimetype='text/calendar')
+    response.set_etag(entry['etag'])
+    response.last_modified = entry['modified']
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
+
+def month_arg():
+    # ?month=YYYY-MM, this month by default; the first day of the month
+    month = request.args.get('month')
+    if not month:
+        return clock.naive().date().replace(day=1)
+    try:
+        return datetime.datetime.strptime(month, '%Y-%m').date()
+    except ValueError:
+        abort(400)
+
+def month_calendar(kind, entity_id, first):
+    # weeks (Sunday first) of (date, shows that day) for the month view, plus
+    # the first days of the previous and next months
+    following = (first + datetime.timedelta(days=31)).replace(day=1)
+    start_time = datetime.datetime.combine(first, datetime.time())
+    by_day = {}
+    for row in calendar_rows(kind, entity_id, start_time, datetime.datetime.combine(following, datetime.time())):
+        by_day.setdefault(row.start_time.date(), []).append(row)
+    weeks = [[(day, by_day.get(day, [])) for day in week]
+             for week in calendar.Calendar(calendar.SUNDAY).monthdatescalendar(first.year, first.month)]
+    previous = (first - datetime.timedelta(days=1)).replace(day=1)
+    return weeks, previous, following
+
+venue_facets = Facets(db, Venue, VenueGenre, facet_cache, 'venue')
+artist_facets = Facets(db, Artist, ArtistGenre, facet_cache, 'artist')
+
+# venues for an artist, artists for a venue
+venue_matching = Matching(db, Venue, VenueGenre, Venue.seeking_talent, Show.venue_id, Show)
+artist_matching = Matching(db, Artist, ArtistGenre, Artist.seeking_venue, Show.artist_id, Show)
+
+venue_search = Search(db, Venue, VenueShowCount.venue_id, VenueShowCount.upcoming,
+                      limit=app.config['SEARCH_RESULT_LIMIT'], facets=venue_facets)
+artist_search = Search(db, Artist, ArtistShowCount.artist_id, ArtistShowCount.upcoming,
+                       limit=app.config['SEARCH_RESULT_LIMIT'], facets=artist_facets)
 
 #----------------------------------------------------------------------------#
 # Filters.
 #----------------------------------------------------------------------------#
 
+DATETIME_PATTERNS = {
+    'full': babel.dates.parse_pattern("EEEE MMMM, d, y 'at' h:mma"),
+    'medium': babel.dates.parse_pattern("EE MM, dd, y h:mma"),
+}
+DATETIME_LOCALE = babel.Locale.parse(babel.dates.LC_TIME)
+
+@functools.lru_cache(maxsize=4096)
 def format_datetime(value, format='medium'):
-  date = dateutil.parser.parse(value)
-  if format == 'full':
-      format="EEEE MMMM, d, y 'at' h:mma"
-  elif format == 'medium':
-      format="EE MM, dd, y h:mma"
-  return babel.dates.format_datetime(date, format)
+  # accepts datetimes or the "%m/%d/%Y, %H:%M" strings of the show payloads;
+  # pages repeat the same timestamps, so results are memoized
+  if isinstance(value, datetime.datetime):
+      date = value
+  else:
+      try:
+          date = datetime.datetime.strptime(value, "%m/%d/%Y, %H:%M")
+      except ValueError:
+          date = dateutil.parser.parse(value)
+  if date.tzinfo is None:
+      date = date.replace(tzinfo=babel.dates.UTC)
+  pattern = DATETIME_PATTERNS.get(format)
+  if pattern is None:
+      pattern = babel.dates.parse_pattern(format)
+  return pattern.apply(date, DATETIME_LOCALE)
 
 app.jinja_env.filters['datetime'] = format_datetime
 
@@ -224,6 +805,51 @@ app.jinja_env.filters['datetime'] = format_datetime
 # Controllers.
 #----------------------------------------------------------------------------#
 
+def page_args():
+  # ?after=<cursor> / ?before=<cursor> / ?limit=<n> for the paginated listings
+  try:
+      limit = int(request.args.get('limit', app.config['PAGE_SIZE']))
+  except ValueError:
+      abort(400)
+  return {
+      'after': request.args.get('after'),
+      'before': request.args.get('before'),
+      'limit': max(1, min(limit, app.config['MAX_PAGE_SIZE']))
+  }
+
+def filter_args(args=None):
+  # ?genre=Jazz&genre=Blues&city=...&state=NY: entities listing every given
+  # genre, in the given area; read from a posted form for the searches
+  args = request.args if args is None else args
+  return make_filters(args.getlist('genre'), args.get('city'), args.get('state'))
+
+def parse_moment(value):
+  # naive SHOW_TIMEZONE wall-clock time; values with an offset are converted
+  return clock.aware(dateutil.parser.parse(value)).replace(tzinfo=None)
+
+def window_args():
+  # ?start=<datetime>&end=<datetime> for the matching API; end defaults to a
+  # show's default duration after start
+  try:
+      start_time = parse_moment(request.args['start'])
+      end_time = parse_moment(request.args['end']) if request.args.get('end') else start_time + DEFAULT_DURATION
+  except (KeyError, ValueError, OverflowError):
+      abort(400)
+  if end_time <= start_time:
+      abort(400)
+  return start_time, end_time
+
+@app.template_global()
+def url_with(**changes):
+  # the current page's URL with some query arguments replaced; None drops one
+  args = request.args.to_dict(flat=False)
+  for key, value in changes.items():
+      if value is None:
+          args.pop(key, None)
+      else:
+          args[key] = value
+  return url_for(request.endpoint, **dict(request.view_args or {}, **args))
+
 @app.route('/')
 def index():
   return render_template('pages/home.html')
@@ -233,58 +859,60 @@ def index():
 #  ----------------------------------------------------------------
 
 @app.route('/venues')
+@page_cache.cached(time_page_ttl)
+@replicas.read_only
 def venues():
-  result = Venue.query.distinct(Venue.city, Venue.state).all()
-  data = []
-  new_dict = {}
-  for item in result:
-      new_dict["city"]=item.city
-      new_dict["state"]=item.state
-      data.append(new_dict)
-      new_dict = {}
-
-  for l in data:
-      l["venues"]=[
-      v.exhaustive_format() for v in Venue.query.filter_by(city=l["city"], state=l["state"]).all()
-      ]
-      # TODO: num_upcoming_shows ->
-  # TODO: replace with real venues data.
-  #       num_shows should be aggregated based on number of upcoming shows per venue.
-
-  return render_template('pages/venues.html', areas=data);
+  filters = filter_args()
+  try:
+      data, page = venue_areas(filters, **page_args())
+  except ValueError:
+      abort(400)
+
+  return render_template('pages/venues.html', areas=data, page=page,
+                         filters=filters, facets=venue_facets.counts(filters));
 
 @app.route('/venues/search', methods=['POST'])
+@replicas.read_only
 def search_venues():
   search_term=request.form.get('search_term', '')
-  result = Venue.query.filter(Venue.name.like('%'+search_term+'%')).all()
-
-  new_data = []
-  new_dict = {}
-
-  for item in result:
-      new_dict["id"] = item.id
-      new_dict["name"] = item.name
-      new_dict["num_upcoming_shows"]=item.exhaustive_format()["upcoming_shows_count"]
-      new_data.append(new_dict)
-      new_dict = {}
+  response = venue_search.search(search_term, filter_args(request.form))
 
-  response = {
-    "count": len(result),
-    "data": new_data
-  }
-
-  return render_template('pages/search_venues.html', results=response, search_term=request.form.get('search_term', ''))
+  return render_template('pages/search_venues.html', results=response, search_term=search_term)
 
 @app.route('/venues/<int:venue_id>')
+@page_cache.cached(time_page_ttl)
+@replicas.read_only
 def show_venue(venue_id):
 
-  result = Venue.query.filter_by(id=venue_id).all()
-  data = result[0].exhaustive_format()
+  data = cached_venue(venue_id, detail=True)
+  if data is None:
+      abort(404)
   # shows the venue page with the given venue_id
   # TODO: replace with real venue data from the venues table, using venue_id
 
   return render_template('pages/show_venue.html', venue=data)
 
+@app.route('/venues/<int:venue_id>/calendar.ics')
+@replicas.read_only
+def venue_calendar_feed(venue_id):
+  venue = cached_venue(venue_id)
+  if venue is None:
+      abort(404)
+  return feed_response('venue', venue_id, venue['name'])
+
+@app.route('/venues/<int:venue_id>/calendar')
+@page_cache.cached(app.config['PAGE_CACHE_TTL'])
+@replicas.read_only
+def venue_calendar(venue_id):
+  # the venue's shows in ?month=YYYY-MM
+  venue = cached_venue(venue_id)
+  if venue is None:
+      abort(404)
+  first = month_arg()
+  weeks, previous, following = month_calendar('venue', venue_id, first)
+  return render_template('pages/calendar.html', kind='venue', entity=venue, month=first, weeks=weeks,
+                         previous=previous, following=following)
+
 #  Create Venue
 #  ----------------------------------------------------------------
 
@@ -298,110 +926,110 @@ def create_venue_submission():
   form = VenueForm(request.form)
 
   try:
-      venue = Venue(
-      name = form.name.data,
-      genres = form.genres.data,
-      city = form.city.data,
-      state = form.state.data,
-      address = form.address.data,
-      phone = form.phone.data,
-      image_link = form.image_link.data,
-      facebook_link = form.facebook_link.data,
-      )
-      db.session.add(venue)
-      db.session.commit()
-
-  # TODO: insert form data as a new Venue record in the db, instead
-  # TODO: modify data to be the data object returned from db insertion
+      with UnitOfWork(db.session) as unit:
+          unit.validate(form)
+          unit.add(Venue(
+          name = form.name.data,
+          genres = form.genres.data,
+          city = form.city.data,
+          state = form.state.data,
+          address = form.address.data,
+          phone = form.phone.data,
+          image_link = form.image_link.data,
+          facebook_link = form.facebook_link.data,
+          ))
+  except WriteError as e:
+      flash('Venue ' + (form.name.data or '') + ' could not be listed: ' + e.describe())
+      return render_template('forms/new_venue.html', form=form), 400
 
   # on successful db insert, flash success
-      flash('Venue ' + request.form['name'] + ' was successfully listed!')
-  except:
-      flash('Error occurred. Venue ' + form.name.data + ' could not be listed.')
-  # TODO: on unsuccessful db insert, flash an error instead.
-  # e.g., flash('An error occurred. Venue ' + data.name + ' could not be listed.')
-  # see: http://flask.pocoo.org/docs/1.0/patterns/flashing/
+  flash('Venue ' + form.name.data + ' was successfully listed!')
   return render_template('pages/home.html')
 
 @app.route('/venues/<venue_id>', methods=['DELETE'])
 def delete_venue(venue_id):
   try:
-      venue = Venue.get_by_id(venue_id)
-      db.session.delete(venue)
-      db.session.commit()
-      flash('The Venue has been successfully deleted!')
-      return render_template('pages/home.html')
-  except:
-      db.session.rollback()
-      flash('Delete was unsuccessful. Try again!')
-  finally:
-      db.session.close()
-  # TODO: Complete this endpoint for taking a venue_id, and using
-  # SQLAlchemy ORM to delete a record. Handle cases where the session commit could fail.
-
-  # BONUS CHALLENGE: Implement a button to delete a Venue on a Venue Page, have it so that
-  # clicking that button delete it from the db then redirect the user to the homepage
-  return None
+      with UnitOfWork(db.session) as unit:
+          venue = Venue.get_by_id(venue_id)
+          if venue is None:
+              abort(404)
+          venue_id = venue.id
+          artist_ids = linked_artist_ids(venue_id)
+          unit.delete(venue)
+          unit.after_commit(lambda: invalidate_venue(venue_id, artist_ids))
+  except WriteError as e:
+      flash('Delete was unsuccessful: ' + e.describe())
+      return render_template('pages/home.html'), 409
+
+  flash('The Venue has been successfully deleted!')
+  return render_template('pages/home.html')
 
 #  Artists
 #  ----------------------------------------------------------------
 @app.route('/artists')
+@page_cache.cached(app.config['PAGE_CACHE_TTL'])
+@replicas.read_only
 def artists():
-  # TODO: replace with real data returned from querying the database
-  result = Artist.query.all()
-  data = []
-  new_dict = {}
-
-  for item in result:
-      new_dict["id"] = item.id
-      new_dict["name"] = item.name
-      data.append(new_dict)
-      new_dict = {}
+  filters = filter_args()
+  try:
+      query = artist_facets.filter(db.session.query(*row_columns(ArtistRow, id=Artist.id, name=Artist.name)), filters)
+      page = paginate(query, (Artist.name, Artist.id), row_type=ArtistRow, **page_args())
+  except ValueError:
+      abort(400)
 
-  return render_template('pages/artists.html', artists=data)
+  return render_template('pages/artists.html', artists=page.items, page=page,
+                         filters=filters, facets=artist_facets.counts(filters))
 
 @app.route('/artists/search', methods=['POST'])
+@replicas.read_only
 def search_artists():
-
+  # case-insensitive partial match ranked by similarity,
+  # e.g. "band" returns "The Wild Sax Band"
   search_term=request.form.get('search_term', '')
-  result = Artist.query.filter(Artist.name.like('%'+search_term+'%')).all()
-
-  new_data = []
-  new_dict = {}
+  response = artist_search.search(search_term, filter_args(request.form))
 
-  for item in result:
-      new_dict["id"] = item.id
-      new_dict["name"] = item.name
-      new_data.append(new_dict)
-      new_dict["num_upcoming_shows"]=item.exhaustive_format()["upcoming_shows_count"]
-      new_dict = {}
-
-  response = {
-    "count": len(result),
-    "data": new_data
-  }
-
-  # TODO: implement search on artists with partial string search. Ensure it is case-insensitive.
-  # seach for "A" should return "Guns N Petals", "Matt Quevado", and "The Wild Sax Band".
-  # search for "band" should return "The Wild Sax Band".
-
-  return render_template('pages/search_artists.html', results=response, search_term=request.form.get('search_term', ''))
+  return render_template('pages/search_artists.html', results=response, search_term=search_term)
 
 @app.route('/artists/<int:artist_id>')
+@page_cache.cached(time_page_ttl)
+@replicas.read_only
 def show_artist(artist_id):
-  result = Artist.query.filter_by(id=artist_id).all()
-  data = result[0].exhaustive_format()
+  data = cached_artist(artist_id, detail=True)
+  if data is None:
+      abort(404)
   # shows the venue page with the given venue_id
   # TODO: replace with real venue data from the venues table, using venue_id
 
   return render_template('pages/show_artist.html', artist=data)
 
+@app.route('/artists/<int:artist_id>/calendar.ics')
+@replicas.read_only
+def artist_calendar_feed(artist_id):
+  artist = cached_artist(artist_id)
+  if artist is None:
+      abort(404)
+  return feed_response('artist', artist_id, artist['name'])
+
+@app.route('/artists/<int:artist_id>/calendar')
+@page_cache.cached(app.config['PAGE_CACHE_TTL'])
+@replicas.read_only
+def artist_calendar(artist_id):
+  artist = cached_artist(artist_id)
+  if artist is None:
+      abort(404)
+  first = month_arg()
+  weeks, previous, following = month_calendar('artist', artist_id, first)
+  return render_template('pages/calendar.html', kind='artist', entity=artist, month=first, weeks=weeks,
+                         previous=previous, following=following)
+
 #  Update
 #  ----------------------------------------------------------------
 @app.route('/artists/<int:artist_id>/edit', methods=['GET'])
 def edit_artist(artist_id):
   form = ArtistForm()
-  artist = Artist.get_by_id(artist_id)
+  artist = cached_artist(artist_id)
+  if artist is None:
+      abort(404)
 
   # TODO: populate form with fields from artist with ID <artist_id>
   return render_template('forms/edit_artist.html', form=form, artist=artist)
@@ -409,57 +1037,59 @@ def edit_artist(artist_id):
 @app.route('/artists/<int:artist_id>/edit', methods=['POST'])
 def edit_artist_submission(artist_id):
     form = ArtistForm(request.form)
-    artist = Artist.get_by_id(artist_id)
 
     try:
-        artist.name = form.name.data
-        artist.city = form.city.data
-        artist.state = form.state.data
-        artist.phone = form.phone.data
-        artist.facebook_link = form.facebook_link.data
-        artist.genres = form.genres.data
-        db.session.commit()
-        flash('Artist ' + request.form['name'] + ' was successfully edited!')
-    except:
-        db.session.rollback()
-        flash('Error occurred. Artist ' + form.name.data + ' could not be edited.')
-    finally:
-        db.session.close()
-  # TODO: take values from the form submitted, and update existing
-  # artist record with ID <artist_id> using the new attributes
-
+        with UnitOfWork(db.session) as unit:
+            artist = Artist.get_by_id(artist_id)
+            if artist is None:
+                abort(404)
+            unit.validate(form)
+            artist.name = form.name.data
+            artist.city = form.city.data
+            artist.state = form.state.data
+            artist.phone = form.phone.data
+            artist.facebook_link = form.facebook_link.data
+            artist.genres = form.genres.data
+            unit.after_commit(lambda: invalidate_artist(artist_id))
+    except WriteError as e:
+        flash('Artist ' + (form.name.data or '') + ' could not be edited: ' + e.describe())
+        return render_template('forms/edit_artist.html', form=form, artist=cached_artist(artist_id)), 400
+
+    flash('Artist ' + form.name.data + ' was successfully edited!')
     return redirect(url_for('show_artist', artist_id=artist_id))
 
 @app.route('/venues/<int:venue_id>/edit', methods=['GET'])
 def edit_venue(venue_id):
   form = VenueForm()
-  venue = Venue.get_by_id(venue_id)
+  venue = cached_venue(venue_id)
+  if venue is None:
+      abort(404)
 
   return render_template('forms/edit_venue.html', form=form, venue=venue)
 
 @app.route('/venues/<int:venue_id>/edit', methods=['POST'])
 def edit_venue_submission(venue_id):
-    form = VenueForm()
-    venue = Venue.get_by_id(venue_id)
+    form = VenueForm(request.form)
 
     try:
-        venue.name = form.name.data
-        venue.city = form.city.data
-        venue.state = form.state.data
-        venue.phone = form.phone.data
-        venue.facebook_link = form.facebook_link.data
-        venue.genres = form.genres.data
-        db.session.commit()
-        flash('Venue ' + request.form['name'] + ' was successfully edited!')
-    except:
-        db.session.rollback()
-        flash('Error occurred. Venue ' + form.name.data + ' could not be edited.')
-    finally:
-        db.session.close()
-
-
-  # TODO: take values from the form submitted, and update existing
-  # venue record with ID <venue_id> using the new attributes
+        with UnitOfWork(db.session) as unit:
+            venue = Venue.get_by_id(venue_id)
+            if venue is None:
+                abort(404)
+            unit.validate(form)
+            venue.name = form.name.data
+            venue.city = form.city.data
+            venue.state = form.state.data
+            venue.address = form.address.data
+            venue.phone = form.phone.data
+            venue.facebook_link = form.facebook_link.data
+            venue.genres = form.genres.data
+            unit.after_commit(lambda: invalidate_venue(venue_id))
+    except WriteError as e:
+        flash('Venue ' + (form.name.data or '') + ' could not be edited: ' + e.describe())
+        return render_template('forms/edit_venue.html', form=form, venue=cached_venue(venue_id)), 400
+
+    flash('Venue ' + form.name.data + ' was successfully edited!')
     return redirect(url_for('show_venue', venue_id=venue_id))
 
 #  Create Artist
@@ -475,27 +1105,24 @@ def create_artist_submission():
 
   form = ArtistForm(request.form)
 
-  try:
-      artist = Artist(
-      name = form.name.data,
-      city = form.city.data,
-      state = form.state.data,
-      phone = form.phone.data,
-      facebook_link = form.facebook_link.data,
-      genres = form.genres.data
-      )
-      db.session.add(artist)
-      db.session.commit()
   # called upon submitting the new artist listing form
-  # TODO: insert form data as a new Venue record in the db, instead
-  # TODO: modify data to be the data object returned from db insertion
+  try:
+      with UnitOfWork(db.session) as unit:
+          unit.validate(form)
+          unit.add(Artist(
+          name = form.name.data,
+          city = form.city.data,
+          state = form.state.data,
+          phone = form.phone.data,
+          facebook_link = form.facebook_link.data,
+          genres = form.genres.data
+          ))
+  except WriteError as e:
+      flash('Artist ' + (form.name.data or '') + ' could not be listed: ' + e.describe())
+      return render_template('forms/new_artist.html', form=form), 400
 
   # on successful db insert, flash success
-      flash('Artist ' + request.form['name'] + ' was successfully listed!')
-  # TODO: on unsuccessful db insert, flash an error instead.
-  # e.g., flash('An error occurred. Artist ' + data.name + ' could not be listed.')
-  except:
-      flash('Error occurred. Venue ' + form.name.data + ' could not be listed.')
+  flash('Artist ' + form.name.data + ' was successfully listed!')
   return render_template('pages/home.html')
 
 
@@ -503,28 +1130,16 @@ def create_artist_submission():
 #  ----------------------------------------------------------------
 
 @app.route('/shows')
+@page_cache.cached(time_page_ttl)
+@replicas.read_only
 def shows():
-
-  result = Show.query.all()
-  data = []
-  new_dict = {}
-
-  for item in result:
-      new_dict["venue_id"] = item.venue_id
-      new_dict["venue_name"] = Venue.get_by_id(item.venue_id).name
-      new_dict["artist_id"] = item.artist_id
-      new_dict["artist_name"] = Artist.get_by_id(item.artist_id).name
-      new_dict["artist_image_link"] = Artist.get_by_id(item.artist_id).image_link
-      new_dict["start_time"] = item.start_time.strftime("%m/%d/%Y, %H:%M")
-      new_dict["num_upcoming_shows"]=Venue.get_by_id(item.venue_id).exhaustive_format()["upcoming_shows_count"]
-
-      data.append(new_dict)
-      new_dict = {}
   # displays list of shows at /shows
-  # TODO: replace with real venues data.
-  #       num_shows should be aggregated based on number of upcoming shows per venue.
+  try:
+      page = paginate(show_listing_query(), (Show.start_time, Show.id), row_type=ShowRow, **page_args())
+  except ValueError:
+      abort(400)
 
-  return render_template('pages/shows.html', shows=data)
+  return render_template('pages/shows.html', shows=page.items, page=page)
 
 @app.route('/shows/create')
 def create_shows():
@@ -535,27 +1150,192 @@ def create_shows():
 
 @app.route('/shows/create', methods=['POST'])
 def create_show_submission():
-  form = ShowForm()
+  form = ShowForm(request.form)
   # called to create new shows in the db, upon submitting new show listing form
-  # TODO: insert form data as a new Show record in the db, instead
+  try:
+      with UnitOfWork(db.session) as unit:
+          unit.validate(form)
+          # unknown ids are reported per field instead of failing the insert
+          venue_id = unit.require(Venue, form.venue_id.data, 'venue_id')
+          artist_id = unit.require(Artist, form.artist_id.data, 'artist_id')
+          start_time = form.start_time.data
+          end_time = show_end_time(start_time, form.duration.data, form.end_time.data)
+          conflicts = show_conflicts(venue_id, artist_id, start_time, end_time)
+          if conflicts:
+              raise WriteError('it overlaps another booking', {'start_time': [describe(conflict) for conflict in conflicts]})
+          unit.add(Show(
+          artist_id = artist_id,
+          venue_id = venue_id,
+          start_time=start_time,
+          end_time=end_time
+          ))
+          unit.after_commit(lambda: invalidate_venue(venue_id, [artist_id]))
+  except WriteError as e:
+      flash('Show could not be listed: ' + e.describe())
+      return render_template('forms/new_show.html', form=form), 400
 
   # on successful db insert, flash success
-  try:
-      show = Show(
-      artist_id = form.artist_id.data,
-      venue_id = form.venue_id.data,
-      start_time=form.start_time.data
-      )
-      db.session.add(show)
-      db.session.commit()
-      flash('Show was successfully listed!')
-  except:
-      flash('Show could not be listed. Please try again')
-  # TODO: on unsuccessful db insert, flash an error instead.
-  # e.g., flash('An error occurred. Show could not be listed.')
-  # see: http://flask.pocoo.org/docs/1.0/patterns/flashing/
+  flash('Show was successfully listed!')
   return render_template('pages/home.html')
 
+@app.route('/cache/stats')
+def cache_stats():
+  return jsonify(dict(entity_cache.stats(), pages=page_cache.stats(), feeds=feed_cache.stats()))
+
+#  JSON API
+#  ----------------------------------------------------------------
+#  Detail and search responses carry an ETag and answer If-None-Match
+#  with 304. Full listings are streamed as a JSON array, or as NDJSON for
+#  ?format=ndjson / Accept: application/x-ndjson, reading the table in
+#  batches so memory stays flat however large the catalogue is.
+
+api = Blueprint('api', __name__, url_prefix='/api/v1')
+
+def wants_ndjson():
+  if request.args.get('format') == 'ndjson':
+      return True
+  return request.accept_mimetypes.best_match(['application/json', 'application/x-ndjson']) == 'application/x-ndjson'
+
+def stream_items(items, ndjson, batch_size=500):
+  # serialize items as NDJSON lines or as one JSON array, yielding in batches
+  chunk = []
+  if not ndjson:
+      chunk.append('[')
+  first = True
+  for item in items:
+      if ndjson:
+          chunk.append(json.dumps(item, default=str) + '\n')
+      else:
+          chunk.append(('' if first else ',') + json.dumps(item, default=str))
+      first = False
+      if len(chunk) >= batch_size:
+          yield ''.join(chunk)
+          chunk = []
+  if not ndjson:
+      chunk.append(']')
+  if chunk:
+      yield ''.join(chunk)
+
+def stream_response(items):
+  ndjson = wants_ndjson()
+  mimetype = 'application/x-ndjson' if ndjson else 'application/json'
+  return Response(stream_with_context(stream_items(items, ndjson)), mimetype=mimetype)
+
+# the keys of Venue.format() and Artist.format(), which are all plain columns
+VENUE_FORMAT_KEYS = ('id', 'name', 'genres', 'address', 'city', 'state', 'phone', 'website',
+                     'facebook_link', 'seeking_talent', 'seeking_description', 'image_link')
+ARTIST_FORMAT_KEYS = ('id', 'name', 'city', 'state', 'phone', 'genres', 'image_link',
+                      'facebook_link', 'website_link', 'seeking_venue', 'seeking_description')
+
+def format_rows(model, keys, facets):
+  # format() payloads of every row matching the request's filters, built
+  # from column rows rather than instances
+  query = facets.filter(db.session.query(*[getattr(model, key) for key in keys]), filter_args())
+  return (dict(zip(keys, row)) for row in query.order_by(model.id).yield_per(1000))
+
+def conditional_json(data):
+  response = jsonify(data)
+  response.add_etag()
+  return response.make_conditional(request)
+
+@api.route('/venues')
+@replicas.read_only
+def api_venues():
+  return stream_response(format_rows(Venue, VENUE_FORMAT_KEYS, venue_facets))
+
+@api.route('/venues/<int:venue_id>')
+@replicas.read_only
+def api_venue(venue_id):
+  data = cached_venue(venue_id, detail=True)
+  if data is None:
+      abort(404)
+  return conditional_json(data)
+
+@api.route('/venues/search')
+@replicas.read_only
+def api_search_venues():
+  return conditional_json(venue_search.search(request.args.get('search_term', ''), filter_args()))
+
+@api.route('/venues/facets')
+@replicas.read_only
+def api_venue_facets():
+  # venues per genre and per city/state, within ?genre=&city=&state=
+  return conditional_json(venue_facets.counts(filter_args()))
+
+@api.route('/artists')
+@replicas.read_only
+def api_artists():
+  return stream_response(format_rows(Artist, ARTIST_FORMAT_KEYS, artist_facets))
+
+@api.route('/artists/<int:artist_id>')
+@replicas.read_only
+def api_artist(artist_id):
+  data = cached_artist(artist_id, detail=True)
+  if data is None:
+      abort(404)
+  return conditional_json(data)
+
+@api.route('/artists/search')
+@replicas.read_only
+def api_search_artists():
+  return conditional_json(artist_search.search(request.args.get('search_term', ''), filter_args()))
+
+@api.route('/artists/facets')
+@replicas.read_only
+def api_artist_facets():
+  return conditional_json(artist_facets.counts(filter_args()))
+
+@api.route('/artists/<int:artist_id>/matches')
+@replicas.read_only
+def api_artist_matches(artist_id):
+  # venues seeking talent in the artist's state, sharing a genre with it and
+  # free from ?start= to ?end=, most genres in common first
+  artist = cached_artist(artist_id)
+  if artist is None:
+      abort(404)
+  start_time, end_time = window_args()
+  return conditional_json({
+      'artist_id': artist_id, 'start_time': start_time.isoformat(), 'end_time': end_time.isoformat(),
+      'venues': venue_matching.find(artist['genres'], artist['state'], start_time, end_time, page_args()['limit'])
+  })
+
+@api.route('/venues/<int:venue_id>/matches')
+@replicas.read_only
+def api_venue_matches(venue_id):
+  # artists seeking a venue, the other way round
+  venue = cached_venue(venue_id)
+  if venue is None:
+      abort(404)
+  start_time, end_time = window_args()
+  return conditional_json({
+      'venue_id': venue_id, 'start_time': start_time.isoformat(), 'end_time': end_time.isoformat(),
+      'artists': artist_matching.find(venue['genres'], venue['state'], start_time, end_time, page_args()['limit'])
+  })
+
+@api.route('/shows')
+@replicas.read_only
+def api_shows():
+  rows = fetch_rows(show_listing_query().order_by(Show.start_time, Show.id), ShowRow, batch_size=1000)
+  return stream_response({
+      'id': row.id,
+      'venue_id': row.venue_id,
+      'venue_name': row.venue_name,
+      'artist_id': row.artist_id,
+      'artist_name': row.artist_name,
+      'artist_image_link': row.artist_image_link,
+      'start_time': row.start_time.isoformat() if row.start_time else None
+  } for row in rows)
+
+@api.errorhandler(400)
+def api_bad_request_error(error):
+  return jsonify({'error': 400, 'message': 'bad request'}), 400
+
+@api.errorhandler(404)
+def api_not_found_error(error):
+  return jsonify({'error': 404, 'message': 'resource not found'}), 404
+
+app.register_blueprint(api)
+
 @app.errorhandler(404)
 def not_found_error(error):
     return render_template('errors/404.html'), 404
@@ -575,6 +1355,356 @@ if not app.debug:
     app.logger.addHandler(file_handler)
     app.logger.info('errors')
 
+#----------------------------------------------------------------------------#
+# Commands.
+#----------------------------------------------------------------------------#
+
+class explain(Executable, ClauseElement):
+    inherit_cache = False
+
+    def __init__(self, statement):
+        self.statement = statement
+
+@compiles(explain)
+def compile_explain(element, compiler, **kw):
+    if compiler.dialect.name == 'sqlite':
+        return 'EXPLAIN QUERY PLAN ' + compiler.process(element.statement, **kw)
+    return 'EXPLAIN ' + compiler.process(element.statement, **kw)
+
+def index_checks(now=None):
+    # (description, query, index the planner is expected to pick)
+    if now is None:
+        now = clock.naive()
+    return [
+        # the queries the detail pages and the show listing run
+        ('venue_show_rows', venue_show_query(1), 'ix_Show_venue_id_start_time'),
+        ('artist_show_rows', artist_show_query(1), 'ix_Show_artist_id_start_time'),
+        ('shows listing', show_listing_query().filter(Show.start_time.isnot(None), Show.id.isnot(None)).order_by(
+            Show.start_time, Show.id).limit(app.config['PAGE_SIZE'] + 1), 'ix_Show_start_time'),
+        ('venue booking conflicts', Show.query.filter(*overlap_clauses(
+            Show.venue_id, 1, Show.start_time, Show.end_time, now, now + MAX_DURATION)), 'ix_Show_venue_id_start_time'),
+        ('artist booking conflicts', Show.query.filter(*overlap_clauses(
+            Show.artist_id, 1, Show.start_time, Show.end_time, now, now + MAX_DURATION)), 'ix_Show_artist_id_start_time'),
+        ('venues by area', Venue.query.filter_by(city='New York', state='NY'), 'ix_Venue_city_state'),
+        ('venue matching', venue_matching.query(['Jazz'], 'NY', now, now + DEFAULT_DURATION), 'ix_Venue_state_seeking_talent'),
+        ('artist matching', artist_matching.query(['Jazz'], 'NY', now, now + DEFAULT_DURATION), 'ix_Artist_state_seeking_venue'),
+    ]
+
+@app.cli.command('explain-indexes')
+def explain_indexes():
+  # Runs EXPLAIN for the show/venue lookups and checks that each one is
+  # planned through its index. Sequential scans are disabled for the check on
+  # postgres so that small development tables do not hide a missing index.
+  failed = False
+  with db.engine.connect() as connection, connection.begin():
+      if connection.dialect.name == 'postgresql':
+          connection.execute(db.text('SET LOCAL enable_seqscan = off'))
+      for name, query, index in index_checks():
+          # read the raw cursor: the plan rows do not match the select's column types
+          result = connection.execute(explain(query.statement))
+          plan = '\n'.join(str(row[-1]) for row in result.cursor.fetchall())
+          used = index in plan
+          failed = failed or not used
+          print('%-24s %-32s %s' % (name, index, 'ok' if used else 'NOT USED'))
+          if not used:
+              print(plan)
+  if failed:
+      raise SystemExit(1)
+
+@app.cli.command('build-assets')
+def build_assets():
+  # bundles, minifies, fingerprints and precompresses static/css and static/js
+  for name, filename, size, minified, gzipped, brotli in assets.build():
+      print('%-9s -> dist/%-26s %7d -> %7d bytes, gzip %6d, brotli %s' % (
+          name, filename, size, minified, gzipped, brotli if brotli is not None else 'n/a'))
+
+@app.cli.command('replica-status')
+def replica_status():
+  # checks every replica now and prints its lag
+  if not replicas.engines:
+      print('no replicas configured (REPLICA_DATABASE_URLS)')
+  for engine in replicas.engines:
+      replicas.usable(engine, force=True)
+  for url, usable, lag in replicas.status():
+      print('%-60s %-8s %s' % (url, 'ok' if usable else 'UNUSABLE', 'unreachable' if lag is None else 'lag %.1fs' % lag))
+
+@app.cli.command('refresh-genre-index')
+def refresh_genre_index_command():
+  # rebuilds VenueGenre/ArtistGenre from the genres columns, e.g. after
+  # writing genres with plain SQL
+  for facets in (venue_facets, artist_facets):
+      facets.rebuild()
+      print('%s: %d genre rows' % (facets.index.__tablename__, facets.index.query.count()))
+
+@app.cli.command('check-schedule')
+def check_schedule_command():
+  # lists every pair of overlapping shows of a venue or an artist, e.g.
+  # shows booked before end times were checked; exits 1 if there are any
+  found = 0
+  for kind, column in (('venue', Show.venue_id), ('artist', Show.artist_id)):
+      rows = db.session.query(column, Show.start_time, Show.end_time, Show.id).order_by(
+          column, Show.start_time).yield_per(1000)
+      for conflict in sweep_conflicts(kind, rows):
+          found += 1
+          print('show %d (%s to %s): %s' % (conflict.ref[1], conflict.start_time.strftime('%Y-%m-%d %H:%M'),
+                                          conflict.end_time.strftime('%Y-%m-%d %H:%M'), describe(conflict)))
+  print('%d conflicts' % found)
+  if found:
+      raise SystemExit(1)
+
+@app.cli.command('refresh-show-counts')
+@click.option('--full', is_flag=True, help='Rebuild all counters instead of moving the shows that started since the last run.')
+def refresh_show_counts_command(full):
+  # meant to run from cron, e.g. every minute:
+  #   * * * * * FLASK_APP=app.py flask refresh-show-counts
+  moved = refresh_show_counts(full=full)
+  print('rebuilt show counts' if full else 'moved %d shows from upcoming to past' % moved)
+
+#  Bulk import/export
+#  ----------------------------------------------------------------
+#  Rows are validated by the same forms as the create pages and inserted
+#  with one executemany INSERT per chunk, each chunk in its own transaction.
+#  Shows name their venue by venue_name (+ venue_city) or venue_id and their
+#  artist by artist_name (+ artist_city) or artist_id. Core inserts skip the mapper events, so the
+#  show counters are rebuilt and caches reset once the import is done.
+#  Shows that overlap an existing booking or an earlier row are rejected.
+
+BULK_MODELS = {'venues': Venue, 'artists': Artist, 'shows': Show}
+BULK_FORMS = {'venues': VenueForm, 'artists': ArtistForm, 'shows': ShowForm}
+
+# model columns the forms do not cover
+BULK_EXTRAS = {
+    'venues': {'website': bulk.text_value, 'seeking_talent': bulk.bool_value, 'seeking_description': bulk.text_value},
+    'artists': {'website_link': bulk.text_value, 'seeking_venue': bulk.bool_value, 'seeking_description': bulk.text_value},
+    'shows': {},
+}
+
+BULK_EXPORT_COLUMNS = {
+    'venues': ['id', 'name', 'genres', 'city', 'state', 'address', 'phone', 'image_link',
+               'facebook_link', 'website', 'seeking_talent', 'seeking_description'],
+    'artists': ['id', 'name', 'genres', 'city', 'state', 'phone', 'image_link',
+                'facebook_link', 'website_link', 'seeking_venue', 'seeking_description'],
+    'shows': ['id', 'start_time', 'end_time', 'venue_id', 'venue_name', 'venue_city', 'artist_id', 'artist_name', 'artist_city'],
+}
+
+def reference_key(row, prefix):
+    # ('id', id) when the row gives one, else ('name', name, city or None);
+    # an explicit id is never second-guessed by a name that may be shared
+    id = bulk.text_value(row.get(prefix + '_id'))
+    if id is not None:
+        try:
+            return ('id', int(id))
+        except ValueError:
+            raise ValueError('%s_id must be a number' % prefix)
+    name = bulk.text_value(row.get(prefix + '_name'))
+    if name is None:
+        raise ValueError('%s_id or %s_name is required' % (prefix, prefix))
+    return ('name', name, bulk.text_value(row.get(prefix + '_city')))
+
+def resolve_references(model, keys, known):
+    # maps each key to an id or an error message, one query per chunk;
+    # known carries the keys resolved by earlier chunks
+    keys = [key for key in keys if key not in known]
+    ids = [key[1] for key in keys if key[0] == 'id']
+    names = set(key[1] for key in keys if key[0] == 'name')
+    found = set()
+    by_name = {}
+    if ids or names:
+        for id, name, city in db.session.query(model.id, model.name, model.city).filter(
+            or_(model.id.in_(ids), model.name.in_(names))
+        ):
+            found.add(id)
+            by_name.setdefault(name, []).append((id, city))
+    label = model.__tablename__.lower()
+    for key in keys:
+        if key[0] == 'id':
+            known[key] = key[1] if key[1] in found else 'no %s with id %d' % (label, key[1])
+            continue
+        matches = [id for id, city in by_name.get(key[1], []) if key[2] is None or city == key[2]]
+        if len(matches) == 1:
+            known[key] = matches[0]
+        elif matches:
+            known[key] = '%d %ss match %r, add the city or the id' % (len(matches), label, key[1])
+        else:
+            known[key] = 'no %s named %r' % (label, key[1])
+    return known
+
+def import_record(kind, row, known):
+    # (record, None) or (None, errors)
+    if '__error__' in row:
+        return None, {'row': [row['__error__']]}
+    values = dict(row)
+    values['genres'] = bulk.list_value(row.get('genres'))
+    if kind == 'shows':
+        errors = {}
+        for prefix in ('venue', 'artist'):
+            try:
+                resolved = known[prefix][reference_key(row, prefix)]
+            except ValueError as e:
+                resolved = str(e)
+            if isinstance(resolved, str):
+                errors[prefix + '_id'] = [resolved]
+            else:
+                values[prefix + '_id'] = str(resolved)
+        # the form would fall back to its default of today
+        if bulk.text_value(row.get('start_time')) is None:
+            errors['start_time'] = ['This field is required.']
+        else:
+            values['start_time'] = bulk.datetime_value(row['start_time'])
+        # end_time, else duration minutes, else the default duration
+        if bulk.text_value(row.get('end_time')) is not None:
+            values['end_time'] = bulk.datetime_value(row['end_time'])
+        if errors:
+            return None, errors
+    data, errors = bulk.validate(BULK_FORMS[kind], values)
+    if errors:
+        return None, errors
+    if kind == 'shows':
+        return {'venue_id': int(data['venue_id']), 'artist_id': int(data['artist_id']), 'start_time': data['start_time'],
+                'end_time': show_end_time(data['start_time'], data['duration'], data['end_time'])}, None
+    record = dict(data)
+    for name, parse in BULK_EXTRAS[kind].items():
+        record[name] = parse(row.get(name))
+    return record, None
+
+def insert_records(model, records, reject):
+    # one executemany per chunk; if the database refuses it, retry row by row
+    # so only the offending rows are rejected. Returns the rows inserted.
+    insert = model.__table__.insert()
+    try:
+        db.session.execute(insert, [record for line, row, record in records])
+        db.session.commit()
+        return [record for line, row, record in records]
+    except exc.DBAPIError:
+        db.session.rollback()
+    inserted = []
+    for line, row, record in records:
+        try:
+            db.session.execute(insert, [record])
+            db.session.commit()
+            inserted.append(record)
+        except exc.DBAPIError as e:
+            db.session.rollback()
+            reject(line, row, {'database': [str(e.orig).strip()]})
+    return inserted
+
+def book_records(index, records, before_id, loaded, reject):
+    # drops the show records that overlap an existing show or an earlier
+    # row of the import, and books the others in index
+    load_bookings(index, [record for line, row, record in records], before_id, loaded)
+    booked = []
+    for line, row, record in records:
+        conflicts = index.book(record['venue_id'], record['artist_id'], record['start_time'], record['end_time'], ('line', line))
+        if conflicts:
+            reject(line, row, {'start_time': [describe(conflict) for conflict in conflicts]})
+        else:
+            booked.append((line, row, record))
+    return booked
+
+def import_rows(kind, rows, reject, chunk_size=1000, dry_run=False):
+    # rows: (line, dict) pairs; returns the number of rows inserted, or that
+    # would be inserted with dry_run
+    model = BULK_MODELS[kind]
+    known = {'venue': {}, 'artist': {}}
+    touched = {'venue': set(), 'artist': set()}
+    imported = 0
+    if kind == 'shows':
+        schedule = ScheduleIndex()
+        loaded = set()
+        before_id = db.session.query(db.func.max(Show.id)).scalar() or 0
+    for chunk in bulk.chunked(rows, chunk_size):
+        if kind == 'shows':
+            for prefix, related in (('venue', Venue), ('artist', Artist)):
+                keys = set()
+                for line, row in chunk:
+                    try:
+                        keys.add(reference_key(row, prefix))
+                    except ValueError:
+                        pass
+                resolve_references(related, keys, known[prefix])
+        records = []
+        for line, row in chunk:
+            record, errors = import_record(kind, row, known)
+            if errors:
+                reject(line, row, errors)
+            else:
+                records.append((line, row, record))
+        if records and kind == 'shows':
+            records = book_records(schedule, records, before_id, loaded, reject)
+        if records and dry_run:
+            imported += len(records)
+        elif records:
+            inserted = insert_records(model, records, reject)
+            imported += len(inserted)
+            if kind == 'shows' and len(inserted) < len(records):
+                # refused by the database: free their slots for later rows
+                kept = set(map(id, inserted))
+                for line, row, record in records:
+                    if id(record) not in kept:
+                        schedule.unbook(record['venue_id'], record['artist_id'], record['start_time'],
+                                        record['end_time'], ('line', line))
+            if kind == 'shows':
+                touched['venue'].update(record['venue_id'] for record in inserted)
+                touched['artist'].update(record['artist_id'] for record in inserted)
+
+    if dry_run:
+        return imported
+    if imported:
+        page_cache.bump()
+    if imported and kind == 'shows':
+        refresh_show_counts(full=True)
+        entity_cache.invalidate('venue', touched['venue'])
+        entity_cache.invalidate('artist', touched['artist'])
+        feed_cache.touch('venue', touched['venue'])
+        feed_cache.touch('artist', touched['artist'])
+    elif imported:
+        (venue_search if kind == 'venues' else artist_search).invalidate()
+        # the executemany inserts bypassed the genre index events
+        (venue_facets if kind == 'venues' else artist_facets).rebuild()
+    return imported
+
+def export_query(kind):
+    if kind == 'shows':
+        return db.session.query(
+            Show.id, Show.start_time, Show.end_time, Show.venue_id, Venue.name, Venue.city, Show.artist_id, Artist.name, Artist.city
+        ).join(Venue, Show.venue_id == Venue.id).join(Artist, Show.artist_id == Artist.id).order_by(Show.id)
+    model = BULK_MODELS[kind]
+    return db.session.query(*[getattr(model, column) for column in BULK_EXPORT_COLUMNS[kind]]).order_by(model.id)
+
+@app.cli.command('import-catalogue')
+@click.argument('kind', type=click.Choice(sorted(BULK_MODELS)))
+@click.argument('source', type=click.File('r'))
+@click.option('--format', 'format', type=click.Choice(['csv', 'ndjson']), help='Defaults to ndjson for .ndjson/.jsonl files, csv otherwise.')
+@click.option('--chunk-size', default=1000, show_default=True, help='Rows per INSERT and transaction.')
+@click.option('--rejects', type=click.File('w'), help='Write rejected rows and their errors here as NDJSON.')
+@click.option('--dry-run', is_flag=True, help='Validate the rows, including show booking conflicts, without inserting them.')
+def import_catalogue_command(kind, source, format, chunk_size, rejects, dry_run):
+  # e.g. flask import-catalogue venues venues.csv
+  #      flask import-catalogue shows shows.ndjson --rejects rejected.ndjson
+  #      flask import-catalogue shows schedule.csv --dry-run
+  rejected = [0]
+  def reject(line, row, errors):
+      rejected[0] += 1
+      if rejects:
+          rejects.write(json.dumps({'line': line, 'row': row, 'errors': errors}) + '\n')
+      else:
+          click.echo('line %d: %s' % (line, json.dumps(errors)), err=True)
+  rows = bulk.read_rows(source, format or bulk.guess_format(source.name))
+  imported = import_rows(kind, rows, reject, chunk_size, dry_run)
+  click.echo('%s %d %s, rejected %d' % ('would import' if dry_run else 'imported', imported, kind, rejected[0]))
+  if rejected[0]:
+      raise SystemExit(1)
+
+@app.cli.command('export-catalogue')
+@click.argument('kind', type=click.Choice(sorted(BULK_MODELS)))
+@click.argument('destination', type=click.File('w'), default='-')
+@click.option('--format', 'format', type=click.Choice(['csv', 'ndjson']), help='Defaults to ndjson for .ndjson/.jsonl files, csv otherwise.')
+def export_catalogue_command(kind, destination, format):
+  # streams the table in batches, e.g. flask export-catalogue shows shows.csv
+  rows = export_query(kind).yield_per(1000)
+  count = bulk.write_rows(destination, format or bulk.guess_format(destination.name), BULK_EXPORT_COLUMNS[kind], rows)
+  click.echo('exported %d %s' % (count, kind), err=True)
+
 #----------------------------------------------------------------------------#
 # Launch.
 #----------------------------------------------------------------------------#
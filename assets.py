@@ -0,0 +1,168 @@
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import re
+from flask import request, send_from_directory, url_for
+
+#----------------------------------------------------------------------------#
+# Static asset bundles.
+#
+# `flask build-assets` concatenates and minifies each bundle into
+# static/dist/<name>.<content hash>.<ext>, with .gz (and .br when the brotli
+# package is installed) variants next to it, and records the names in
+# static/dist/manifest.json. Templates ask for asset_urls('site.css'): the
+# fingerprinted file once built, the source files before that. Fingerprinted
+# files never change, so they are served with a one year immutable
+# Cache-Control, precompressed when the client accepts it.
+#----------------------------------------------------------------------------#
+
+# bundle -> source files under static/, in load order
+BUNDLES = {
+    'site.css': [
+        'css/bootstrap.min.css',
+        'css/layout.main.css',
+        'css/main.css',
+        'css/main.responsive.css',
+        'css/main.quickfix.css',
+    ],
+    # deferred, after jQuery
+    'site.js': [
+        'js/script.js',
+        'js/libs/bootstrap-3.1.1.min.js',
+        'js/plugins.js',
+    ],
+}
+
+MANIFEST = 'manifest.json'
+IMMUTABLE = 'public, max-age=31536000, immutable'
+
+CSS_TOKENS = re.compile(r'(/\*.*?\*/)|("(?:\\.|[^"\\])*"|\'(?:\\.|[^\'\\])*\')', re.S)
+
+def minify_css(text):
+    # drops comments (but keeps /*! license */ ones) and whitespace that
+    # carries no meaning; quoted strings are left alone
+    def squeeze(chunk):
+        chunk = re.sub(r'\s+', ' ', chunk)
+        chunk = re.sub(r'\s*([{};,])\s*', r'\1', chunk)
+        return re.sub(r':\s+', ':', chunk)
+    parts = []
+    position = 0
+    for match in CSS_TOKENS.finditer(text):
+        parts.append(squeeze(text[position:match.start()]))
+        comment, string = match.groups()
+        if string is not None:
+            parts.append(string)
+        elif comment.startswith('/*!'):
+            parts.append(comment + '\n')
+        position = match.end()
+    parts.append(squeeze(text[position:]))
+    return ''.join(parts).replace(';}', '}').strip()
+
+def minify_js(text, name):
+    # rjsmin when installed; otherwise only whitespace at line ends and
+    # blank lines go, which cannot change what the script does
+    if name.endswith('.min.js'):
+        return text.strip()
+    try:
+        import rjsmin
+        return rjsmin.jsmin(text)
+    except ImportError:
+        lines = [line.rstrip() for line in text.splitlines()]
+        return '\n'.join(line for line in lines if line)
+
+def compress_brotli(data):
+    try:
+        import brotli
+    except ImportError:
+        return None
+    return brotli.compress(data, quality=11)
+
+def bundle(static_folder, name, sources):
+    contents = []
+    for source in sources:
+        with open(os.path.join(static_folder, source), encoding='utf-8') as f:
+            text = f.read()
+        contents.append(minify_css(text) if name.endswith('.css') else minify_js(text, source))
+    # ";" guards against a script that relies on automatic semicolon insertion
+    return ('\n' if name.endswith('.css') else ';\n').join(contents) + '\n'
+
+
+class Assets(object):
+
+    def __init__(self, app=None, bundles=BUNDLES):
+        self.bundles = bundles
+        self.manifest = {}
+        self.manifest_mtime = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.folder = os.path.join(app.static_folder, 'dist')
+        self.load()
+        app.add_url_rule(app.static_url_path + '/dist/<path:filename>', 'dist', self.serve)
+        app.jinja_env.globals['asset_urls'] = self.urls
+
+    def manifest_path(self):
+        return os.path.join(self.folder, MANIFEST)
+
+    def load(self):
+        try:
+            mtime = os.path.getmtime(self.manifest_path())
+        except OSError:
+            self.manifest, self.manifest_mtime = {}, None
+            return
+        if mtime != self.manifest_mtime:
+            with open(self.manifest_path()) as f:
+                self.manifest = json.load(f)
+            self.manifest_mtime = mtime
+
+    def urls(self, name):
+        if self.app.debug:
+            # pick up a build made while the development server runs
+            self.load()
+        filename = self.manifest.get(name)
+        if filename:
+            return [url_for('dist', filename=filename)]
+        return [url_for('static', filename=source) for source in self.bundles[name]]
+
+    def serve(self, filename):
+        mimetype = mimetypes.guess_type(filename)[0]
+        encoding = None
+        for candidate, suffix in (('br', '.br'), ('gzip', '.gz')):
+            if candidate in request.accept_encodings and os.path.isfile(os.path.join(self.folder, filename + suffix)):
+                encoding = candidate
+                filename += suffix
+                break
+        response = send_from_directory(self.folder, filename, mimetype=mimetype)
+        if encoding:
+            response.headers['Content-Encoding'] = encoding
+        response.headers['Cache-Control'] = IMMUTABLE
+        response.vary.add('Accept-Encoding')
+        return response
+
+    def build(self):
+        # returns [(bundle, file, source bytes, minified bytes, gzip bytes, brotli bytes or None)]
+        os.makedirs(self.folder, exist_ok=True)
+        manifest = {}
+        report = []
+        for name, sources in sorted(self.bundles.items()):
+            data = bundle(self.app.static_folder, name, sources).encode('utf-8')
+            base, ext = os.path.splitext(name)
+            filename = '%s.%s%s' % (base, hashlib.sha256(data).hexdigest()[:12], ext)
+            # mtime=0 keeps the .gz byte-identical between builds
+            gzipped = gzip.compress(data, compresslevel=9, mtime=0)
+            brotli = compress_brotli(data)
+            for suffix, content in (('', data), ('.gz', gzipped), ('.br', brotli)):
+                if content is not None:
+                    with open(os.path.join(self.folder, filename + suffix), 'wb') as f:
+                        f.write(content)
+            manifest[name] = filename
+            size = sum(os.path.getsize(os.path.join(self.app.static_folder, source)) for source in sources)
+            report.append((name, filename, size, len(data), len(gzipped), len(brotli) if brotli else None))
+        with open(self.manifest_path(), 'w') as f:
+            json.dump(manifest, f, indent=2, sort_keys=True)
+        self.load()
+        return report
@@ -0,0 +1,153 @@
+# Seeded synthetic catalogue: venues, artists and shows with skewed but
+# plausible distributions. States, cities and genres come from the choices
+# in forms.py, weighted so that a few big markets, popular genres and busy
+# venues/artists dominate, as they do in real listings.
+
+import datetime
+import random
+
+from forms import VenueForm, ArtistForm
+from schedule import DEFAULT_DURATION, ScheduleIndex
+
+STATES = [value for value, label in VenueForm.state.kwargs['choices']]
+GENRES = [value for value, label in VenueForm.genres.kwargs['choices']]
+
+# largest cities first; states not listed get a single generic city
+CITIES = {
+    'CA': ['Los Angeles', 'San Francisco', 'San Diego', 'Oakland', 'Sacramento'],
+    'NY': ['New York', 'Brooklyn', 'Buffalo', 'Rochester'],
+    'TX': ['Austin', 'Houston', 'Dallas', 'San Antonio'],
+    'FL': ['Miami', 'Orlando', 'Tampa', 'Jacksonville'],
+    'IL': ['Chicago', 'Springfield'],
+    'PA': ['Philadelphia', 'Pittsburgh'],
+    'OH': ['Columbus', 'Cleveland', 'Cincinnati'],
+    'GA': ['Atlanta', 'Savannah'],
+    'NC': ['Charlotte', 'Raleigh', 'Asheville'],
+    'MI': ['Detroit', 'Grand Rapids'],
+    'NJ': ['Newark', 'Jersey City', 'Asbury Park'],
+    'VA': ['Richmond', 'Virginia Beach'],
+    'WA': ['Seattle', 'Spokane', 'Tacoma'],
+    'MA': ['Boston', 'Cambridge'],
+    'TN': ['Nashville', 'Memphis'],
+    'CO': ['Denver', 'Boulder'],
+    'LA': ['New Orleans', 'Baton Rouge'],
+    'OR': ['Portland', 'Eugene'],
+    'MN': ['Minneapolis', 'Saint Paul'],
+    'DC': ['Washington'],
+}
+
+# rough relative population weights for the larger states
+STATE_WEIGHTS = {
+    'CA': 39, 'TX': 29, 'FL': 21, 'NY': 20, 'PA': 13, 'IL': 13, 'OH': 12,
+    'GA': 11, 'NC': 10, 'MI': 10, 'NJ': 9, 'VA': 9, 'WA': 8, 'MA': 7,
+    'TN': 7, 'CO': 6, 'MN': 6, 'LA': 5, 'OR': 4, 'DC': 1,
+}
+
+VENUE_WORDS = ['Hall', 'Lounge', 'Club', 'Room', 'Theatre', 'Ballroom', 'Tavern', 'Garden', 'Cellar', 'Stage']
+ARTIST_WORDS = ['Band', 'Trio', 'Collective', 'Orchestra', 'Project', 'Quartet', 'Ensemble', 'Crew']
+NAME_WORDS = ['Blue', 'Velvet', 'Golden', 'Electric', 'Midnight', 'Silver', 'Crimson', 'Wild', 'Lucky',
+              'Iron', 'Neon', 'Copper', 'Paper', 'Static', 'Honey', 'Gravel', 'Echo', 'Rusty', 'Sax', 'Petal']
+
+# the two forms must agree, otherwise the generator no longer matches the UI
+assert STATES == [value for value, label in ArtistForm.state.kwargs['choices']]
+assert GENRES == [value for value, label in ArtistForm.genres.kwargs['choices']]
+
+
+class Catalogue(object):
+
+    def __init__(self, seed=0, now=None):
+        self.random = random.Random(seed)
+        self.now = now or datetime.datetime.now().replace(minute=0, second=0, microsecond=0)
+        self.state_weights = [STATE_WEIGHTS.get(state, 1) for state in STATES]
+        # zipf-like genre popularity in the order of a shuffled genre list
+        self.genres = list(GENRES)
+        self.random.shuffle(self.genres)
+        self.genre_weights = [1.0 / (rank + 1) for rank in range(len(self.genres))]
+        self.schedule = ScheduleIndex()
+
+    def location(self):
+        state = self.random.choices(STATES, self.state_weights)[0]
+        cities = CITIES.get(state, ['%s City' % state])
+        city = self.random.choices(cities, [1.0 / (rank + 1) for rank in range(len(cities))])[0]
+        return city, state
+
+    def genre_list(self):
+        count = self.random.choices([1, 2, 3], [5, 3, 2])[0]
+        picked = set()
+        while len(picked) < count:
+            picked.add(self.random.choices(self.genres, self.genre_weights)[0])
+        return sorted(picked)
+
+    def name(self, words, i):
+        return '%s %s %s' % (self.random.choice(NAME_WORDS), self.random.choice(words), i)
+
+    def phone(self):
+        return '%03d-%03d-%04d' % (self.random.randint(200, 999), self.random.randint(200, 999), self.random.randint(0, 9999))
+
+    def venue(self, i):
+        city, state = self.location()
+        return {
+            'name': 'The ' + self.name(VENUE_WORDS, i),
+            'genres': self.genre_list(),
+            'city': city,
+            'state': state,
+            'address': '%d Main Street' % self.random.randint(1, 9999),
+            'phone': self.phone(),
+            'image_link': 'https://images.example.com/venues/%d.jpg' % i,
+            'facebook_link': 'https://www.facebook.com/venue%d' % i,
+            'website': 'https://venue%d.example.com' % i,
+            'seeking_talent': self.random.random() < 0.3,
+            'seeking_description': 'Looking for local acts' if self.random.random() < 0.3 else None,
+        }
+
+    def artist(self, i):
+        city, state = self.location()
+        return {
+            'name': self.name(ARTIST_WORDS, i),
+            'genres': self.genre_list(),
+            'city': city,
+            'state': state,
+            'phone': self.phone(),
+            'image_link': 'https://images.example.com/artists/%d.jpg' % i,
+            'facebook_link': 'https://www.facebook.com/artist%d' % i,
+            'website_link': 'https://artist%d.example.com' % i,
+            'seeking_venue': self.random.random() < 0.3,
+            'seeking_description': 'Touring next season' if self.random.random() < 0.3 else None,
+        }
+
+    def show(self, venue_ids, artist_ids):
+        # busy venues/artists get most shows (the top 10% get about a third);
+        # shows are spread over the past and next year, starting on the hour
+        # between 6 and 11pm and lasting two hours. A show that would double
+        # book its venue or artist moves on by two hours until both are free.
+        venue_id = venue_ids[int(len(venue_ids) * self.random.random() ** 2)]
+        artist_id = artist_ids[int(len(artist_ids) * self.random.random() ** 2)]
+        day = self.random.randint(-365, 365)
+        start = self.now.replace(hour=self.random.randint(18, 23)) + datetime.timedelta(days=day)
+        while self.schedule.book(venue_id, artist_id, start, start + DEFAULT_DURATION, None):
+            start += DEFAULT_DURATION
+        return {'venue_id': venue_id, 'artist_id': artist_id, 'start_time': start, 'end_time': start + DEFAULT_DURATION}
+
+
+def generate(venues, artists, shows, seed=0, chunk_size=5000):
+    # bulk-inserts the catalogue into the app's database, chunk by chunk
+    from app import db, Venue, Artist, Show
+
+    catalogue = Catalogue(seed)
+    for model, count, make in ((Venue, venues, catalogue.venue), (Artist, artists, catalogue.artist)):
+        for start in range(0, count, chunk_size):
+            db.session.bulk_insert_mappings(model, [make(i) for i in range(start, min(start + chunk_size, count))])
+            db.session.commit()
+
+    # shuffle so that popularity does not follow insertion order
+    venue_ids = [id for id, in db.session.query(Venue.id).order_by(Venue.id)]
+    artist_ids = [id for id, in db.session.query(Artist.id).order_by(Artist.id)]
+    catalogue.random.shuffle(venue_ids)
+    catalogue.random.shuffle(artist_ids)
+    if not venue_ids or not artist_ids:
+        return
+    for start in range(0, shows, chunk_size):
+        db.session.bulk_insert_mappings(Show, [
+            catalogue.show(venue_ids, artist_ids) for i in range(start, min(start + chunk_size, shows))
+        ])
+        db.session.commit()
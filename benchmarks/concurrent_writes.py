@@ -0,0 +1,143 @@
+# Hammers the create/edit endpoints from parallel clients with a mix of
+# valid posts, invalid forms and shows pointing at missing venues/artists,
+# then checks that the write path cleaned up after every failure:
+#
+#   * no request ends in a server error, e.g. from a session left in a
+#     failed transaction by the request before it on the same thread
+#   * every valid post is accepted, unless it is a show refused for
+#     overlapping another booking; every invalid one is refused
+#   * every accepted create left exactly one row behind, every refusal none
+#   * no connection is still checked out of the pool
+#
+# The target database is dropped and reseeded, so use a scratch database:
+#
+#   python benchmarks/concurrent_writes.py --database postgresql://localhost/fyyur_bench \
+#       --clients 16 --requests 50
+
+import argparse
+import collections
+import datetime
+import os
+import random
+import sys
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+VENUE = {'name': 'Hammer Venue', 'city': 'Austin', 'state': 'TX', 'address': '1 Main Street',
+         'phone': '512-555-0100', 'genres': 'Jazz', 'facebook_link': 'https://www.facebook.com/hammer'}
+ARTIST = {'name': 'Hammer Artist', 'city': 'Austin', 'state': 'TX', 'phone': '512-555-0100',
+          'genres': 'Jazz', 'facebook_link': 'https://www.facebook.com/hammer'}
+
+def plan(rng, venue_ids, artist_ids):
+    # (kind, url, form data, succeeds)
+    start_time = (datetime.datetime.now() + datetime.timedelta(minutes=rng.randint(60, 365 * 24 * 60))).strftime('%Y-%m-%d %H:%M:%S')
+    missing = max(venue_ids + artist_ids) + 1000
+    return rng.choice([
+        ('venue', '/venues/create', VENUE, True),
+        ('venue', '/venues/create', dict(VENUE, name=''), False),
+        ('artist', '/artists/create', ARTIST, True),
+        ('artist', '/artists/create', dict(ARTIST, facebook_link='not a url'), False),
+        ('show', '/shows/create', {'venue_id': rng.choice(venue_ids), 'artist_id': rng.choice(artist_ids),
+                                   'start_time': start_time}, True),
+        ('show', '/shows/create', {'venue_id': missing, 'artist_id': rng.choice(artist_ids),
+                                   'start_time': start_time}, False),
+        ('show', '/shows/create', {'venue_id': rng.choice(venue_ids), 'artist_id': 'x',
+                                   'start_time': start_time}, False),
+        ('edit', '/venues/%d/edit' % rng.choice(venue_ids), VENUE, True),
+        ('edit', '/artists/%d/edit' % rng.choice(artist_ids), dict(ARTIST, genres=''), False),
+    ])
+
+lock = threading.Lock()
+
+def client_loop(app, seed, requests, venue_ids, artist_ids, tally, problems):
+    rng = random.Random(seed)
+    client = app.test_client()
+    for i in range(requests):
+        kind, url, data, succeeds = plan(rng, venue_ids, artist_ids)
+        response = client.post(url, data=data)
+        with lock:
+            record(tally, problems, url, kind, response.status_code, succeeds, response.get_data(as_text=True))
+
+# the refusals of a valid show: the slot was already booked, found by the
+# conflict check or, when two clients race for it, by the postgres
+# exclusion constraint
+BOOKING_CONFLICTS = ('it overlaps another booking', 'it conflicts with existing data')
+
+def record(tally, problems, url, kind, status, succeeds, body):
+    ok = status in (200, 302)
+    if status >= 500:
+        # e.g. a session left in a failed transaction by an earlier request
+        problems.append('%s raised a server error' % url)
+    elif ok and not succeeds:
+        problems.append('%s should have been refused' % url)
+    elif succeeds and not ok:
+        if kind == 'show' and status == 400 and any(reason in body for reason in BOOKING_CONFLICTS):
+            tally['conflict show'] += 1
+        else:
+            # a valid write refused: an unbound form, a lock timeout, ...
+            problems.append('%s refused a valid write with %d' % (url, status))
+    if ok and kind != 'edit':
+        tally['created ' + kind] += 1
+    tally['%s %d' % (kind, status)] += 1
+
+def main():
+    parser = argparse.ArgumentParser(description='Check the write path under parallel create/edit requests.')
+    parser.add_argument('--database', required=True, help='scratch database URL; it is dropped and recreated')
+    parser.add_argument('--clients', type=int, default=16)
+    parser.add_argument('--requests', type=int, default=50, help='requests per client')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    os.environ['DATABASE_URL'] = args.database
+    os.environ['SHOW_BOUNDARY_SCHEDULER'] = '0'
+    os.environ['WTF_CSRF_ENABLED'] = '0'
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import app as app_module
+    from catalogue import generate
+
+    app, db = app_module.app, app_module.db
+    models = {'venue': app_module.Venue, 'artist': app_module.Artist, 'show': app_module.Show}
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        generate(20, 40, 200, seed=args.seed)
+        app_module.refresh_show_counts(full=True)
+        before = {kind: model.query.count() for kind, model in models.items()}
+        venue_ids = [id for id, in db.session.query(app_module.Venue.id)]
+        artist_ids = [id for id, in db.session.query(app_module.Artist.id)]
+        db.session.remove()
+
+    tally = collections.Counter()
+    problems = []
+    threads = [threading.Thread(target=client_loop, args=(app, args.seed + n, args.requests, venue_ids, artist_ids, tally, problems))
+               for n in range(args.clients)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    seconds = time.perf_counter() - started
+
+    with app.app_context():
+        for kind, model in models.items():
+            added = model.query.count() - before[kind]
+            if added != tally['created ' + kind]:
+                problems.append('%d %ss were created but %d are in the database' % (tally['created ' + kind], kind, added))
+        db.session.remove()
+        checked_out = db.engine.pool.checkedout() if hasattr(db.engine.pool, 'checkedout') else 0
+        if checked_out:
+            problems.append('%d connections still checked out' % checked_out)
+
+    for key in sorted(tally):
+        print('%-24s %d' % (key, tally[key]))
+    print('%d requests from %d clients in %.2f s' % (args.clients * args.requests, args.clients, seconds))
+    for problem in problems:
+        print('PROBLEM', problem)
+    if problems:
+        raise SystemExit(1)
+
+if __name__ == '__main__':
+    main()
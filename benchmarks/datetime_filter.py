@@ -0,0 +1,58 @@
+# Per-tile cost of the `datetime` Jinja filter on a 10k-show /shows page,
+# comparing the previous dateutil + babel.dates.format_datetime path with the
+# current one (native datetimes, precompiled patterns, memoized results).
+#
+#   python benchmarks/datetime_filter.py [number of shows]
+
+import os
+import sys
+import time
+import datetime
+import random
+import babel.dates
+import dateutil.parser
+from jinja2 import Environment
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from app import format_datetime
+
+TILE = "{% for show in shows %}<h4>{{ show.start_time|datetime('full') }}</h4>{% endfor %}"
+
+def legacy_format_datetime(value, format='medium'):
+  date = dateutil.parser.parse(value)
+  if format == 'full':
+      format="EEEE MMMM, d, y 'at' h:mma"
+  elif format == 'medium':
+      format="EE MM, dd, y h:mma"
+  return babel.dates.format_datetime(date, format)
+
+def render(filter, shows):
+  env = Environment()
+  env.filters['datetime'] = filter
+  template = env.from_string(TILE)
+  start = time.perf_counter()
+  body = template.render(shows=shows)
+  return time.perf_counter() - start, body
+
+def main():
+  count = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+  random.seed(0)
+  base = datetime.datetime(2026, 1, 1, 18, 0)
+  # shows start on the hour or half hour, so timestamps repeat across tiles
+  times = [base + datetime.timedelta(days=random.randrange(365), minutes=30 * random.randrange(12)) for _ in range(count)]
+
+  legacy_shows = [{'start_time': t.strftime("%m/%d/%Y, %H:%M")} for t in times]
+  shows = [{'start_time': t} for t in times]
+
+  legacy, legacy_body = render(legacy_format_datetime, legacy_shows)
+  format_datetime.cache_clear()
+  cold, body = render(format_datetime, shows)
+  warm, _ = render(format_datetime, shows)
+  assert body == legacy_body
+
+  print('shows: %d' % count)
+  for name, seconds in (('before', legacy), ('after (cold cache)', cold), ('after (warm cache)', warm)):
+      print('%-20s %8.1f ms total %8.2f us/tile' % (name, seconds * 1000, seconds * 1e6 / count))
+
+if __name__ == '__main__':
+  main()
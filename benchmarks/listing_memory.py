@@ -0,0 +1,118 @@
+# Peak Python memory of the large read paths, comparing the previous ORM
+# based code (Show/Venue/Artist instances copied into dicts) with the compact
+# rows of rows.py (selected columns in named tuples, iterated with yield_per):
+#
+#   * venue detail: the busiest venue's exhaustive_format() payload
+#   * shows export: every show with its venue and artist names, written as
+#     CSV to /dev/null
+#
+# The target database is dropped and reseeded, so use a scratch database:
+#
+#   python benchmarks/listing_memory.py --database sqlite:////tmp/fyyur_memory.db \
+#       --size 500:1000:100000
+
+import argparse
+import gc
+import os
+import sys
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+def measure(function):
+    # (peak traced KB, seconds, result)
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = function()
+    seconds = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak / 1024.0, seconds, result
+
+def legacy_venue_detail(app_module, venue_id, now):
+    from sqlalchemy.orm import joinedload, selectinload
+    Venue, Show = app_module.Venue, app_module.Show
+    venue = Venue.query.options(selectinload(Venue.shows).joinedload(Show.artist)).filter_by(id=venue_id).first()
+    past_shows, upcoming_shows = app_module.split_shows(venue.shows, now)
+    format = lambda show: {
+        'artist_id': show.artist_id,
+        'artist_name': show.artist.name,
+        'artist_image_link': show.artist.image_link,
+        'start_time': show.start_time.strftime("%m/%d/%Y, %H:%M")
+    }
+    return dict(venue.format(), past_shows=[format(show) for show in past_shows],
+                upcoming_shows=[format(show) for show in upcoming_shows],
+                past_shows_count=len(past_shows), upcoming_shows_count=len(upcoming_shows))
+
+def venue_detail(app_module, venue_id, now):
+    venue = app_module.Venue.get_by_id(venue_id)
+    return venue.exhaustive_format(now, app_module.venue_show_rows(venue_id))
+
+def legacy_shows_export(app_module):
+    Show = app_module.Show
+    data = []
+    for show in Show.query.order_by(Show.id).all():
+        data.append({
+            'id': show.id,
+            'start_time': show.start_time,
+            'venue_id': show.venue_id,
+            'venue_name': show.venue.name,
+            'artist_id': show.artist_id,
+            'artist_name': show.artist.name,
+            'artist_image_link': show.artist.image_link,
+        })
+    return app_module.bulk.write_rows(open(os.devnull, 'w'), 'csv', list(data[0]), (list(row.values()) for row in data))
+
+def shows_export(app_module):
+    from rows import ShowRow, fetch_rows
+    rows = fetch_rows(app_module.show_listing_query().order_by(app_module.Show.id), ShowRow, batch_size=1000)
+    return app_module.bulk.write_rows(open(os.devnull, 'w'), 'csv', ShowRow._fields, rows)
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare peak memory of the ORM and compact row read paths.')
+    parser.add_argument('--database', required=True, help='scratch database URL; it is dropped and recreated')
+    parser.add_argument('--size', default='500:1000:100000', help='VENUES:ARTISTS:SHOWS')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    os.environ['DATABASE_URL'] = args.database
+    os.environ['SHOW_BOUNDARY_SCHEDULER'] = '0'
+    import app as app_module
+    from catalogue import generate
+
+    venues, artists, shows = [int(n) for n in args.size.split(':')]
+    with app_module.app.app_context():
+        db = app_module.db
+        db.drop_all()
+        db.create_all()
+        generate(venues, artists, shows, seed=args.seed)
+        Show = app_module.Show
+        venue_id, venue_shows = db.session.query(Show.venue_id, db.func.count(Show.id)).group_by(
+            Show.venue_id).order_by(db.func.count(Show.id).desc()).first()
+        now = app_module.clock.naive()
+
+        cases = [
+            ('venue detail (%d shows)' % venue_shows,
+             lambda: legacy_venue_detail(app_module, venue_id, now),
+             lambda: venue_detail(app_module, venue_id, now)),
+            ('shows export (%d shows)' % shows,
+             lambda: legacy_shows_export(app_module),
+             lambda: shows_export(app_module)),
+        ]
+        for name, legacy, current in cases:
+            results = []
+            for function in (legacy, current):
+                # a fresh session each time, so neither run sees the other's instances
+                db.session.remove()
+                results.append(measure(function))
+            assert results[0][2] == results[1][2], 'the two paths disagree'
+            (old_kb, old_s, _), (new_kb, new_s, _) = results
+            print('%-30s ORM %10.1f KB %7.2f s   rows %10.1f KB %7.2f s   %5.1fx less memory' % (
+                name, old_kb, old_s, new_kb, new_s, old_kb / max(new_kb, 1)))
+
+if __name__ == '__main__':
+    main()
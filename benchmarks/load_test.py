@@ -0,0 +1,184 @@
+# Throughput and latency of a running server under many concurrent clients.
+# Each client keeps one HTTP/1.1 keep-alive connection open and requests
+# random pages back to back for --duration seconds; every --clients level
+# is run in turn and reported as requests/s, p50/p95/p99 milliseconds,
+# connection errors and non-2xx responses. The client is plain asyncio, so
+# one process can hold a thousand connections.
+#
+# Start the server against a seeded database first, e.g. with the
+# benchmarks/routes.py catalogue, then compare configurations:
+#
+#   gunicorn -c gunicorn.conf.py wsgi:application &
+#   python benchmarks/load_test.py --url http://127.0.0.1:8000 --clients 50,200,1000 \
+#       --venues 1:500 --artists 1:1000 --output load.json
+#
+#   ASYNC_READS=1 gunicorn -c gunicorn.conf.py wsgi:application &
+#   python benchmarks/load_test.py ... --output load_async.json
+
+import argparse
+import asyncio
+import collections
+import json
+import math
+import random
+import time
+from urllib.parse import urlsplit
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+DEFAULT_PATHS = '/venues/{venue},/artists/{artist},/venues,/artists,/shows'
+
+def percentile(values, p):
+    ordered = sorted(values)
+    return ordered[max(0, int(math.ceil(p / 100.0 * len(ordered))) - 1)]
+
+def id_range(text):
+    low, high = text.split(':')
+    return int(low), int(high)
+
+def raise_file_limit(needed):
+    # each client holds a socket
+    if resource is None:
+        return
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft != resource.RLIM_INFINITY and soft < needed:
+        limit = needed if hard == resource.RLIM_INFINITY else min(needed, hard)
+        resource.setrlimit(resource.RLIMIT_NOFILE, (limit, hard))
+
+
+class Connection(object):
+    # one keep-alive connection; reconnects after the server closes it
+
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+        self.reader = self.writer = None
+
+    async def request(self, path):
+        # the response status; the body is read and dropped
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        self.writer.write(('GET %s HTTP/1.1\r\nHost: %s\r\nConnection: keep-alive\r\n\r\n' % (path, self.host)).encode('ascii'))
+        await self.writer.drain()
+        status_line = await self.reader.readline()
+        if not status_line:
+            raise ConnectionError('connection closed')
+        status = int(status_line.split()[1])
+        headers = {}
+        while True:
+            line = await self.reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+        if headers.get('transfer-encoding', '').lower() == 'chunked':
+            while True:
+                size = int((await self.reader.readline()).split(b';')[0], 16)
+                await self.reader.readexactly(size + 2)
+                if size == 0:
+                    break
+        elif 'content-length' in headers:
+            await self.reader.readexactly(int(headers['content-length']))
+        else:
+            await self.reader.read()
+            headers['connection'] = 'close'
+        if headers.get('connection', '').lower() == 'close':
+            self.close()
+        return status
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+        self.reader = self.writer = None
+
+
+async def client(host, port, paths, deadline, rng, results):
+    connection = Connection(host, port)
+    while time.perf_counter() < deadline:
+        path = rng.choice(paths)()
+        started = time.perf_counter()
+        try:
+            status = await connection.request(path)
+        except (OSError, ValueError, IndexError, asyncio.IncompleteReadError):
+            connection.close()
+            results['errors'] += 1
+            # back off a little so a refusing server is not spun against
+            await asyncio.sleep(0.05)
+            continue
+        results['latencies'].append(time.perf_counter() - started)
+        if not 200 <= status < 300:
+            results['non_2xx'][status] += 1
+    connection.close()
+
+async def run_level(host, port, paths, clients, duration, seed):
+    results = {'latencies': [], 'errors': 0, 'non_2xx': collections.Counter()}
+    started = time.perf_counter()
+    deadline = started + duration
+    await asyncio.gather(*[client(host, port, paths, deadline, random.Random(seed + n), results)
+                           for n in range(clients)])
+    seconds = time.perf_counter() - started
+    latencies = results['latencies']
+    report = {
+        'clients': clients,
+        'requests': len(latencies),
+        'seconds': round(seconds, 2),
+        'requests_per_second': round(len(latencies) / seconds, 1),
+        'errors': results['errors'],
+        # {status: count}
+        'non_2xx': dict(results['non_2xx']),
+    }
+    for p in (50, 95, 99):
+        report['p%d_ms' % p] = round(percentile(latencies, p) * 1000, 1) if latencies else None
+    return report
+
+def make_paths(templates, venues, artists, rng):
+    # callables returning a path with {venue}/{artist} filled in with a
+    # random id of the given range
+    def path(template):
+        return lambda: template.format(venue=rng.randint(*venues), artist=rng.randint(*artists))
+    return [path(template) for template in templates]
+
+def main():
+    parser = argparse.ArgumentParser(description='Load test a running server at several concurrency levels.')
+    parser.add_argument('--url', default='http://127.0.0.1:8000', help='server base URL (http only)')
+    parser.add_argument('--clients', default='50,200,1000', help='comma separated concurrency levels')
+    parser.add_argument('--duration', type=float, default=20.0, help='seconds per level')
+    parser.add_argument('--paths', default=DEFAULT_PATHS, help='comma separated paths; {venue}/{artist} become random ids')
+    parser.add_argument('--venues', type=id_range, default=(1, 100), help='venue id range, e.g. 1:500')
+    parser.add_argument('--artists', type=id_range, default=(1, 100), help='artist id range, e.g. 1:1000')
+    parser.add_argument('--warmup', type=float, default=2.0, help='seconds of unmeasured load before the first level')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='write the reports as JSON')
+    args = parser.parse_args()
+
+    url = urlsplit(args.url)
+    if url.scheme != 'http':
+        parser.error('only http:// URLs are supported')
+    host, port = url.hostname, url.port or 80
+    prefix = url.path.rstrip('/')
+    levels = [int(level) for level in args.clients.split(',')]
+    raise_file_limit(max(levels) + 64)
+    rng = random.Random(args.seed)
+    paths = make_paths([prefix + path for path in args.paths.split(',')], args.venues, args.artists, rng)
+
+    reports = []
+    if args.warmup:
+        asyncio.run(run_level(host, port, paths, min(levels), args.warmup, args.seed))
+    print('%8s %10s %8s %8s %8s %8s %7s %7s' % ('clients', 'requests', 'req/s', 'p50 ms', 'p95 ms', 'p99 ms', 'errors', 'non2xx'))
+    for clients in levels:
+        report = asyncio.run(run_level(host, port, paths, clients, args.duration, args.seed))
+        reports.append(report)
+        print('%8d %10d %8.1f %8s %8s %8s %7d %7d' % (
+            clients, report['requests'], report['requests_per_second'], report['p50_ms'], report['p95_ms'],
+            report['p99_ms'], report['errors'], sum(report['non_2xx'].values())))
+        if report['non_2xx']:
+            print('%8s non-2xx: %s' % ('', ', '.join('%d x %d' % item for item in sorted(report['non_2xx'].items()))))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'url': args.url, 'duration': args.duration, 'paths': args.paths, 'levels': reports}, f, indent=2)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+# Latency of the artist/venue matching queries at catalogue scale: seeds
+# venues, artists and shows, then matches random artists to venues and
+# venues to artists over random windows, printing p50/p95/max milliseconds.
+# A sample of the answers is checked against a plain Python evaluation of
+# the same rules (seeking, same state, shared genre, free in the window).
+#
+# The target database is dropped and reseeded, so use a scratch database:
+#
+#   python benchmarks/match_latency.py --database postgresql://localhost/fyyur_bench \
+#       --size 50000:20000:500000 --queries 200
+
+import argparse
+import datetime
+import math
+import os
+import random
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+def percentile(values, p):
+    ordered = sorted(values)
+    return ordered[max(0, int(math.ceil(p / 100.0 * len(ordered))) - 1)]
+
+def expected(app_module, model, show_key, seeking, source, start_time, end_time):
+    # the matches by the rules, one candidate at a time
+    Show = app_module.Show
+    matches = []
+    for entity in model.query.filter(model.state == source.state, seeking == True):
+        common = len(set(entity.genres or ()) & set(source.genres or ()))
+        if not common:
+            continue
+        booked = Show.query.filter(show_key == entity.id, Show.start_time < end_time, Show.end_time > start_time).first()
+        if booked is None:
+            matches.append((-common, entity.name, entity.id))
+    return [id for common, name, id in sorted(matches)]
+
+def main():
+    parser = argparse.ArgumentParser(description='Time the artist/venue matching queries.')
+    parser.add_argument('--database', required=True, help='scratch database URL; it is dropped and recreated')
+    parser.add_argument('--size', default='50000:20000:500000', help='VENUES:ARTISTS:SHOWS')
+    parser.add_argument('--queries', type=int, default=200, help='matches per direction')
+    parser.add_argument('--check', type=int, default=5, help='answers per direction checked against the rules')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    os.environ['DATABASE_URL'] = args.database
+    os.environ['SHOW_BOUNDARY_SCHEDULER'] = '0'
+    import app as app_module
+    from catalogue import generate
+
+    venues, artists, shows = [int(n) for n in args.size.split(':')]
+    rng = random.Random(args.seed)
+    Venue, Artist, Show = app_module.Venue, app_module.Artist, app_module.Show
+    with app_module.app.app_context():
+        db = app_module.db
+        db.drop_all()
+        if db.engine.dialect.name == 'postgresql':
+            with db.engine.begin() as connection:
+                connection.execute(db.text('CREATE EXTENSION IF NOT EXISTS pg_trgm'))
+                connection.execute(db.text('CREATE EXTENSION IF NOT EXISTS btree_gist'))
+        db.create_all()
+        started = time.perf_counter()
+        generate(venues, artists, shows, seed=args.seed)
+        # the bulk inserts bypass the genre index events
+        app_module.venue_facets.rebuild()
+        app_module.artist_facets.rebuild()
+        if db.engine.dialect.name == 'postgresql':
+            db.session.execute(db.text('ANALYZE'))
+            db.session.commit()
+        print('seeded %d venues, %d artists, %d shows in %.1f s' % (venues, artists, shows, time.perf_counter() - started))
+
+        now = app_module.clock.naive().replace(minute=0, second=0, microsecond=0)
+        artist_ids = [id for id, in db.session.query(Artist.id)]
+        venue_ids = [id for id, in db.session.query(Venue.id)]
+        directions = [
+            ('artist -> venues', Artist, artist_ids, app_module.venue_matching, Venue, Show.venue_id, Venue.seeking_talent),
+            ('venue -> artists', Venue, venue_ids, app_module.artist_matching, Artist, Show.artist_id, Artist.seeking_venue),
+        ]
+        failed = False
+        for name, source_model, ids, matching, model, show_key, seeking in directions:
+            timings = []
+            found = 0
+            for i in range(args.queries):
+                source = db.session.query(source_model.genres, source_model.state).filter(
+                    source_model.id == rng.choice(ids)).one()
+                start_time = now + datetime.timedelta(days=rng.randint(-30, 180), hours=rng.randint(18, 22))
+                end_time = start_time + datetime.timedelta(hours=rng.choice([2, 2, 24, 72]))
+                began = time.perf_counter()
+                matches = matching.find(source.genres, source.state, start_time, end_time, limit=50)
+                timings.append((time.perf_counter() - began) * 1000)
+                found += len(matches)
+                if i < args.check:
+                    want = expected(app_module, model, show_key, seeking, source, start_time, end_time)[:50]
+                    if [match['id'] for match in matches] != want:
+                        failed = True
+                        print('MISMATCH %s %s %s: %r != %r' % (name, source.state, start_time, [m['id'] for m in matches], want))
+                db.session.remove()
+            print('%-18s p50 %7.2f ms  p95 %7.2f ms  max %7.2f ms  %5.1f matches per query' % (
+                name, percentile(timings, 50), percentile(timings, 95), max(timings), found / float(args.queries)))
+        if failed:
+            raise SystemExit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,354 @@
+# Route benchmark: seeds a synthetic catalogue at one or more sizes and
+# drives every page, API and form route through the Flask test client,
+# reporting p50/p95 latency, SQL statements per request and peak Python
+# memory per route as JSON, so runs from two commits can be diffed. A
+# route answering with an unexpected status fails the run: GETs must
+# answer 2xx or 304, and the valid form posts 200 or 302, except a new
+# show that happens to overlap a booking.
+#
+# The target database is dropped and recreated for every size, so point
+# --database at a scratch database, never at a real one:
+#
+#   python benchmarks/routes.py --database postgresql://localhost/fyyur_bench \
+#       --sizes small,medium --output bench.json
+#
+# Sizes are small, medium, large or VENUES:ARTISTS:SHOWS, e.g. 100:200:5000.
+#
+# With --check-shows it is a pass/fail regression check for the show
+# listing instead: 10k shows are seeded and every request to /shows and the
+# show export must stay within its statement count and p95 wall time, with
+# the caches cleared before each request so the listing queries really run.
+#
+#   python benchmarks/routes.py --database sqlite:////tmp/fyyur_check.db --check-shows
+
+import argparse
+import datetime
+import json
+import math
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+SIZES = {
+    'small': (50, 100, 1000),
+    'medium': (500, 1000, 10000),
+    'large': (5000, 10000, 100000),
+}
+
+def parse_size(name):
+    if name in SIZES:
+        return name, SIZES[name]
+    venues, artists, shows = [int(n) for n in name.split(':')]
+    return name, (venues, artists, shows)
+
+def percentile(values, p):
+    ordered = sorted(values)
+    return ordered[max(0, int(math.ceil(p / 100.0 * len(ordered))) - 1)]
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=ROOT).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def route_table(rng, venue_ids, artist_ids):
+    # (name, method, url(), form data()) for every route except deleting venues,
+    # which would drain the sampled ids
+    venue = lambda: rng.choice(venue_ids)
+    artist = lambda: rng.choice(artist_ids)
+    term = lambda: rng.choice(['the', 'band', 'blue', 'hall', 'x'])
+    # any minute of the next year, so new shows rarely collide with a booking
+    start_time = lambda: (datetime.datetime.now() + datetime.timedelta(minutes=rng.randint(60, 365 * 24 * 60))).strftime('%Y-%m-%d %H:%M:%S')
+    venue_form = lambda: {'name': 'Bench Venue', 'city': 'Austin', 'state': 'TX', 'address': '1 Main Street',
+                          'phone': '512-555-0100', 'genres': 'Jazz', 'facebook_link': 'https://www.facebook.com/bench'}
+    artist_form = lambda: {'name': 'Bench Artist', 'city': 'Austin', 'state': 'TX', 'phone': '512-555-0100',
+                           'genres': 'Jazz', 'facebook_link': 'https://www.facebook.com/bench'}
+    none = lambda: None
+    return [
+        ('/', 'GET', lambda: '/', none),
+        ('/venues', 'GET', lambda: '/venues', none),
+        ('/venues?limit=200', 'GET', lambda: '/venues?limit=200', none),
+        ('/venues/<id>', 'GET', lambda: '/venues/%d' % venue(), none),
+        ('/venues/<id>/calendar', 'GET', lambda: '/venues/%d/calendar' % venue(), none),
+        ('/venues/<id>/calendar.ics', 'GET', lambda: '/venues/%d/calendar.ics' % venue(), none),
+        ('/venues/search', 'POST', lambda: '/venues/search', lambda: {'search_term': term()}),
+        ('/venues/create', 'GET', lambda: '/venues/create', none),
+        ('/venues/create', 'POST', lambda: '/venues/create', venue_form),
+        ('/venues/<id>/edit', 'GET', lambda: '/venues/%d/edit' % venue(), none),
+        ('/venues/<id>/edit', 'POST', lambda: '/venues/%d/edit' % venue(), venue_form),
+        ('/artists', 'GET', lambda: '/artists', none),
+        ('/artists/<id>', 'GET', lambda: '/artists/%d' % artist(), none),
+        ('/artists/<id>/calendar.ics', 'GET', lambda: '/artists/%d/calendar.ics' % artist(), none),
+        ('/artists/search', 'POST', lambda: '/artists/search', lambda: {'search_term': term()}),
+        ('/artists/create', 'GET', lambda: '/artists/create', none),
+        ('/artists/create', 'POST', lambda: '/artists/create', artist_form),
+        ('/artists/<id>/edit', 'GET', lambda: '/artists/%d/edit' % artist(), none),
+        ('/artists/<id>/edit', 'POST', lambda: '/artists/%d/edit' % artist(), artist_form),
+        ('/shows', 'GET', lambda: '/shows', none),
+        ('/shows/create', 'GET', lambda: '/shows/create', none),
+        ('/shows/create', 'POST', lambda: '/shows/create',
+         lambda: {'venue_id': str(venue()), 'artist_id': str(artist()), 'start_time': start_time()}),
+        ('/api/v1/venues', 'GET', lambda: '/api/v1/venues', none),
+        ('/api/v1/venues/<id>', 'GET', lambda: '/api/v1/venues/%d' % venue(), none),
+        ('/api/v1/venues/search', 'GET', lambda: '/api/v1/venues/search?search_term=%s' % term(), none),
+        ('/api/v1/artists', 'GET', lambda: '/api/v1/artists', none),
+        ('/api/v1/artists/<id>', 'GET', lambda: '/api/v1/artists/%d' % artist(), none),
+        ('/api/v1/shows', 'GET', lambda: '/api/v1/shows', none),
+        ('/metrics', 'GET', lambda: '/metrics', none),
+    ]
+
+
+class QueryCounter(object):
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, *args):
+        self.count += 1
+
+
+# (url, max SQL statements, max p95 ms): one joined query per page, whatever
+# the number of shows, and one streamed query for the full export
+SHOWS_CHECK_SIZE = (500, 1000, 10000)
+SHOWS_CHECKS = [
+    ('/shows', 2, 200),
+    ('/shows?limit=200', 2, 300),
+    ('/api/v1/shows', 2, 1500),
+]
+
+
+def reset_database(app_module, venues, artists, shows, seed):
+    from catalogue import generate
+    db = app_module.db
+    db.session.remove()
+    db.drop_all()
+    if db.engine.dialect.name == 'postgresql':
+        with db.engine.begin() as connection:
+            connection.execute(db.text('CREATE EXTENSION IF NOT EXISTS pg_trgm'))
+            connection.execute(db.text('CREATE EXTENSION IF NOT EXISTS btree_gist'))
+    db.create_all()
+    generate(venues, artists, shows, seed=seed)
+    app_module.refresh_show_counts(full=True)
+    app_module.entity_cache.clear()
+    app_module.page_cache.clear()
+    app_module.feed_cache.clear()
+    app_module.venue_search.invalidate()
+    app_module.artist_search.invalidate()
+    app_module.format_datetime.cache_clear()
+
+
+def request_once(client, method, url, data):
+    # (status, body)
+    response = client.open(url, method=method, data=data)
+    # reading the body drains streamed responses inside the timing
+    body = response.get_data()
+    response.close()
+    return response.status_code, body
+
+def unexpected(method, name, status, body):
+    # a failure message for a status the route should not answer, or None
+    if method == 'GET':
+        ok = 200 <= status < 300 or status == 304
+    elif name == '/shows/create' and status == 400:
+        # the random start time overlapped a booking of the venue or artist
+        ok = b'it overlaps another booking' in body
+    else:
+        ok = status in (200, 302)
+    return None if ok else '%s %s answered %d' % (method, name, status)
+
+
+def run_size(app_module, size_name, counts, repeat, seed, problems):
+    # appends a message to problems for every route answering an
+    # unexpected status
+    from sqlalchemy import event
+    from sqlalchemy.engine import Engine
+
+    app = app_module.app
+    venues, artists, shows = counts
+    with app.app_context():
+        started = time.perf_counter()
+        reset_database(app_module, venues, artists, shows, seed)
+        seed_seconds = time.perf_counter() - started
+        venue_ids = [id for id, in app_module.db.session.query(app_module.Venue.id).order_by(app_module.Venue.id)]
+        artist_ids = [id for id, in app_module.db.session.query(app_module.Artist.id).order_by(app_module.Artist.id)]
+        app_module.db.session.remove()
+
+    rng = random.Random(seed)
+    client = app.test_client()
+    counter = QueryCounter()
+    event.listen(Engine, 'before_cursor_execute', counter)
+    results = []
+    try:
+        for name, method, url, data in route_table(rng, venue_ids, artist_ids):
+            request_once(client, method, url(), data())  # warm up templates and caches
+            latencies = []
+            queries = []
+            statuses = set()
+            failures = set()
+            for i in range(repeat):
+                counter.count = 0
+                start = time.perf_counter()
+                status, body = request_once(client, method, url(), data())
+                latencies.append((time.perf_counter() - start) * 1000)
+                queries.append(counter.count)
+                statuses.add(status)
+                failures.add(unexpected(method, name, status, body))
+            failures.discard(None)
+            problems.extend('%s: %s' % (size_name, failure) for failure in sorted(failures))
+
+            tracemalloc.start()
+            request_once(client, method, url(), data())
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+
+            results.append({
+                'size': size_name,
+                'venues': venues,
+                'artists': artists,
+                'shows': shows,
+                'route': name,
+                'method': method,
+                'statuses': sorted(statuses),
+                'unexpected_status': bool(failures),
+                'requests': repeat,
+                'p50_ms': round(percentile(latencies, 50), 3),
+                'p95_ms': round(percentile(latencies, 95), 3),
+                'mean_ms': round(sum(latencies) / len(latencies), 3),
+                'max_ms': round(max(latencies), 3),
+                'queries_p50': percentile(queries, 50),
+                'queries_max': max(queries),
+                'peak_memory_kb': round(peak / 1024.0, 1),
+                'response_bytes': len(body),
+            })
+            print('%-8s %-5s %-24s p50 %9.2f ms  p95 %9.2f ms  queries %4d  peak %9.1f KB  status %s%s' % (
+                size_name, method, name, results[-1]['p50_ms'], results[-1]['p95_ms'],
+                results[-1]['queries_max'], results[-1]['peak_memory_kb'],
+                ','.join(str(status) for status in sorted(statuses)), '  UNEXPECTED' if failures else ''), file=sys.stderr)
+    finally:
+        event.remove(Engine, 'before_cursor_execute', counter)
+    return seed_seconds, results
+
+
+def check_shows(app_module, repeat, seed, slack):
+    # the SHOWS_CHECKS results and a list of failures, empty if all passed
+    from sqlalchemy import event
+    from sqlalchemy.engine import Engine
+
+    app = app_module.app
+    with app.app_context():
+        reset_database(app_module, *SHOWS_CHECK_SIZE, seed=seed)
+        shows = app_module.Show.query.count()
+        app_module.db.session.remove()
+
+    client = app.test_client()
+    counter = QueryCounter()
+    event.listen(Engine, 'before_cursor_execute', counter)
+    results = []
+    failures = []
+    try:
+        for url, max_queries, max_ms in SHOWS_CHECKS:
+            request_once(client, 'GET', url, None)  # warm up templates
+            latencies = []
+            queries = []
+            statuses = set()
+            for i in range(repeat):
+                app_module.entity_cache.clear()
+                app_module.page_cache.clear()
+                counter.count = 0
+                start = time.perf_counter()
+                status, body = request_once(client, 'GET', url, None)
+                latencies.append((time.perf_counter() - start) * 1000)
+                queries.append(counter.count)
+                statuses.add(status)
+            p95 = percentile(latencies, 95)
+            results.append({'route': url, 'shows': shows, 'statuses': sorted(statuses), 'queries_max': max(queries),
+                            'max_queries': max_queries, 'p95_ms': round(p95, 3), 'max_ms': max_ms * slack})
+            print('%-20s queries %3d (max %d)  p95 %8.2f ms (max %.0f)' % (
+                url, max(queries), max_queries, p95, max_ms * slack), file=sys.stderr)
+            if statuses != {200}:
+                failures.append('%s answered %s' % (url, sorted(statuses)))
+            if max(queries) > max_queries:
+                failures.append('%s ran %d SQL statements, more than %d' % (url, max(queries), max_queries))
+            if p95 > max_ms * slack:
+                failures.append('%s took %.1f ms at p95, more than %.0f' % (url, p95, max_ms * slack))
+    finally:
+        event.remove(Engine, 'before_cursor_execute', counter)
+    return results, failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark every route against a synthetic catalogue.')
+    parser.add_argument('--database', required=True, help='scratch database URL; it is dropped and recreated')
+    parser.add_argument('--sizes', default='small,medium', help='comma separated: small, medium, large or V:A:S')
+    parser.add_argument('--repeat', type=int, default=20, help='timed requests per route')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='write the JSON report here instead of stdout')
+    parser.add_argument('--check-shows', action='store_true',
+                        help='only check the show listing against its statement and time budgets at 10k shows')
+    parser.add_argument('--slack', type=float, default=1.0, help='multiplies the --check-shows time budgets, for slow machines')
+    args = parser.parse_args()
+
+    # must be set before the app reads its config; the boundary thread's
+    # queries would be counted against whichever route is running
+    os.environ['DATABASE_URL'] = args.database
+    os.environ['SHOW_BOUNDARY_SCHEDULER'] = '0'
+    # the form posts carry no CSRF token
+    os.environ['WTF_CSRF_ENABLED'] = '0'
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import app as app_module
+
+    if args.check_shows:
+        results, failures = check_shows(app_module, args.repeat, args.seed, args.slack)
+        for failure in failures:
+            print('FAIL', failure, file=sys.stderr)
+        if args.output:
+            with open(args.output, 'w') as f:
+                f.write(json.dumps({'checks': results, 'failures': failures}, indent=2, sort_keys=True) + '\n')
+        raise SystemExit(1 if failures else 0)
+
+    report = {
+        'meta': {
+            'commit': git_commit(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'database': app_module.app.config['SQLALCHEMY_DATABASE_URI'].split('://')[0],
+            'seed': args.seed,
+            'repeat': args.repeat,
+            'started_at': datetime.datetime.utcnow().isoformat() + 'Z',
+        },
+        'datasets': [],
+        'results': [],
+        'problems': [],
+    }
+    for size in args.sizes.split(','):
+        size_name, counts = parse_size(size.strip())
+        seed_seconds, results = run_size(app_module, size_name, counts, args.repeat, args.seed, report['problems'])
+        report['datasets'].append({
+            'size': size_name,
+            'venues': counts[0],
+            'artists': counts[1],
+            'shows': counts[2],
+            'seed_seconds': round(seed_seconds, 3),
+        })
+        report['results'].extend(results)
+
+    output = json.dumps(report, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+    for problem in report['problems']:
+        print('FAIL', problem, file=sys.stderr)
+    if report['problems']:
+        raise SystemExit(1)
+
+if __name__ == '__main__':
+    main()
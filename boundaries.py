@@ -0,0 +1,193 @@
+import heapq
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+#----------------------------------------------------------------------------#
+# Show boundaries.
+#
+# A venue's or artist's past/upcoming split only changes when its next
+# upcoming show starts. The index keeps that instant per entity; the
+# scheduler sleeps until the earliest one, reports the entities whose
+# boundary passed so their cached split can be dropped, and looks up their
+# following boundary. The index is reloaded every reload_interval seconds to
+# pick up shows written by other processes.
+#
+# Only one process sharing the lock file runs the scheduler, e.g. one of
+# the gunicorn workers: the others would repeat the same reloads and move
+# the same show counts again. When that process exits the lock is freed and
+# the next process to try (at most every reload_interval) takes over.
+#----------------------------------------------------------------------------#
+
+class ProcessLock(object):
+    # An exclusive flock on path, kept until release() or the process
+    # exits. Without fcntl (Windows) every process gets it.
+
+    def __init__(self, path):
+        self.path = path
+        self.file = None
+
+    def acquire(self):
+        if self.file is not None or fcntl is None:
+            return True
+        lock_file = open(self.path, 'a')
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return False
+        self.file = lock_file
+        return True
+
+    def release(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+
+class BoundaryIndex(object):
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.next = {}
+        # (instant, kind, id); entries whose instant no longer matches
+        # self.next are stale and skipped
+        self.heap = []
+
+    def get(self, kind, id):
+        with self.lock:
+            return self.next.get((kind, id))
+
+    def replace(self, boundaries):
+        # boundaries: {(kind, id): instant}
+        with self.lock:
+            self.next = dict(boundaries)
+            self.heap = [(instant, kind, id) for (kind, id), instant in self.next.items()]
+            heapq.heapify(self.heap)
+
+    def update(self, boundaries):
+        with self.lock:
+            for (kind, id), instant in boundaries.items():
+                self.next[(kind, id)] = instant
+                heapq.heappush(self.heap, (instant, kind, id))
+
+    def offer(self, kind, id, instant):
+        # a show starting at instant was written; returns True when it is
+        # now the earliest boundary, i.e. the scheduler should wake up
+        with self.lock:
+            current = self.next.get((kind, id))
+            if current is not None and current <= instant:
+                return False
+            self.next[(kind, id)] = instant
+            heapq.heappush(self.heap, (instant, kind, id))
+            return self.heap[0][0] == instant
+
+    def peek(self):
+        with self.lock:
+            self.drop_stale()
+            return self.heap[0][0] if self.heap else None
+
+    def pop_due(self, now):
+        # [(kind, id)] whose boundary is at or before now
+        due = []
+        with self.lock:
+            self.drop_stale()
+            while self.heap and self.heap[0][0] <= now:
+                instant, kind, id = heapq.heappop(self.heap)
+                del self.next[(kind, id)]
+                due.append((kind, id))
+                self.drop_stale()
+        return due
+
+    def drop_stale(self):
+        while self.heap and self.next.get(self.heap[0][1:]) != self.heap[0][0]:
+            heapq.heappop(self.heap)
+
+    def __len__(self):
+        return len(self.next)
+
+
+class BoundaryScheduler(object):
+
+    def __init__(self, clock, load, passed, context, reload_interval=60, logger=None, lock_path=None):
+        # load(now, keys=None) -> {(kind, id): next boundary after now}, for
+        # every entity or only the given keys; passed(keys, now) is called
+        # once the boundaries of keys are reached. Both run inside context().
+        # lock_path: the ProcessLock file, None to run in every process.
+        self.clock = clock
+        self.load = load
+        self.passed = passed
+        self.context = context
+        self.reload_interval = reload_interval
+        self.logger = logger
+        self.index = BoundaryIndex()
+        self.wakeup = threading.Event()
+        self.lock = threading.Lock()
+        self.thread = None
+        self.loaded_at = None
+        self.ticks = 0
+        self.process_lock = ProcessLock(lock_path) if lock_path else None
+        self.lock_tried_at = None
+
+    def start(self):
+        # True once this process runs the scheduler
+        with self.lock:
+            if self.thread is not None:
+                return True
+            if self.process_lock is not None:
+                now = time.monotonic()
+                if self.lock_tried_at is not None and now - self.lock_tried_at < self.reload_interval:
+                    return False
+                self.lock_tried_at = now
+                if not self.process_lock.acquire():
+                    return False
+            self.thread = threading.Thread(target=self.run, name='show-boundaries')
+            self.thread.daemon = True
+            self.thread.start()
+            return True
+
+    def run(self):
+        while True:
+            try:
+                self.tick()
+                wait = self.sleep_seconds()
+            except Exception:
+                # keep the thread alive, back off and start again from a reload
+                if self.logger is not None:
+                    self.logger.exception('show boundary scheduler failed')
+                self.loaded_at = None
+                wait = self.reload_interval
+            self.wakeup.wait(wait)
+            self.wakeup.clear()
+
+    def sleep_seconds(self):
+        wait = self.reload_interval
+        if self.loaded_at is not None:
+            wait = max(0, self.loaded_at + self.reload_interval - time.monotonic())
+        boundary = self.index.peek()
+        if boundary is not None:
+            wait = min(wait, max(0, self.clock.seconds_until(boundary)))
+        return wait
+
+    def offer(self, kind, id, instant):
+        # only the running scheduler keeps an index; the others' writes
+        # reach it with its next reload
+        if self.thread is not None and instant is not None and instant > self.clock.naive() and self.index.offer(kind, id, instant):
+            self.wakeup.set()
+
+    def tick(self):
+        now = self.clock.naive()
+        with self.context():
+            if self.loaded_at is None or time.monotonic() - self.loaded_at >= self.reload_interval:
+                self.index.replace(self.load(now))
+                self.loaded_at = time.monotonic()
+            due = self.index.pop_due(now)
+            if due:
+                self.passed(due, now)
+                self.index.update(self.load(now, due))
+        self.ticks += 1
+        return due
@@ -0,0 +1,107 @@
+import csv
+import datetime
+import itertools
+import json
+from werkzeug.datastructures import MultiDict
+
+#----------------------------------------------------------------------------#
+# Bulk import/export helpers.
+#
+# Files are CSV (header row, list columns joined with ";") or NDJSON (one
+# object per line). Rows are read and written one at a time so neither side
+# ever holds a whole file or table in memory.
+#----------------------------------------------------------------------------#
+
+LIST_SEPARATOR = ';'
+DATETIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+def guess_format(name):
+    return 'ndjson' if name.endswith(('.ndjson', '.jsonl')) else 'csv'
+
+def read_rows(stream, format):
+    # yields (line number, row dict)
+    if format == 'csv':
+        reader = csv.DictReader(stream)
+        for row in reader:
+            yield reader.line_num, row
+    else:
+        for number, line in enumerate(stream, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError as e:
+                row = {'__error__': 'invalid JSON: %s' % e}
+            if not isinstance(row, dict):
+                row = {'__error__': 'expected a JSON object'}
+            yield number, row
+
+def chunked(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(itertools.islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+def list_value(value):
+    if value is None:
+        return []
+    if isinstance(value, (list, tuple)):
+        return [str(v) for v in value]
+    return [v.strip() for v in str(value).split(LIST_SEPARATOR) if v.strip()]
+
+def text_value(value):
+    if value is None:
+        return None
+    return str(value).strip() or None
+
+def bool_value(value):
+    if isinstance(value, bool) or value is None:
+        return value
+    value = str(value).strip().lower()
+    if value == '':
+        return None
+    return value in ('1', 'true', 't', 'yes', 'y')
+
+def datetime_value(value):
+    # accept the export format as well as ISO 8601 ("T" separator, fractions)
+    value = str(value).strip().replace('T', ' ')
+    return value.split('.')[0]
+
+def validate(form_class, values):
+    # run the web form's validators over one row; returns (data, errors)
+    formdata = MultiDict()
+    for key, value in values.items():
+        if isinstance(value, list):
+            for item in value:
+                formdata.add(key, item)
+        elif value is not None:
+            formdata.add(key, value)
+    form = form_class(formdata=formdata, meta={'csrf': False})
+    if not form.validate():
+        return None, form.errors
+    return form.data, None
+
+def export_value(value, format):
+    if isinstance(value, datetime.datetime):
+        return value.strftime(DATETIME_FORMAT)
+    if format == 'csv' and isinstance(value, (list, tuple)):
+        return LIST_SEPARATOR.join(value)
+    return value
+
+def write_rows(stream, format, columns, rows):
+    # rows are tuples in column order
+    writer = csv.writer(stream) if format == 'csv' else None
+    if writer:
+        writer.writerow(columns)
+    count = 0
+    for row in rows:
+        values = [export_value(value, format) for value in row]
+        if writer:
+            writer.writerow(values)
+        else:
+            stream.write(json.dumps(dict(zip(columns, values))) + '\n')
+        count += 1
+    return count
@@ -0,0 +1,437 @@
+import contextlib
+import functools
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from flask import Response, make_response, request, session
+from sqlalchemy import event
+
+#----------------------------------------------------------------------------#
+# Entity payload cache.
+#
+# Formatted venue/artist payloads are cached under a key that includes a
+# per-entity version. Invalidating an entity bumps its version, so a reader
+# that raced with the write can only store its (stale) payload under the old
+# version, which nobody asks for again.
+#
+# Rendered pages are cached the same way under one data version shared by
+# every page, bumped by any committed write to the watched models; facet
+# counts under one version per model; calendar feeds under the same
+# per-entity versions as the payloads, so a new show only rebuilds the feeds
+# of its venue and artist.
+#----------------------------------------------------------------------------#
+
+class LRUBackend(object):
+    # In-process LRU with a per-entry TTL. Version counters are kept apart
+    # from the entries so that evicting entries never resets a version.
+
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.counters = {}
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            value, expires = entry
+            if expires is not None and expires <= time.time():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        with self.lock:
+            self.entries[key] = (value, time.time() + ttl if ttl else None)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+    def delete(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def version(self, key):
+        with self.lock:
+            return self.counters.get(key, 0)
+
+    def incr(self, key):
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + 1
+            return self.counters[key]
+
+    def size(self):
+        return len(self.entries)
+
+    def clear(self, prefix=None):
+        with self.lock:
+            self.entries.clear()
+            self.counters.clear()
+
+
+class NullBackend(object):
+    # Caches nothing: every lookup misses and every version is 0.
+
+    def get(self, key):
+        return None
+
+    def set(self, key, value, ttl=None):
+        pass
+
+    def delete(self, key):
+        pass
+
+    def version(self, key):
+        return 0
+
+    def incr(self, key):
+        return 0
+
+    def size(self):
+        return 0
+
+    def clear(self, prefix=None):
+        pass
+
+
+class RedisBackend(object):
+    # Works with any client exposing the redis-py get/set/delete/incr calls,
+    # e.g. redis.Redis against a local server or a fakeredis instance.
+
+    def __init__(self, client):
+        self.client = client
+
+    def get(self, key):
+        value = self.client.get(key)
+        if value is None:
+            return None
+        return json.loads(value)
+
+    def set(self, key, value, ttl=None):
+        self.client.set(key, json.dumps(value), ex=ttl or None)
+
+    def delete(self, key):
+        self.client.delete(key)
+
+    def version(self, key):
+        return int(self.client.get(key) or 0)
+
+    def incr(self, key):
+        return self.client.incr(key)
+
+    def size(self):
+        return None
+
+    def clear(self, prefix):
+        for key in self.client.scan_iter(match=prefix + ':*'):
+            self.client.delete(key)
+
+
+class EntityCache(object):
+
+    def __init__(self, backend, ttl=60, prefix='fyyur'):
+        self.backend = backend
+        self.ttl = ttl
+        self.prefix = prefix
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def version_key(self, kind, id):
+        return '%s:version:%s:%s' % (self.prefix, kind, id)
+
+    def key(self, kind, id, variant):
+        version = self.backend.version(self.version_key(kind, id))
+        return '%s:%s:%s:%s:v%d' % (self.prefix, kind, id, variant, version)
+
+    def get_or_load(self, kind, id, loader, variant='format', ttl=None):
+        # loader() returns the payload, or None for a missing entity (not
+        # cached); ttl defaults to self.ttl and may be a function called
+        # after loading, for payloads that know when they go stale
+        key = self.key(kind, id, variant)
+        value = self.backend.get(key)
+        with self.lock:
+            if value is not None:
+                self.hits += 1
+            else:
+                self.misses += 1
+        if value is not None:
+            return value
+        value = loader()
+        if value is not None:
+            if ttl is None:
+                ttl = self.ttl
+            elif callable(ttl):
+                ttl = ttl()
+            self.backend.set(key, value, ttl)
+        return value
+
+    def invalidate(self, kind, ids):
+        # drops every cached variant of the given entities
+        for id in ids:
+            self.backend.incr(self.version_key(kind, id))
+
+    def clear(self):
+        # drops everything, e.g. after the database was reloaded
+        self.backend.clear(self.prefix)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': float(self.hits) / lookups if lookups else 0.0,
+            'size': self.backend.size()
+        }
+
+
+class PageCache(object):
+    # Caches the body of successful GET responses per path + query string and
+    # data version, and serves them with an ETag (a hash of the body, so
+    # workers rendering the same data agree) and Last-Modified (render time).
+    # A matching If-None-Match/If-Modified-Since gets a 304 from the cache
+    # alone. Responses are sent with "no-cache" so browsers revalidate and
+    # see writes straight away.
+    #
+    # bypass() returning true skips the cache for the request, e.g. for a
+    # client that just wrote; a missed page is rendered inside fresh(), e.g.
+    # on the primary database, since whatever it renders is stored as the
+    # current version.
+
+    def __init__(self, backend, prefix='fyyur:page', bypass=None, fresh=None):
+        self.backend = backend
+        self.prefix = prefix
+        self.bypass = bypass or (lambda: False)
+        self.fresh = fresh or contextlib.nullcontext
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+        self.lock = threading.Lock()
+
+    def version_key(self):
+        return '%s:version' % self.prefix
+
+    def key(self):
+        return '%s:v%d:%s' % (self.prefix, self.backend.version(self.version_key()), request.full_path)
+
+    def bump(self):
+        # every cached page is stale from now on
+        self.backend.incr(self.version_key())
+
+    def watch(self, session_class, models):
+        # bump after a commit that flushed changes to any of the models
+        def after_flush(session, flush_context):
+            for instance in list(session.new) + list(session.dirty) + list(session.deleted):
+                if isinstance(instance, models):
+                    session.info[self] = True
+                    return
+
+        def after_commit(session):
+            if session.info.pop(self, False):
+                self.bump()
+
+        event.listen(session_class, 'after_flush', after_flush)
+        event.listen(session_class, 'after_commit', after_commit)
+
+    def count(self, name):
+        with self.lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def cached(self, ttl):
+        # ttl bounds how stale a page gets without a write, e.g. one that
+        # splits shows into past and upcoming
+        def decorator(view):
+            @functools.wraps(view)
+            def wrapper(*args, **kwargs):
+                # pending flash messages are rendered into the page
+                if request.method not in ('GET', 'HEAD') or session.get('_flashes') or self.bypass():
+                    return view(*args, **kwargs)
+                key = self.key()
+                entry = self.backend.get(key)
+                if entry is None:
+                    self.count('misses')
+                    with self.fresh():
+                        response = make_response(view(*args, **kwargs))
+                    if response.status_code != 200 or response.is_streamed:
+                        return response
+                    body = response.get_data(as_text=True)
+                    entry = {
+                        'body': body,
+                        'mimetype': response.mimetype,
+                        'etag': hashlib.sha1(body.encode('utf-8')).hexdigest(),
+                        'modified': int(time.time()),
+                    }
+                    self.backend.set(key, entry, ttl)
+                else:
+                    self.count('hits')
+                response = Response(entry['body'], mimetype=entry['mimetype'])
+                response.set_etag(entry['etag'])
+                response.last_modified = entry['modified']
+                response.cache_control.no_cache = True
+                response = response.make_conditional(request)
+                if response.status_code == 304:
+                    self.count('not_modified')
+                return response
+            return wrapper
+        return decorator
+
+    def clear(self):
+        self.backend.clear(self.prefix)
+
+    def stats(self):
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'not_modified': self.not_modified,
+            'size': self.backend.size()
+        }
+
+
+class FacetCache(object):
+    # Facet counts per (kind, filters), under a version per kind that any
+    # committed write to the kind's model bumps.
+
+    def __init__(self, backend, ttl=None, prefix='fyyur:facets'):
+        self.backend = backend
+        self.ttl = ttl
+        self.prefix = prefix
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def version_key(self, kind):
+        return '%s:version:%s' % (self.prefix, kind)
+
+    def key(self, kind, filters):
+        digest = hashlib.sha1(json.dumps(filters).encode('utf-8')).hexdigest()
+        return '%s:%s:v%d:%s' % (self.prefix, kind, self.backend.version(self.version_key(kind)), digest)
+
+    def get_or_load(self, kind, filters, loader):
+        key = self.key(kind, filters)
+        value = self.backend.get(key)
+        with self.lock:
+            if value is not None:
+                self.hits += 1
+                return value
+            self.misses += 1
+        value = loader()
+        self.backend.set(key, value, self.ttl)
+        return value
+
+    def invalidate(self, kind):
+        self.backend.incr(self.version_key(kind))
+
+    def watch(self, session_class, kinds):
+        # kinds: {model: kind}; bumps a kind after a commit that flushed
+        # changes to its model
+        def after_flush(session, flush_context):
+            for instance in list(session.new) + list(session.dirty) + list(session.deleted):
+                kind = kinds.get(type(instance))
+                if kind is not None:
+                    session.info.setdefault(self, set()).add(kind)
+
+        def after_commit(session):
+            for kind in session.info.pop(self, ()):
+                self.invalidate(kind)
+
+        event.listen(session_class, 'after_flush', after_flush)
+        event.listen(session_class, 'after_commit', after_commit)
+
+    def clear(self):
+        self.backend.clear(self.prefix)
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'size': self.backend.size()}
+
+
+class FeedCache(object):
+    # Calendar feeds and month pages per (kind, id, variant), stored with the
+    # time the entity's shows last changed. That time is the feed's
+    # Last-Modified; it only moves forward, so a client holding an older copy
+    # never gets a 304.
+
+    def __init__(self, backend, ttl=None, prefix='fyyur:feeds'):
+        self.backend = backend
+        self.ttl = ttl
+        self.prefix = prefix
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def version_key(self, kind, id):
+        return '%s:version:%s:%s' % (self.prefix, kind, id)
+
+    def changed_key(self, kind, id):
+        return '%s:changed:%s:%s' % (self.prefix, kind, id)
+
+    def key(self, kind, id, variant):
+        version = self.backend.version(self.version_key(kind, id))
+        return '%s:%s:%s:%s:v%d' % (self.prefix, kind, id, variant, version)
+
+    def changed(self, kind, id):
+        # unknown (first use, evicted): now, which is no earlier than any
+        # change the feed about to be built can contain
+        stamp = self.backend.get(self.changed_key(kind, id))
+        if stamp is None:
+            stamp = int(time.time())
+            self.backend.set(self.changed_key(kind, id), stamp)
+        return stamp
+
+    def get_or_load(self, kind, id, variant, loader):
+        # {'body': loader(), 'modified': timestamp, 'etag': body hash}
+        key = self.key(kind, id, variant)
+        entry = self.backend.get(key)
+        with self.lock:
+            if entry is not None:
+                self.hits += 1
+                return entry
+            self.misses += 1
+        modified = self.changed(kind, id)
+        body = loader()
+        entry = {'body': body, 'modified': modified, 'etag': hashlib.sha1(body.encode('utf-8')).hexdigest()}
+        self.backend.set(key, entry, self.ttl)
+        return entry
+
+    def touch(self, kind, ids):
+        # the entities' shows changed: drop their feeds and move their
+        # Last-Modified forward
+        now = int(time.time())
+        for id in ids:
+            self.backend.incr(self.version_key(kind, id))
+            stamp = self.backend.get(self.changed_key(kind, id)) or 0
+            self.backend.set(self.changed_key(kind, id), max(now, stamp + 1))
+
+    def clear(self):
+        self.backend.clear(self.prefix)
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'size': self.backend.size()}
+
+
+def make_backend(config, maxsize):
+    # CACHE_URL selects redis (redis://...); otherwise an in-process LRU,
+    # unless LOCAL_CACHES turned those off
+    url = config.get('CACHE_URL')
+    if url:
+        import redis
+        return RedisBackend(redis.from_url(url))
+    if not config.get('LOCAL_CACHES', True):
+        return NullBackend()
+    return LRUBackend(maxsize)
+
+def make_cache(config):
+    return EntityCache(make_backend(config, config.get('CACHE_MAXSIZE', 1024)), ttl=config.get('CACHE_TTL', 60))
+
+def make_page_cache(config, bypass=None, fresh=None):
+    return PageCache(make_backend(config, config.get('PAGE_CACHE_MAXSIZE', 256)), bypass=bypass, fresh=fresh)
+
+def make_facet_cache(config):
+    return FacetCache(make_backend(config, config.get('FACET_CACHE_MAXSIZE', 256)), ttl=config.get('FACET_CACHE_TTL'))
+
+def make_feed_cache(config):
+    return FeedCache(make_backend(config, config.get('FEED_CACHE_MAXSIZE', 1024)), ttl=config.get('FEED_CACHE_TTL'))
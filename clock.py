@@ -0,0 +1,57 @@
+import datetime
+import threading
+from dateutil import tz
+
+#----------------------------------------------------------------------------#
+# Clock.
+#
+# Show start times are stored as naive wall-clock times of one zone
+# (SHOW_TIMEZONE, the server's local zone by default), so everything that
+# compares them with "now" asks the clock for naive() rather than calling
+# datetime.now() itself. The clock can be frozen and moved by hand, which
+# makes the past/upcoming split reproducible in tests.
+#----------------------------------------------------------------------------#
+
+class Clock(object):
+
+    def __init__(self, zone=None):
+        self.zone = tz.gettz(zone) if zone else tz.tzlocal()
+        if self.zone is None:
+            raise ValueError('unknown time zone %r' % zone)
+        self.frozen = None
+        self.lock = threading.Lock()
+
+    def now(self):
+        # aware datetime in the clock's zone
+        with self.lock:
+            if self.frozen is not None:
+                return self.frozen
+        return datetime.datetime.now(self.zone)
+
+    def naive(self):
+        # wall-clock time in the clock's zone, comparable with Show.start_time
+        return self.now().replace(tzinfo=None)
+
+    def aware(self, moment):
+        # naive wall-clock times are taken to be in the clock's zone
+        if moment.tzinfo is None:
+            return moment.replace(tzinfo=self.zone)
+        return moment.astimezone(self.zone)
+
+    def seconds_until(self, moment):
+        return (self.aware(moment) - self.now()).total_seconds()
+
+    def freeze(self, moment=None):
+        moment = self.aware(moment) if moment is not None else self.now()
+        with self.lock:
+            self.frozen = moment
+
+    def advance(self, delta):
+        with self.lock:
+            if self.frozen is None:
+                raise RuntimeError('only a frozen clock can be advanced')
+            self.frozen += delta
+
+    def unfreeze(self):
+        with self.lock:
+            self.frozen = None
@@ -1,12 +1,188 @@
 import os
-SECRET_KEY = os.urandom(32)
+import tempfile
+from sqlalchemy.pool import NullPool
+# Signs sessions, flash messages and CSRF tokens. Set it whenever more than
+# one process serves the app, or their forms fail each other's CSRF checks.
+SECRET_KEY = os.environ.get('SECRET_KEY') or os.urandom(32)
 # Grabs the folder where the script runs.
 basedir = os.path.abspath(os.path.dirname(__file__))
 
+def env(name, default, cast=str):
+    value = os.environ.get(name)
+    if value is None or value == '':
+        return default
+    if cast is bool:
+        return value.lower() in ('1', 'true', 'yes', 'on')
+    return cast(value)
+
+# Settings profile, picked with FYYUR_ENV: dev (default), test or prod. Each
+# setting below can still be overridden by its own environment variable.
+profiles = {
+    'dev': {
+        'debug': True,
+        'database_url': 'postgresql://ajitesh@localhost:5432/musicdb',
+        'pool_size': 5, 'max_overflow': 10, 'pool_timeout': 30, 'pool_recycle': 1800,
+        'statement_timeout': 0,
+        'boundary_scheduler': True,
+    },
+    'test': {
+        'debug': False,
+        'database_url': 'postgresql://ajitesh@localhost:5432/musicdb_test',
+        'pool_size': 2, 'max_overflow': 0, 'pool_timeout': 5, 'pool_recycle': 1800,
+        'statement_timeout': 5000,
+        'boundary_scheduler': False,
+    },
+    'prod': {
+        'debug': False,
+        'database_url': None,
+        'pool_size': 10, 'max_overflow': 5, 'pool_timeout': 10, 'pool_recycle': 900,
+        'statement_timeout': 30000,
+        'boundary_scheduler': True,
+    },
+}
+FYYUR_ENV = os.environ.get('FYYUR_ENV', 'dev')
+if FYYUR_ENV not in profiles:
+    raise ValueError('FYYUR_ENV must be one of %s, not %r' % (', '.join(sorted(profiles)), FYYUR_ENV))
+profile = profiles[FYYUR_ENV]
+
 # Enable debug mode.
-DEBUG = True
+DEBUG = env('DEBUG', profile['debug'], bool)
+TESTING = FYYUR_ENV == 'test'
 
 # Connect to the database
+SQLALCHEMY_DATABASE_URI = env('DATABASE_URL', profile['database_url'])
+if SQLALCHEMY_DATABASE_URI is None:
+    raise RuntimeError('DATABASE_URL must be set in the %s profile' % FYYUR_ENV)
+
+# Connection pool, per worker process: at most POOL_SIZE + MAX_OVERFLOW
+# connections, so workers x that must stay below the server's max_connections.
+DATABASE_POOL_SIZE = env('DATABASE_POOL_SIZE', profile['pool_size'], int)
+DATABASE_MAX_OVERFLOW = env('DATABASE_MAX_OVERFLOW', profile['max_overflow'], int)
+# seconds a request waits for a free connection before failing
+DATABASE_POOL_TIMEOUT = env('DATABASE_POOL_TIMEOUT', profile['pool_timeout'], int)
+# seconds after which a connection is replaced; keep it below any idle
+# timeout of the server, firewall or load balancer
+DATABASE_POOL_RECYCLE = env('DATABASE_POOL_RECYCLE', profile['pool_recycle'], int)
+# test connections on checkout so one dropped while idle is replaced
+# instead of failing the request
+DATABASE_POOL_PRE_PING = env('DATABASE_POOL_PRE_PING', True, bool)
+# milliseconds, 0 for no limit (postgres only)
+DATABASE_STATEMENT_TIMEOUT = env('DATABASE_STATEMENT_TIMEOUT', profile['statement_timeout'], int)
+# Behind PgBouncer in transaction mode: PgBouncer does the pooling, so no
+# connections are kept here, and the statement timeout is set per
+# transaction since session settings do not survive between transactions.
+DATABASE_PGBOUNCER = env('DATABASE_PGBOUNCER', False, bool)
+
+def engine_options():
+    options = {'pool_pre_ping': DATABASE_POOL_PRE_PING}
+    postgres = SQLALCHEMY_DATABASE_URI.startswith('postgres')
+    if DATABASE_PGBOUNCER:
+        options['poolclass'] = NullPool
+    elif not SQLALCHEMY_DATABASE_URI.startswith('sqlite'):
+        options.update({
+            'pool_size': DATABASE_POOL_SIZE,
+            'max_overflow': DATABASE_MAX_OVERFLOW,
+            'pool_timeout': DATABASE_POOL_TIMEOUT,
+            'pool_recycle': DATABASE_POOL_RECYCLE,
+        })
+    if postgres and DATABASE_STATEMENT_TIMEOUT and not DATABASE_PGBOUNCER:
+        options['connect_args'] = {'options': '-c statement_timeout=%d' % DATABASE_STATEMENT_TIMEOUT}
+    return options
+
+SQLALCHEMY_ENGINE_OPTIONS = engine_options()
+
+# Async read path (aio.py): detail pages run their queries concurrently
+# through asyncpg/aiosqlite, which must be installed along with SQLAlchemy's
+# asyncio extra. ASYNC_DATABASE_URL defaults to DATABASE_URL with the async
+# driver. Its pool is per worker and comes on top of the sync one.
+ASYNC_READS = env('ASYNC_READS', False, bool)
+ASYNC_DATABASE_URL = env('ASYNC_DATABASE_URL', None)
+# seconds a request waits for its concurrent queries
+ASYNC_READ_TIMEOUT = env('ASYNC_READ_TIMEOUT', 30.0, float)
+
+def async_engine_options():
+    options = {'pool_pre_ping': DATABASE_POOL_PRE_PING}
+    postgres = SQLALCHEMY_DATABASE_URI.startswith('postgres')
+    if DATABASE_PGBOUNCER:
+        # asyncpg's prepared statements do not survive PgBouncer's
+        # transaction pooling
+        options['poolclass'] = NullPool
+        options['connect_args'] = {'statement_cache_size': 0, 'prepared_statement_cache_size': 0}
+    elif not SQLALCHEMY_DATABASE_URI.startswith('sqlite'):
+        options.update({
+            'pool_size': DATABASE_POOL_SIZE,
+            'max_overflow': DATABASE_MAX_OVERFLOW,
+            'pool_timeout': DATABASE_POOL_TIMEOUT,
+            'pool_recycle': DATABASE_POOL_RECYCLE,
+        })
+    if postgres and DATABASE_STATEMENT_TIMEOUT and not DATABASE_PGBOUNCER:
+        options['connect_args'] = {'server_settings': {'statement_timeout': str(DATABASE_STATEMENT_TIMEOUT)}}
+    return options
+
+ASYNC_ENGINE_OPTIONS = async_engine_options()
+
+# Read replicas, comma separated URLs. Read-only pages use one that lags the
+# primary by at most REPLICA_MAX_LAG seconds (checked every
+# REPLICA_CHECK_INTERVAL seconds); a client that just wrote reads from the
+# primary for REPLICA_STICKY_SECONDS.
+REPLICA_DATABASE_URLS = [url.strip() for url in env('REPLICA_DATABASE_URLS', '').split(',') if url.strip()]
+REPLICA_MAX_LAG = env('REPLICA_MAX_LAG', 5.0, float)
+REPLICA_CHECK_INTERVAL = env('REPLICA_CHECK_INTERVAL', 5.0, float)
+REPLICA_STICKY_SECONDS = env('REPLICA_STICKY_SECONDS', 10.0, float)
+
+
+# Forms carry a CSRF token checked on submit; scripted clients such as the
+# benchmarks turn the check off
+WTF_CSRF_ENABLED = env('WTF_CSRF_ENABLED', True, bool)
+
+# Maximum number of venues/artists returned by a search
+SEARCH_RESULT_LIMIT = 50
+
+# Keyset pagination of the venue, artist and show listings
+PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+# Formatted venue/artist payload cache. Set CACHE_URL (redis://...) to share
+# it between workers, otherwise each process keeps its own LRU.
+CACHE_URL = os.environ.get('CACHE_URL')
+# Without CACHE_URL, whether the in-process caches are used at all. A write
+# only clears the caches of the process serving it, so gunicorn turns them
+# off when it runs several workers without a shared cache.
+LOCAL_CACHES = env('LOCAL_CACHES', True, bool)
+CACHE_MAXSIZE = 4096
+CACHE_TTL = 60
+
+# Rendered page cache (shares CACHE_URL). Pages are dropped on any write;
+# the TTLs bound how stale they get otherwise: pages with past/upcoming
+# shows or upcoming show counts change as time passes.
+PAGE_CACHE_MAXSIZE = 256
+PAGE_CACHE_TTL = 300
+PAGE_CACHE_TIME_TTL = 30
+
+# Genre/area facet counts (shares CACHE_URL), dropped on any venue/artist
+# write; the TTL only ages out filter combinations nobody asks for again
+FACET_CACHE_MAXSIZE = 512
+FACET_CACHE_TTL = 3600
+
+# Calendar feeds and month pages (shares CACHE_URL), rebuilt per venue or
+# artist when its shows change. Feeds list the shows of the last
+# CALENDAR_PAST_DAYS days and every upcoming one; the TTL rolls that window.
+FEED_CACHE_MAXSIZE = 1024
+FEED_CACHE_TTL = 3600
+CALENDAR_PAST_DAYS = 90
+
+# Zone of the (naive) show start times; the server's local zone if unset
+SHOW_TIMEZONE = env('SHOW_TIMEZONE', None)
+
+# Background thread that expires cached past/upcoming splits and moves the
+# show counters when a show starts (replaces the refresh-show-counts cron).
+# Shows written by other processes are picked up on the next reload.
+SHOW_BOUNDARY_SCHEDULER = env('SHOW_BOUNDARY_SCHEDULER', profile['boundary_scheduler'], bool)
+SHOW_BOUNDARY_RELOAD_INTERVAL = 60
+# only the process holding this lock file runs the scheduler, e.g. one
+# gunicorn worker per host
+SHOW_BOUNDARY_LOCK = env('SHOW_BOUNDARY_LOCK', os.path.join(tempfile.gettempdir(), 'fyyur-show-boundaries.lock'))
 
-# TODO IMPLEMENT DATABASE URL
-SQLALCHEMY_DATABASE_URI = 'postgresql://ajitesh@localhost:5432/musicdb'
+# Log a possible N+1 when one statement shape repeats more often than this
+# within a single request
+METRICS_N_PLUS_ONE_THRESHOLD = 10
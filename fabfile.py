@@ -7,12 +7,38 @@ from fabric.contrib.console import confirm
 def test():
     with settings(warn_only=True):
         result = local(
-            "python test_tasks.py -v && python test_users.py -v", capture=True
+            "python -m unittest discover -v", capture=True
         )
     if result.failed and not confirm("Tests failed. Continue?"):
         abort("Aborted at user request.")
 
 
+def bench():
+    # BENCHMARK_DATABASE_URL must point at a scratch database; it is recreated
+    local(
+        "python benchmarks/routes.py --database $BENCHMARK_DATABASE_URL"
+        " --sizes small,medium --output bench_output.json"
+    )
+
+
+def check():
+    # fails if the show listing regresses at 10k shows
+    local("python benchmarks/routes.py --database sqlite:////tmp/fyyur_check.db --check-shows")
+
+
+def verify():
+    # everything the backlog's changes are checked with, against scratch
+    # SQLite databases; each step aborts the run on failure
+    test()
+    check()
+    local("python benchmarks/routes.py --database sqlite:////tmp/fyyur_check.db --sizes small")
+    local("python benchmarks/concurrent_writes.py --database sqlite:////tmp/fyyur_writes.db")
+    local(
+        "DATABASE_URL=sqlite:////tmp/fyyur_check.db SHOW_BOUNDARY_SCHEDULER=0"
+        " flask --app app explain-indexes"
+    )
+
+
 def commit():
     message = raw_input("Enter a git commit message: ")
     local("git add . && git commit -am '{}'".format(message))
@@ -39,9 +65,9 @@ def heroku():
 
 
 def heroku_test():
-    local(
-        "heroku run python test_tasks.py -v && heroku run python test_users.py -v"
-    )
+    # the test modules point DATABASE_URL at a scratch SQLite file, so this
+    # leaves the dyno's database alone
+    local("heroku run python -m unittest discover -v")
 
 
 def deploy():
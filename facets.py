@@ -0,0 +1,110 @@
+from sqlalchemy import func, literal_column, null
+
+#----------------------------------------------------------------------------#
+# Genre facets.
+#
+# Venue.genres and Artist.genres stay the source of truth; VenueGenre and
+# ArtistGenre hold one (genre, id) row per listed genre, kept in step by
+# mapper events, so "jazz venues in NY" is an index lookup instead of a scan
+# that unpacks every genres array. Facet counts (entities per genre and per
+# city/state within the current filters) come from one UNION ALL aggregate
+# and are cached until the next write to the model.
+#----------------------------------------------------------------------------#
+
+GENRES = [
+    'Alternative', 'Blues', 'Classical', 'Country', 'Electronic', 'Folk', 'Funk', 'Hip-Hop',
+    'Heavy Metal', 'Instrumental', 'Jazz', 'Musical Theatre', 'Pop', 'Punk', 'R&B', 'Reggae',
+    'Rock n Roll', 'Soul', 'Other',
+]
+
+def make_filters(genres=(), city=None, state=None):
+    # canonical, hashable (genres, city, state): the same filters in any
+    # order give the same cache key and page URL
+    genres = tuple(sorted(set(genre for genre in genres if genre)))
+    return (genres, city or None, state or None)
+
+NO_FILTERS = make_filters()
+
+def replace_genres(connection, table, key, id, genres):
+    # make the index rows of one entity match its genres list, inside the
+    # flush that changed it
+    connection.execute(table.delete().where(table.c[key] == id))
+    if genres:
+        connection.execute(table.insert(), [{'genre': genre, key: id} for genre in sorted(set(genres))])
+
+
+class Facets(object):
+
+    def __init__(self, db, model, index, cache, kind):
+        # index: the model's genre table, e.g. VenueGenre; kind names the
+        # model in the facet cache
+        self.db = db
+        self.model = model
+        self.index = index
+        self.key = getattr(index, model.__tablename__.lower() + '_id')
+        self.cache = cache
+        self.kind = kind
+
+    def clauses(self, filters):
+        # WHERE clauses on the model selecting the entities that have every
+        # filtered genre and are in the filtered city/state
+        genres, city, state = filters
+        model = self.model
+        clauses = []
+        if genres:
+            matching = self.db.session.query(self.key).filter(self.index.genre.in_(genres)).group_by(
+                self.key).having(func.count() == len(genres))
+            clauses.append(model.id.in_(matching))
+        if city:
+            clauses.append(model.city == city)
+        if state:
+            clauses.append(model.state == state)
+        return clauses
+
+    def filter(self, query, filters):
+        return query.filter(*self.clauses(filters))
+
+    def matching_ids(self, filters):
+        return set(id for id, in self.filter(self.db.session.query(self.model.id), filters))
+
+    def load(self, filters):
+        # {'genres': [[genre, count]], 'areas': [[city, state, count]]},
+        # largest first, in one query
+        model = self.model
+        clauses = self.clauses(filters)
+        areas = self.db.session.query(
+            literal_column("'area'").label('facet'), model.city.label('value'), model.state.label('state'),
+            func.count().label('count')
+        ).filter(*clauses).group_by(model.city, model.state)
+        genres = self.db.session.query(
+            literal_column("'genre'"), self.index.genre, null(), func.count()
+        ).join(model, model.id == self.key).filter(*clauses).group_by(self.index.genre)
+        result = {'genres': [], 'areas': []}
+        for facet, value, state, count in areas.union_all(genres):
+            if facet == 'genre':
+                result['genres'].append([value, count])
+            else:
+                result['areas'].append([value, state, count])
+        result['genres'].sort(key=lambda item: (-item[1], item[0]))
+        result['areas'].sort(key=lambda item: (-item[2], item[1] or '', item[0] or ''))
+        return result
+
+    def counts(self, filters=NO_FILTERS):
+        return self.cache.get_or_load(self.kind, filters, lambda: self.load(filters))
+
+    def rebuild(self):
+        # rebuilds the whole index from the genres column, e.g. after a bulk
+        # import that bypassed the mapper events
+        table = self.index.__table__
+        key = self.key.key
+        self.db.session.execute(table.delete())
+        rows = []
+        for id, genres in self.db.session.query(self.model.id, self.model.genres).yield_per(1000):
+            rows.extend({'genre': genre, key: id} for genre in set(genres or ()))
+            if len(rows) >= 5000:
+                self.db.session.execute(table.insert(), rows)
+                rows = []
+        if rows:
+            self.db.session.execute(table.insert(), rows)
+        self.db.session.commit()
+        self.cache.invalidate(self.kind)
@@ -0,0 +1,65 @@
+import multiprocessing
+import os
+
+#----------------------------------------------------------------------------#
+# gunicorn settings: gunicorn -c gunicorn.conf.py wsgi:application
+#
+# Threaded workers (gthread): requests mostly wait on the database, so each
+# worker process serves GUNICORN_THREADS of them at once on one connection
+# pool, and the processes spread the CPU-bound rendering over the cores.
+# Each GUNICORN_* variable overrides its default.
+#----------------------------------------------------------------------------#
+
+def env(name, default, cast=str):
+    value = os.environ.get(name)
+    if value is None or value == '':
+        return default
+    return cast(value)
+
+bind = env('GUNICORN_BIND', '0.0.0.0:%s' % env('PORT', '8000'))
+worker_class = env('GUNICORN_WORKER_CLASS', 'gthread')
+workers = env('GUNICORN_WORKERS', multiprocessing.cpu_count() * 2 + 1, int)
+threads = env('GUNICORN_THREADS', 4, int)
+# connections queued by the kernel while every thread is busy
+backlog = env('GUNICORN_BACKLOG', 2048, int)
+# seconds: a worker silent for longer is killed and replaced; kept above
+# the database statement timeout
+timeout = env('GUNICORN_TIMEOUT', 60, int)
+graceful_timeout = env('GUNICORN_GRACEFUL_TIMEOUT', 30, int)
+keepalive = env('GUNICORN_KEEPALIVE', 5, int)
+# recycle workers now and then, staggered so they do not restart together
+max_requests = env('GUNICORN_MAX_REQUESTS', 2000, int)
+max_requests_jitter = env('GUNICORN_MAX_REQUESTS_JITTER', 200, int)
+# each worker imports the app itself: connection pools, the async read loop
+# and the show boundary thread must not be shared across a fork
+preload_app = False
+accesslog = env('GUNICORN_ACCESSLOG', '-')
+errorlog = env('GUNICORN_ERRORLOG', '-')
+loglevel = env('GUNICORN_LOGLEVEL', 'info')
+
+def on_starting(server):
+    # In the master, with the final settings, before any worker is forked.
+    # Without a shared cache each worker would keep its own, and a write
+    # only clears the one of the worker serving it: the others would serve
+    # stale pages, even right after the edit's redirect. The workers
+    # inherit the environment, so their caches are off.
+    if server.cfg.workers > 1 and not os.environ.get('CACHE_URL'):
+        os.environ['LOCAL_CACHES'] = '0'
+        server.log.warning('%d workers without CACHE_URL: page, payload, facet and feed caches are off, '
+                           'set CACHE_URL to share one', server.cfg.workers)
+
+def post_worker_init(worker):
+    # warn about settings that break or throttle the app with several
+    # workers or threads
+    config = getattr(worker.wsgi, 'config', {})
+    log = worker.log
+    if worker.cfg.workers > 1 and not os.environ.get('SECRET_KEY'):
+        log.warning('%d workers without SECRET_KEY: each signs sessions and CSRF tokens with its own '
+                    'random key', worker.cfg.workers)
+    uri = config.get('SQLALCHEMY_DATABASE_URI') or ''
+    if uri.startswith('sqlite') or config.get('DATABASE_PGBOUNCER'):
+        return
+    connections = config.get('DATABASE_POOL_SIZE', 0) + config.get('DATABASE_MAX_OVERFLOW', 0)
+    if worker.cfg.threads > connections:
+        log.warning('%d threads per worker but at most %d pooled connections: requests will queue for '
+                    'a connection', worker.cfg.threads, connections)
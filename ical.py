@@ -0,0 +1,57 @@
+from dateutil import tz
+
+#----------------------------------------------------------------------------#
+# iCalendar (RFC 5545) feeds.
+#
+# One VEVENT per show, times in UTC so calendar apps need no VTIMEZONE.
+# Text is escaped and lines are folded at 75 octets; lines end in CRLF.
+#----------------------------------------------------------------------------#
+
+PRODID = '-//Fyyur//Show calendar//EN'
+# tz.tzutc() rather than tz.UTC, which only exists from python-dateutil 2.7
+UTC = tz.tzutc()
+
+def escape(text):
+    return (text or '').replace('\\', '\\\\').replace(';', '\\;').replace(',', '\\,').replace(
+        '\r\n', '\\n').replace('\n', '\\n')
+
+def fold(line):
+    # continuation lines start with a space; never split a UTF-8 sequence
+    data = line.encode('utf-8')
+    if len(data) <= 75:
+        return line
+    parts = []
+    limit = 75
+    while len(data) > limit:
+        cut = limit
+        while cut > 0 and (data[cut] & 0xC0) == 0x80:
+            cut -= 1
+        parts.append(data[:cut].decode('utf-8'))
+        data = data[cut:]
+        limit = 74
+    parts.append(data.decode('utf-8'))
+    return '\r\n '.join(parts)
+
+def utc(moment):
+    # aware datetime -> 20301201T200000Z
+    return moment.astimezone(UTC).strftime('%Y%m%dT%H%M%SZ')
+
+def event(uid, start_time, end_time, summary, location=None, url=None, stamp=None):
+    # the lines of one VEVENT; times are aware datetimes
+    lines = ['BEGIN:VEVENT', 'UID:' + uid, 'DTSTAMP:' + utc(stamp or start_time),
+             'DTSTART:' + utc(start_time), 'DTEND:' + utc(end_time), 'SUMMARY:' + escape(summary)]
+    if location:
+        lines.append('LOCATION:' + escape(location))
+    if url:
+        lines.append('URL:' + url)
+    lines.append('END:VEVENT')
+    return lines
+
+def calendar(name, events):
+    # events: iterables of VEVENT lines
+    lines = ['BEGIN:VCALENDAR', 'VERSION:2.0', 'PRODID:' + PRODID, 'CALSCALE:GREGORIAN', 'METHOD:PUBLISH',
+             'X-WR-CALNAME:' + escape(name)]
+    for lines_of_event in events:
+        lines.extend(lines_of_event)
+    lines.append('END:VCALENDAR')
+    return ''.join(fold(line) + '\r\n' for line in lines)
@@ -0,0 +1,48 @@
+from sqlalchemy import func
+from schedule import overlap_clauses
+
+#----------------------------------------------------------------------------#
+# Artist/venue matching.
+#
+# For an artist and a time window: the venues seeking talent in the artist's
+# state that list at least one of its genres and have no show booked in the
+# window, most genres in common first; and the same the other way round.
+# One query answers it: the seeking/state index picks the candidates, the
+# genre index tables of facets.py count the common genres, and a NOT EXISTS
+# range probe of the (venue_id, start_time) or (artist_id, start_time) show
+# index drops the booked ones.
+#----------------------------------------------------------------------------#
+
+class Matching(object):
+
+    def __init__(self, db, model, index, seeking, show_key, show):
+        # finds model rows: index is the model's genre table, seeking its
+        # seeking_* flag, show_key the Show column booking it
+        self.db = db
+        self.model = model
+        self.index = index
+        self.key = getattr(index, model.__tablename__.lower() + '_id')
+        self.seeking = seeking
+        self.show_key = show_key
+        self.show = show
+
+    def query(self, genres, state, start_time, end_time, limit=50):
+        model, show = self.model, self.show
+        common = func.count().label('genre_overlap')
+        booked = self.db.session.query(show.id).filter(
+            *overlap_clauses(self.show_key, model.id, show.start_time, show.end_time, start_time, end_time)
+        ).exists()
+        return self.db.session.query(
+            model.id, model.name, model.city, model.state, model.image_link, common
+        ).join(self.index, self.key == model.id).filter(
+            self.index.genre.in_(sorted(set(genres))), self.seeking == True, model.state == state, ~booked
+        ).group_by(
+            model.id, model.name, model.city, model.state, model.image_link
+        ).order_by(common.desc(), model.name, model.id).limit(limit)
+
+    def find(self, genres, state, start_time, end_time, limit=50):
+        # [{'id', 'name', 'city', 'state', 'image_link', 'genre_overlap'}]
+        if not genres or not state:
+            return []
+        keys = ('id', 'name', 'city', 'state', 'image_link', 'genre_overlap')
+        return [dict(zip(keys, row)) for row in self.query(genres, state, start_time, end_time, limit)]
@@ -0,0 +1,272 @@
+import re
+import threading
+import time
+from collections import Counter
+from flask import Response, before_render_template, g, has_request_context, request, template_rendered
+from sqlalchemy import event, exc
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.pool import QueuePool
+
+#----------------------------------------------------------------------------#
+# Request instrumentation.
+#
+# Records, per endpoint, the number of SQL statements, time spent in SQL,
+# time spent rendering templates and total latency, and serves them in the
+# Prometheus text format. A statement shape repeated more than the N+1
+# threshold within one request is logged as a likely N+1 pattern. The
+# database pool is instrumented too: time to check out a connection,
+# checkout timeouts, and connections in use against the pool's capacity.
+#----------------------------------------------------------------------------#
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+CHECKOUT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+def statement_shape(statement):
+    # collapse literals and IN-list lengths so repeats of one query compare equal
+    shape = re.sub(r'\s+', ' ', statement)
+    shape = re.sub(r"'[^']*'", '?', shape)
+    shape = re.sub(r'\b\d+\b', '?', shape)
+    placeholder = r'(?:\?|%\(\w+\)s|%s|:\w+)'
+    shape = re.sub(r'\(%s(?:\s*,\s*%s)*\)' % (placeholder, placeholder), '(?)', shape)
+    return shape.strip()
+
+def escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def format_number(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Histogram(object):
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+        self.sum += value
+        self.count += 1
+
+    def samples(self, name, labels):
+        label = ','.join('%s="%s"' % (k, escape_label(v)) for k, v in labels)
+        prefix = label + ',' if label else ''
+        suffix = '{%s}' % label if label else ''
+        for bound, count in zip(self.buckets, self.counts):
+            yield '%s_bucket{%sle="%s"} %d' % (name, prefix, format_number(bound), count)
+        yield '%s_bucket{%sle="+Inf"} %d' % (name, prefix, self.count)
+        yield '%s_sum%s %s' % (name, suffix, format_number(self.sum))
+        yield '%s_count%s %d' % (name, suffix, self.count)
+
+
+class PoolStats(object):
+    # checkout timing and usage of one engine's pool
+
+    def __init__(self):
+        self.checkout = Histogram(CHECKOUT_BUCKETS)
+        self.timeouts = 0
+        self.checked_out = 0
+        self.capacity = None
+
+
+class Metrics(object):
+
+    HISTOGRAMS = (
+        ('request_duration_seconds', 'Total request latency.', LATENCY_BUCKETS),
+        ('sql_duration_seconds', 'Time spent executing SQL per request.', LATENCY_BUCKETS),
+        ('template_render_seconds', 'Time spent rendering templates per request.', LATENCY_BUCKETS),
+        ('sql_queries', 'SQL statements issued per request.', QUERY_COUNT_BUCKETS),
+    )
+
+    def __init__(self, app=None, prefix='fyyur'):
+        self.prefix = prefix
+        self.lock = threading.Lock()
+        self.histograms = dict((name, {}) for name, help, buckets in self.HISTOGRAMS)
+        self.n_plus_one = Counter()
+        self.gauges = []
+        # {pool label: PoolStats}, one per engine
+        self.pools = {}
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        app.extensions['metrics'] = self
+        self.threshold = app.config.get('METRICS_N_PLUS_ONE_THRESHOLD', 10)
+        self.instrument_pool(app.config)
+        event.listen(Engine, 'before_cursor_execute', self.before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', self.after_cursor_execute)
+        before_render_template.connect(self.before_render, app)
+        template_rendered.connect(self.after_render, app)
+        app.before_request(self.before_request)
+        app.teardown_request(self.teardown_request)
+        app.add_url_rule('/metrics', 'metrics', self.render)
+
+    def instrument_pool(self, config):
+        # Swaps the primary engine's pool class for one that times checkouts.
+        # Has to run before the SQLAlchemy extension creates the engine.
+        options = config.get('SQLALCHEMY_ENGINE_OPTIONS') or {}
+        config['SQLALCHEMY_ENGINE_OPTIONS'] = self.pool_options(options, config['SQLALCHEMY_DATABASE_URI'], 'primary')
+
+    def pool_options(self, options, url, label):
+        # A copy of options whose pool class times checkouts into its own
+        # stats under label. Every engine needs its own label: the timing
+        # state lives on the class, so a shared class would mix the pools.
+        options = dict(options)
+        # options already instrumented for another engine: start over from
+        # the pool class the config chose, if it chose one
+        configured = options.get('poolclass')
+        configured = getattr(configured, 'configured', configured)
+        base = configured
+        if base is None:
+            url = make_url(url)
+            base = url.get_dialect().get_pool_class(url)
+        stats = self.pools[label] = PoolStats()
+        if issubclass(base, QueuePool):
+            # QueuePool's own defaults when the options leave them out
+            stats.capacity = options.get('pool_size', 5) + max(options.get('max_overflow', 10), 0)
+        options['poolclass'] = self.timed_pool(base, stats)
+        options['poolclass'].configured = configured
+        return options
+
+    def timed_pool(self, base, stats):
+        metrics = self
+
+        class TimedPool(base):
+
+            def connect(self):
+                start = time.perf_counter()
+                try:
+                    return base.connect(self)
+                except exc.TimeoutError:
+                    with metrics.lock:
+                        stats.timeouts += 1
+                    raise
+                finally:
+                    elapsed = time.perf_counter() - start
+                    with metrics.lock:
+                        stats.checkout.observe(elapsed)
+
+        def checkout(dbapi_connection, connection_record, connection_proxy):
+            with metrics.lock:
+                stats.checked_out += 1
+
+        def checkin(dbapi_connection, connection_record):
+            with metrics.lock:
+                stats.checked_out -= 1
+
+        event.listen(TimedPool, 'checkout', checkout)
+        event.listen(TimedPool, 'checkin', checkin)
+        return TimedPool
+
+    def gauge(self, name, help, function, type='gauge'):
+        # function() is sampled every time /metrics is scraped
+        self.gauges.append((name, help, function, type))
+
+    def before_request(self):
+        g.metrics = {
+            'start': time.perf_counter(),
+            'queries': 0,
+            'sql_time': 0.0,
+            'render_time': 0.0,
+            'shapes': Counter(),
+        }
+
+    def before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        if has_request_context() and 'metrics' in g:
+            conn.info.setdefault('metrics_start', []).append(time.perf_counter())
+
+    def after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        if not (has_request_context() and 'metrics' in g) or not conn.info.get('metrics_start'):
+            return
+        elapsed = time.perf_counter() - conn.info['metrics_start'].pop()
+        g.metrics['queries'] += 1
+        g.metrics['sql_time'] += elapsed
+        g.metrics['shapes'][statement_shape(statement)] += 1
+
+    def before_render(self, sender, template, context, **extra):
+        if 'metrics' in g:
+            g.metrics.setdefault('render_start', []).append(time.perf_counter())
+
+    def after_render(self, sender, template, context, **extra):
+        if 'metrics' in g and g.metrics.get('render_start'):
+            g.metrics['render_time'] += time.perf_counter() - g.metrics['render_start'].pop()
+
+    def teardown_request(self, exception=None):
+        metrics = g.pop('metrics', None)
+        if metrics is None:
+            return
+        endpoint = request.endpoint or '<unmatched>'
+        observed = {
+            'request_duration_seconds': time.perf_counter() - metrics['start'],
+            'sql_duration_seconds': metrics['sql_time'],
+            'template_render_seconds': metrics['render_time'],
+            'sql_queries': metrics['queries'],
+        }
+        repeated = [(shape, n) for shape, n in metrics['shapes'].items() if n > self.threshold]
+        with self.lock:
+            for name, help, buckets in self.HISTOGRAMS:
+                histogram = self.histograms[name].get(endpoint)
+                if histogram is None:
+                    histogram = self.histograms[name][endpoint] = Histogram(buckets)
+                histogram.observe(observed[name])
+            if repeated:
+                self.n_plus_one[endpoint] += 1
+        for shape, n in repeated:
+            self.app.logger.warning('possible N+1 in %s: %d x %s', endpoint, n, shape[:300])
+
+    def exposition(self):
+        lines = []
+        with self.lock:
+            for name, help, buckets in self.HISTOGRAMS:
+                full_name = '%s_%s' % (self.prefix, name)
+                lines.append('# HELP %s %s' % (full_name, help))
+                lines.append('# TYPE %s histogram' % full_name)
+                for endpoint in sorted(self.histograms[name]):
+                    lines.extend(self.histograms[name][endpoint].samples(full_name, [('endpoint', endpoint)]))
+            full_name = '%s_n_plus_one_requests_total' % self.prefix
+            lines.append('# HELP %s Requests that repeated one statement shape more than the threshold.' % full_name)
+            lines.append('# TYPE %s counter' % full_name)
+            for endpoint in sorted(self.n_plus_one):
+                lines.append('%s{endpoint="%s"} %d' % (full_name, escape_label(endpoint), self.n_plus_one[endpoint]))
+            full_name = '%s_db_pool_checkout_seconds' % self.prefix
+            lines.append('# HELP %s Time to check a connection out of the pool, including any wait.' % full_name)
+            lines.append('# TYPE %s histogram' % full_name)
+            for label in sorted(self.pools):
+                lines.extend(self.pools[label].checkout.samples(full_name, [('pool', label)]))
+            # capacity and utilization only for pools that have a limit
+            limited = [label for label in sorted(self.pools) if self.pools[label].capacity]
+            pool = [
+                ('db_pool_checkout_timeouts_total', 'Checkouts that gave up waiting for a connection.', 'counter',
+                 sorted(self.pools), lambda stats: stats.timeouts),
+                ('db_pool_checked_out', 'Connections currently checked out.', 'gauge',
+                 sorted(self.pools), lambda stats: stats.checked_out),
+                ('db_pool_capacity', 'Pool size plus max overflow.', 'gauge',
+                 limited, lambda stats: stats.capacity),
+                ('db_pool_utilization', 'Checked out connections over capacity.', 'gauge',
+                 limited, lambda stats: stats.checked_out / float(stats.capacity)),
+            ]
+            for name, help, type, labels, value in pool:
+                if not labels:
+                    continue
+                full_name = '%s_%s' % (self.prefix, name)
+                lines.append('# HELP %s %s' % (full_name, help))
+                lines.append('# TYPE %s %s' % (full_name, type))
+                for label in labels:
+                    lines.append('%s{pool="%s"} %s' % (full_name, escape_label(label), format_number(value(self.pools[label]))))
+        for name, help, function, type in self.gauges:
+            full_name = '%s_%s' % (self.prefix, name)
+            lines.append('# HELP %s %s' % (full_name, help))
+            lines.append('# TYPE %s %s' % (full_name, type))
+            lines.append('%s %s' % (full_name, format_number(function())))
+        return '\n'.join(lines) + '\n'
+
+    def render(self):
+        return Response(self.exposition(), mimetype='text/plain; version=0.0.4')
@@ -0,0 +1,56 @@
+"""add show end times and booking exclusion constraints
+
+Revision ID: 9f1c5e2a7b64
+Revises: 4b9e2c7d1a38
+Create Date: 2026-10-18 19:41:09.552814
+
+Existing shows get the default two hour duration, cut short where the venue
+or artist has a later show that starts sooner. Shows of one venue or artist
+with the same start time are real double bookings: the upgrade lists them
+and stops until they are moved or deleted. Shows without a start time keep
+a NULL end time and are left out of the constraints: tsrange(NULL, NULL)
+is unbounded and would overlap every other booking.
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9f1c5e2a7b64'
+down_revision = '4b9e2c7d1a38'
+branch_labels = None
+depends_on = None
+
+BOOKED = 'start_time IS NOT NULL AND end_time IS NOT NULL'
+
+
+def upgrade():
+    op.add_column('Show', sa.Column('end_time', sa.DateTime(), nullable=True))
+    op.execute('''
+        UPDATE "Show" s SET end_time = LEAST(
+            s.start_time + interval '120 minutes',
+            (SELECT min(o.start_time) FROM "Show" o WHERE o.venue_id = s.venue_id AND o.start_time > s.start_time),
+            (SELECT min(o.start_time) FROM "Show" o WHERE o.artist_id = s.artist_id AND o.start_time > s.start_time)
+        )
+    ''')
+    doubles = op.get_bind().execute(sa.text('''
+        SELECT a.id, b.id FROM "Show" a JOIN "Show" b
+        ON a.id < b.id AND a.start_time = b.start_time AND (a.venue_id = b.venue_id OR a.artist_id = b.artist_id)
+        ORDER BY a.id, b.id
+    ''')).fetchall()
+    if doubles:
+        raise RuntimeError('double booked shows, move or delete one of each pair first: ' +
+                           ', '.join('%d/%d' % (a, b) for a, b in doubles))
+    op.execute('CREATE EXTENSION IF NOT EXISTS btree_gist')
+    # raw DDL: op.create_exclude_constraint cannot name the tsrange()
+    # expression column and fails before emitting anything
+    for name, column in (('ex_Show_venue_booking', 'venue_id'), ('ex_Show_artist_booking', 'artist_id')):
+        op.execute('ALTER TABLE "Show" ADD CONSTRAINT "%s" EXCLUDE USING gist '
+                   '(%s WITH =, tsrange(start_time, end_time) WITH &&) WHERE (%s)' % (name, column, BOOKED))
+
+
+def downgrade():
+    op.drop_constraint('ex_Show_artist_booking', 'Show')
+    op.drop_constraint('ex_Show_venue_booking', 'Show')
+    op.drop_column('Show', 'end_time')
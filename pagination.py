@@ -0,0 +1,100 @@
+import base64
+import datetime
+import json
+import dateutil.parser
+from sqlalchemy import tuple_
+
+#----------------------------------------------------------------------------#
+# Keyset pagination.
+#
+# A page is addressed by the sort key of the row just outside it rather than
+# by an offset, so fetching page 1000 costs the same index range scan as
+# fetching page 1. Cursors are opaque urlsafe strings holding that key;
+# each value is checked against its column's type when decoded, so a
+# tampered cursor is a 400 rather than a bad comparison in SQL.
+#
+# Rows with a NULL sort key cannot be placed in the order and are never
+# listed. The forms and the bulk import require every key the listings sort
+# on (names, city/state, start times), so only rows written around the app
+# can have one.
+#----------------------------------------------------------------------------#
+
+class Page(object):
+
+    def __init__(self, items, limit, next_cursor=None, prev_cursor=None):
+        self.items = items
+        self.limit = limit
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+
+def encode_cursor(values):
+    values = [v.isoformat() if isinstance(v, datetime.datetime) else v for v in values]
+    return base64.urlsafe_b64encode(json.dumps(values).encode('utf-8')).decode('ascii').rstrip('=')
+
+def decode_cursor(cursor, keys):
+    # raises ValueError for anything that is not a cursor for these keys
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')).decode('utf-8'))
+    except (TypeError, UnicodeError, json.JSONDecodeError, base64.binascii.Error):
+        raise ValueError('invalid cursor')
+    if not isinstance(values, list) or len(values) != len(keys):
+        raise ValueError('invalid cursor')
+    return [decode_value(key, value) for key, value in zip(keys, values)]
+
+def decode_value(key, value):
+    # value as the Python type of the key column, or ValueError
+    try:
+        python_type = key.type.python_type
+    except NotImplementedError:
+        python_type = None
+    if python_type is datetime.datetime:
+        if not isinstance(value, str):
+            raise ValueError('invalid cursor')
+        try:
+            return dateutil.parser.parse(value)
+        except (ValueError, OverflowError):
+            raise ValueError('invalid cursor')
+    # JSON has no NULL keys to offer here, and bool is an int to Python
+    if value is None or isinstance(value, bool):
+        raise ValueError('invalid cursor')
+    if python_type in (int, str, float):
+        if not isinstance(value, python_type):
+            raise ValueError('invalid cursor')
+    elif not isinstance(value, (int, str, float)):
+        raise ValueError('invalid cursor')
+    return value
+
+def row_key(row, keys):
+    return [getattr(row, key.key) for key in keys]
+
+def paginate(query, keys, after=None, before=None, limit=50, row_type=None):
+    # keys are the columns of a unique ascending sort order, e.g.
+    # (Show.start_time, Show.id); rows with a NULL key are not listed.
+    # With row_type, items are that named tuple type (see rows.py).
+    query = query.filter(*[key.isnot(None) for key in keys])
+    if before is not None:
+        values = decode_cursor(before, keys)
+        rows = query.filter(tuple_(*keys) < tuple_(*values)).order_by(
+            *[key.desc() for key in keys]
+        ).limit(limit + 1).all()
+        has_prev = len(rows) > limit
+        items = list(reversed(rows[:limit]))
+        has_next = True
+    else:
+        if after is not None:
+            values = decode_cursor(after, keys)
+            query = query.filter(tuple_(*keys) > tuple_(*values))
+        rows = query.order_by(*keys).limit(limit + 1).all()
+        has_next = len(rows) > limit
+        items = rows[:limit]
+        has_prev = after is not None
+    if row_type is not None:
+        items = [row_type._make(row) for row in items]
+
+    return Page(
+        items,
+        limit,
+        next_cursor=encode_cursor(row_key(items[-1], keys)) if has_next and items else None,
+        prev_cursor=encode_cursor(row_key(items[0], keys)) if has_prev and items else None
+    )
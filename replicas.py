@@ -0,0 +1,190 @@
+import contextlib
+import functools
+import random
+import threading
+import time
+from collections import Counter
+from flask import g, has_request_context, request
+from flask_sqlalchemy.session import Session as FlaskSession
+from sqlalchemy import create_engine, event, exc, text
+from sqlalchemy.orm import Session
+from sqlalchemy.sql.selectable import Select
+
+#----------------------------------------------------------------------------#
+# Read replica routing.
+#
+# Views wrapped in read_only() send their SELECTs to a replica; everything
+# else, and any request that has written, uses the primary. A replica is
+# only used while it answers and lags the primary by at most REPLICA_MAX_LAG
+# seconds, checked at most every REPLICA_CHECK_INTERVAL seconds. A client
+# that wrote gets a cookie that keeps its reads on the primary for
+# REPLICA_STICKY_SECONDS, long enough for the replicas to catch up, so it
+# sees its own writes.
+#----------------------------------------------------------------------------#
+
+STICKY_COOKIE = 'fyyur_primary_until'
+
+# seconds behind the primary; 0 while the replica has replayed all it received
+LAG_SQL = {
+    'postgresql': """
+        SELECT CASE
+            WHEN NOT pg_is_in_recovery() THEN 0
+            WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+            ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+        END
+    """,
+}
+
+
+class RoutingSession(FlaskSession):
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and not self._flushing and has_request_context():
+            replica = g.get('replica')
+            if replica is not None and not g.get('db_wrote') and is_plain_select(clause):
+                return replica
+        return super(RoutingSession, self).get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+def is_plain_select(clause):
+    return isinstance(clause, Select) and clause._for_update_arg is None
+
+
+class ReplicaRouter(object):
+
+    def __init__(self, app=None):
+        self.engines = []
+        self.lock = threading.Lock()
+        self.health = {}
+        self.decisions = Counter()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        # replicas share the primary's engine options (pool, timeouts), each
+        # with its own instrumented pool so /metrics reports them apart
+        options = app.config.get('SQLALCHEMY_ENGINE_OPTIONS') or {}
+        metrics = app.extensions.get('metrics')
+        self.engines = []
+        for n, url in enumerate(app.config['REPLICA_DATABASE_URLS']):
+            if metrics is not None:
+                self.engines.append(create_engine(url, **metrics.pool_options(options, url, 'replica%d' % n)))
+            else:
+                self.engines.append(create_engine(url, **options))
+        self.max_lag = app.config['REPLICA_MAX_LAG']
+        self.interval = app.config['REPLICA_CHECK_INTERVAL']
+        self.sticky = app.config['REPLICA_STICKY_SECONDS']
+        for engine in self.engines:
+            # checked_at, usable, lag in seconds
+            self.health[engine] = (None, True, None)
+            event.listen(engine, 'handle_error', functools.partial(self.handle_error, engine))
+        event.listen(Session, 'after_flush', self.wrote)
+        event.listen(Session, 'do_orm_execute', self.orm_execute)
+        app.after_request(self.after_request)
+        app.extensions['replicas'] = self
+
+    def read_only(self, view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            # inside primary() the view keeps reading the primary
+            g.replica = None if g.get('primary_only') else self.pick()
+            return view(*args, **kwargs)
+        return wrapper
+
+    @contextlib.contextmanager
+    def primary(self):
+        # reads that must not be stale, e.g. ones whose result gets cached
+        if not has_request_context():
+            yield
+            return
+        replica = g.pop('replica', None)
+        primary_only = g.get('primary_only', False)
+        g.primary_only = True
+        try:
+            yield
+        finally:
+            g.primary_only = primary_only
+            if replica is not None:
+                g.replica = replica
+
+    def is_sticky(self):
+        # whether the client wrote recently enough that its reads stay on
+        # the primary
+        if not self.engines:
+            return False
+        try:
+            return float(request.cookies.get(STICKY_COOKIE, 0)) > time.time()
+        except ValueError:
+            return False
+
+    def pick(self):
+        if not self.engines:
+            return None
+        if self.is_sticky():
+            self.count('sticky')
+            return None
+        engines = list(self.engines)
+        random.shuffle(engines)
+        for engine in engines:
+            if self.usable(engine):
+                self.count('replica')
+                return engine
+        self.count('fallback')
+        return None
+
+    def count(self, decision):
+        with self.lock:
+            self.decisions[decision] += 1
+
+    def usable(self, engine, force=False):
+        now = time.monotonic()
+        with self.lock:
+            checked_at, usable, lag = self.health[engine]
+            if not force and checked_at is not None and now - checked_at < self.interval:
+                return usable
+            # other requests keep the previous verdict while this one checks
+            self.health[engine] = (now, usable, lag)
+        try:
+            lag = self.lag(engine)
+            usable = lag <= self.max_lag
+        except exc.SQLAlchemyError:
+            lag, usable = None, False
+        with self.lock:
+            self.health[engine] = (now, usable, lag)
+        return usable
+
+    def lag(self, engine):
+        with engine.connect() as connection:
+            sql = LAG_SQL.get(engine.dialect.name)
+            if sql is None:
+                # no replication to ask about (e.g. a sqlite copy): only
+                # check that it answers
+                connection.execute(text('SELECT 1'))
+                return 0.0
+            return float(connection.execute(text(sql)).scalar() or 0)
+
+    def handle_error(self, engine, context):
+        # stop routing to a replica that dropped its connection until the
+        # next check finds it back
+        if context.is_disconnect:
+            with self.lock:
+                self.health[engine] = (time.monotonic(), False, None)
+
+    def wrote(self, session, flush_context):
+        if has_request_context():
+            g.db_wrote = True
+
+    def orm_execute(self, state):
+        if (state.is_update or state.is_delete or state.is_insert) and has_request_context():
+            g.db_wrote = True
+
+    def after_request(self, response):
+        if self.engines and g.get('db_wrote'):
+            response.set_cookie(STICKY_COOKIE, '%.3f' % (time.time() + self.sticky),
+                                max_age=int(self.sticky) + 1, httponly=True)
+        return response
+
+    def status(self):
+        # [(url without password, usable, lag)] as of the last check
+        with self.lock:
+            return [(repr(engine.url), self.health[engine][1], self.health[engine][2]) for engine in self.engines]
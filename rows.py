@@ -0,0 +1,35 @@
+from collections import namedtuple
+
+#----------------------------------------------------------------------------#
+# Compact rows.
+#
+# Listings, detail pages and exports select only the columns they display
+# into named tuples instead of loading ORM instances: no identity map entry,
+# no attribute instrumentation, no related objects. Templates read the
+# tuples directly. Large results are iterated in batches with yield_per,
+# which streams them from a server-side cursor on postgres.
+#----------------------------------------------------------------------------#
+
+ShowRow = namedtuple('ShowRow', 'id start_time venue_id venue_name artist_id artist_name artist_image_link')
+# a venue's shows, with the artist each one features
+VenueShowRow = namedtuple('VenueShowRow', 'start_time artist_id artist_name artist_image_link')
+# an artist's shows, with the venue each one is at
+ArtistShowRow = namedtuple('ArtistShowRow', 'start_time venue_id venue_name venue_image_link')
+ArtistRow = namedtuple('ArtistRow', 'id name')
+# a show in a venue's or an artist's calendar
+CalendarRow = namedtuple('CalendarRow', 'id start_time end_time venue_id venue_name venue_address venue_city venue_state '
+                                        'artist_id artist_name')
+
+def row_columns(row_type, **sources):
+    # the select list for row_type: each field's column, labelled with the
+    # field name, in field order
+    return [sources[field].label(field) for field in row_type._fields]
+
+def fetch_rows(query, row_type, batch_size=None):
+    # yields row_type tuples; with batch_size, at most that many rows are
+    # buffered at a time
+    if batch_size:
+        query = query.yield_per(batch_size)
+    make = row_type._make
+    for row in query:
+        yield make(row)
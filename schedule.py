@@ -0,0 +1,116 @@
+import bisect
+import datetime
+from collections import namedtuple
+
+#----------------------------------------------------------------------------#
+# Booking conflicts.
+#
+# A show books its venue and its artist from start_time to end_time; two
+# shows of the same venue or artist may not overlap. Durations are capped at
+# MAX_DURATION, so every booking that can overlap [start, end) starts within
+# [start - MAX_DURATION, end): a bounded range of the (venue_id, start_time)
+# and (artist_id, start_time) indexes, or of the start-sorted lists of
+# ScheduleIndex, found by bisection instead of scanning a whole schedule.
+# On postgres, exclusion constraints on tsrange(start_time, end_time) also
+# refuse overlapping rows in the database itself.
+#----------------------------------------------------------------------------#
+
+DEFAULT_DURATION_MINUTES = 120
+MAX_DURATION_MINUTES = 24 * 60
+DEFAULT_DURATION = datetime.timedelta(minutes=DEFAULT_DURATION_MINUTES)
+MAX_DURATION = datetime.timedelta(minutes=MAX_DURATION_MINUTES)
+
+# a booking that overlaps another of the same venue or artist; ref and
+# other_ref name the two bookings, e.g. ('show', 17) or ('line', 12)
+Conflict = namedtuple('Conflict', 'kind key ref start_time end_time other_ref other_start other_end')
+
+def show_end_time(start_time, duration=None, end_time=None):
+    # end_time if given, else start_time + duration minutes (default 2 hours);
+    # ValueError for empty or over-long bookings
+    if end_time is None:
+        end_time = start_time + datetime.timedelta(minutes=duration or DEFAULT_DURATION_MINUTES)
+    if end_time <= start_time:
+        raise ValueError('The show must end after it starts.')
+    if end_time - start_time > MAX_DURATION:
+        raise ValueError('A show may last at most %d hours.' % (MAX_DURATION_MINUTES // 60))
+    return end_time
+
+def overlap_clauses(column, key, start_column, end_column, start_time, end_time):
+    # WHERE clauses for the bookings of column == key overlapping
+    # [start_time, end_time); the lower start_time bound keeps it an index
+    # range scan
+    return [column == key, start_column >= start_time - MAX_DURATION, start_column < end_time, end_column > start_time]
+
+def describe(conflict):
+    # "venue 3 is already booked from ... to ... (show 17)"
+    other = '%s %s' % conflict.other_ref
+    if conflict.other_ref[0] == 'line':
+        other += ' of this file'
+    return '%s %s is already booked from %s to %s (%s).' % (
+        conflict.kind, conflict.key, conflict.other_start.strftime('%Y-%m-%d %H:%M'),
+        conflict.other_end.strftime('%Y-%m-%d %H:%M'), other)
+
+
+class ScheduleIndex(object):
+    # In-memory bookings per (kind, key), e.g. ('venue', 3), as lists of
+    # (start_time, end_time, ref) sorted by start_time. Used to validate a
+    # batch of shows against each other and the ones loaded from the
+    # database without a query per show.
+
+    def __init__(self):
+        self.bookings = {}
+
+    def __len__(self):
+        return sum(len(items) for items in self.bookings.values())
+
+    def overlapping(self, kind, key, start_time, end_time):
+        items = self.bookings.get((kind, key), ())
+        low = bisect.bisect_left(items, (start_time - MAX_DURATION,))
+        high = bisect.bisect_left(items, (end_time,))
+        return [item for item in items[low:high] if item[1] > start_time]
+
+    def add(self, kind, key, start_time, end_time, ref):
+        bisect.insort(self.bookings.setdefault((kind, key), []), (start_time, end_time, ref))
+
+    def remove(self, kind, key, start_time, end_time, ref):
+        items = self.bookings.get((kind, key), [])
+        i = bisect.bisect_left(items, (start_time, end_time, ref))
+        if i < len(items) and items[i] == (start_time, end_time, ref):
+            del items[i]
+
+    def conflicts(self, venue_id, artist_id, start_time, end_time, ref):
+        # the bookings this show would overlap, for its venue and its artist
+        found = []
+        for kind, key in (('venue', venue_id), ('artist', artist_id)):
+            for other_start, other_end, other_ref in self.overlapping(kind, key, start_time, end_time):
+                found.append(Conflict(kind, key, ref, start_time, end_time, other_ref, other_start, other_end))
+        return found
+
+    def book(self, venue_id, artist_id, start_time, end_time, ref):
+        # adds the show unless it conflicts; returns the conflicts
+        found = self.conflicts(venue_id, artist_id, start_time, end_time, ref)
+        if not found:
+            self.add('venue', venue_id, start_time, end_time, ref)
+            self.add('artist', artist_id, start_time, end_time, ref)
+        return found
+
+    def unbook(self, venue_id, artist_id, start_time, end_time, ref):
+        self.remove('venue', venue_id, start_time, end_time, ref)
+        self.remove('artist', artist_id, start_time, end_time, ref)
+
+
+def sweep_conflicts(kind, rows):
+    # rows: (key, start_time, end_time, id) ordered by key, start_time, e.g.
+    # a whole table streamed from the index; yields each overlapping pair
+    # once. Only the bookings still running are held, so memory stays flat.
+    active = []
+    current = None
+    for key, start_time, end_time, id in rows:
+        if start_time is None or end_time is None:
+            continue
+        if key != current:
+            current, active = key, []
+        active = [item for item in active if item[1] > start_time]
+        for other_start, other_end, other_id in active:
+            yield Conflict(kind, key, ('show', id), start_time, end_time, ('show', other_id), other_start, other_end)
+        active.append((start_time, end_time, id))
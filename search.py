@@ -0,0 +1,183 @@
+import abc
+import threading
+from sqlalchemy import event, func
+from sqlalchemy.orm import Session
+
+#----------------------------------------------------------------------------#
+# Name search.
+#
+# Venues and artists are searched by case-insensitive substring match on the
+# name, ranked by trigram similarity, capped, and returned with their number
+# of upcoming shows from the show count summary table. On postgres this runs
+# as one query against a pg_trgm GIN index; elsewhere (sqlite test runs) an
+# in-process trigram index is used. Results can be narrowed to genres and a
+# city/state with the filters of facets.py.
+#----------------------------------------------------------------------------#
+
+def escape_like(term):
+    return term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+def trigrams(text):
+    # pg_trgm style: lowercase, each word padded with two leading blanks and
+    # one trailing blank
+    result = set()
+    for word in text.lower().split():
+        padded = '  ' + word + ' '
+        for i in range(len(padded) - 2):
+            result.add(padded[i:i + 3])
+    return result
+
+def similarity(a, b):
+    a, b = trigrams(a), trigrams(b)
+    if not a or not b:
+        return 0.0
+    return len(a & b) / float(len(a | b))
+
+
+class SearchBackend(abc.ABC):
+
+    def __init__(self, db, model, counts_key, counts_upcoming, limit=50, facets=None):
+        # counts_key/counts_upcoming: entity id and upcoming count columns
+        # of the summary table, e.g. VenueShowCount.venue_id/.upcoming;
+        # facets: the model's Facets, needed to filter
+        self.db = db
+        self.model = model
+        self.counts_key = counts_key
+        self.counts_upcoming = counts_upcoming
+        self.limit = limit
+        self.facets = facets
+
+    @abc.abstractmethod
+    def search(self, term, filters=None):
+        # returns {'count': total matches, 'data': [{'id', 'name', 'num_upcoming_shows'}]}
+        pass
+
+    def invalidate(self):
+        # called after writes the backend cannot observe, e.g. bulk inserts
+        pass
+
+
+class TrigramSearch(SearchBackend):
+    # ILIKE '%term%' is served by the gin_trgm_ops index on the name column
+
+    def search(self, term, filters=None):
+        model = self.model
+        rank = func.similarity(model.name, term)
+        rows = self.db.session.query(
+            model.id, model.name,
+            func.coalesce(self.counts_upcoming, 0).label('num_upcoming_shows'),
+            func.count().over().label('total')
+        ).outerjoin(self.counts_key.class_, self.counts_key == model.id).filter(
+            model.name.ilike('%' + escape_like(term) + '%', escape='\\'),
+            *(self.facets.clauses(filters) if filters else ())
+        ).order_by(rank.desc(), model.name, model.id).limit(self.limit).all()
+
+        return {
+            'count': rows[0].total if rows else 0,
+            'data': [{
+                'id': row.id,
+                'name': row.name,
+                'num_upcoming_shows': row.num_upcoming_shows
+            } for row in rows]
+        }
+
+
+class InMemorySearch(SearchBackend):
+    # Keeps (id, name) rows and an inverted index of raw name trigrams. The
+    # index is dropped whenever a committed transaction wrote to the model and
+    # rebuilt lazily on the next search.
+
+    def __init__(self, *args, **kwargs):
+        super(InMemorySearch, self).__init__(*args, **kwargs)
+        self.lock = threading.Lock()
+        self.names = None
+        self.postings = None
+        event.listen(Session, 'after_flush', self.after_flush)
+        event.listen(Session, 'after_commit', self.after_commit)
+
+    def after_flush(self, session, flush_context):
+        for instance in list(session.new) + list(session.dirty) + list(session.deleted):
+            if isinstance(instance, self.model):
+                session.info[self] = True
+                return
+
+    def after_commit(self, session):
+        if session.info.pop(self, False):
+            self.invalidate()
+
+    def invalidate(self):
+        with self.lock:
+            self.names = None
+            self.postings = None
+
+    def build(self):
+        names = {}
+        postings = {}
+        for id, name in self.db.session.query(self.model.id, self.model.name):
+            name = name or ''
+            names[id] = name
+            lowered = name.lower()
+            for i in range(len(lowered) - 2):
+                postings.setdefault(lowered[i:i + 3], set()).add(id)
+        return names, postings
+
+    def candidates(self, lowered):
+        with self.lock:
+            if self.names is None:
+                self.names, self.postings = self.build()
+            names, postings = self.names, self.postings
+        if len(lowered) < 3:
+            return names, names.keys()
+        ids = None
+        for i in range(len(lowered) - 2):
+            posting = postings.get(lowered[i:i + 3], set())
+            ids = posting if ids is None else ids & posting
+            if not ids:
+                return names, ()
+        return names, ids
+
+    def search(self, term, filters=None):
+        lowered = term.lower()
+        names, ids = self.candidates(lowered)
+        if filters and any(filters):
+            ids = self.facets.matching_ids(filters).intersection(ids)
+        matches = [(id, names[id]) for id in ids if lowered in names[id].lower()]
+        matches.sort(key=lambda match: (-similarity(match[1], term), match[1], match[0]))
+        hits = matches[:self.limit]
+
+        counts = {}
+        if hits:
+            counts = dict(self.db.session.query(self.counts_key, self.counts_upcoming).filter(
+                self.counts_key.in_([id for id, name in hits])
+            ).all())
+
+        return {
+            'count': len(matches),
+            'data': [{
+                'id': id,
+                'name': name,
+                'num_upcoming_shows': counts.get(id, 0)
+            } for id, name in hits]
+        }
+
+
+class Search(object):
+    # Picks the backend for the bound database on first use, since the engine
+    # is only reachable inside an application context.
+
+    def __init__(self, db, model, counts_key, counts_upcoming, limit=50, facets=None):
+        self.args = (db, model, counts_key, counts_upcoming, limit, facets)
+        self.backend = None
+
+    def search(self, term, filters=None):
+        if self.backend is None:
+            db = self.args[0]
+            if db.engine.dialect.name == 'postgresql':
+                self.backend = TrigramSearch(*self.args)
+            else:
+                self.backend = InMemorySearch(*self.args)
+        return self.backend.search(term, filters)
+
+    def invalidate(self):
+        if self.backend is not None:
+            self.backend.invalidate()
@@ -0,0 +1,116 @@
+import gzip
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from flask import Flask, render_template_string
+from assets import IMMUTABLE, Assets, bundle, minify_css, minify_js
+
+#----------------------------------------------------------------------------#
+# Static asset bundles, built from a scratch static folder: minification,
+# fingerprinted names, the source files before a build, and the
+# precompressed, immutable responses after it.
+#----------------------------------------------------------------------------#
+
+BUNDLES = {
+    'site.css': ['css/a.css', 'css/b.css'],
+    'site.js': ['js/a.js', 'js/b.min.js'],
+}
+
+SOURCES = {
+    'css/a.css': '/*! license */\nbody {\n  color: red;\n}\n/* note */\na { content: "a  ;  b"; }\n',
+    'css/b.css': 'p{margin:0;}\n',
+    'js/a.js': 'var a = 1  \n\n\nvar b = 2\n',
+    'js/b.min.js': 'var c=3;\n',
+}
+
+class MinifyTest(unittest.TestCase):
+
+    def test_css(self):
+        # comments go but a /*! license */, quoted strings are kept as they are
+        self.assertEqual(minify_css(SOURCES['css/a.css']), '/*! license */\n body{color:red} a{content:"a  ;  b"}')
+
+    def test_js(self):
+        self.assertEqual(minify_js('var c=3;\n', 'b.min.js'), 'var c=3;')
+        # whatever minifier is installed, the statements survive
+        self.assertIn('2', minify_js(SOURCES['js/a.js'], 'a.js'))
+
+
+class AssetsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.static = tempfile.mkdtemp()
+        for source, text in SOURCES.items():
+            os.makedirs(os.path.join(self.static, os.path.dirname(source)), exist_ok=True)
+            with open(os.path.join(self.static, source), 'w') as f:
+                f.write(text)
+        self.app = Flask(__name__, static_folder=self.static, static_url_path='/static')
+        self.assets = Assets(self.app, BUNDLES)
+        self.client = self.app.test_client()
+
+    def tearDown(self):
+        shutil.rmtree(self.static)
+
+    def urls(self, name):
+        with self.app.test_request_context():
+            return render_template_string("{{ asset_urls('%s')|join(' ') }}" % name).split()
+
+    def test_sources_before_a_build(self):
+        self.assertEqual(self.urls('site.css'), ['/static/css/a.css', '/static/css/b.css'])
+
+    def test_build(self):
+        report = dict((name, (filename, minified, gzipped)) for name, filename, size, minified, gzipped, brotli
+                      in self.assets.build())
+        with open(os.path.join(self.static, 'dist', 'manifest.json')) as f:
+            manifest = json.load(f)
+        self.assertEqual(manifest, dict((name, report[name][0]) for name in BUNDLES))
+        self.assertRegex(manifest['site.css'], r'^site\.[0-9a-f]{12}\.css$')
+        self.assertEqual(self.urls('site.css'), ['/static/dist/' + manifest['site.css']])
+        path = os.path.join(self.static, 'dist', manifest['site.js'])
+        with open(path) as f:
+            self.assertEqual(f.read(), bundle(self.static, 'site.js', BUNDLES['site.js']))
+        with open(path + '.gz', 'rb') as f:
+            self.assertEqual(len(f.read()), report['site.js'][2])
+        # same sources, same name and bytes
+        self.assertEqual(dict((name, filename) for name, filename, size, minified, gzipped, brotli
+                              in self.assets.build()), manifest)
+
+    def test_serve(self):
+        self.assets.build()
+        filename = self.assets.manifest['site.css']
+        response = self.client.get('/static/dist/' + filename, headers={'Accept-Encoding': 'gzip'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+        self.assertEqual(response.headers['Cache-Control'], IMMUTABLE)
+        self.assertIn('Accept-Encoding', response.headers['Vary'])
+        self.assertEqual(response.mimetype, 'text/css')
+        self.assertIn(b'color:red', gzip.decompress(response.get_data()))
+        response = self.client.get('/static/dist/' + filename)
+        self.assertNotIn('Content-Encoding', response.headers)
+        self.assertIn(b'color:red', response.get_data())
+        response.close()
+
+
+class LayoutTest(unittest.TestCase):
+
+    def test_one_layout(self):
+        # every page extends the layout that loads the bundles
+        templates = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'templates')
+        self.assertEqual(os.listdir(os.path.join(templates, 'layouts')), ['main.html'])
+        with open(os.path.join(templates, 'layouts', 'main.html')) as f:
+            layout = f.read()
+        self.assertIn("asset_urls('site.css')", layout)
+        self.assertIn("asset_urls('site.js')", layout)
+        for name in ('moment', 'modernizr', 'js/script.js'):
+            self.assertNotIn(name, layout)
+        for folder, dirs, files in os.walk(os.path.join(templates, 'pages')):
+            for name in files:
+                with open(os.path.join(folder, name)) as f:
+                    page = f.read()
+                if '{% extends' in page:
+                    self.assertIn("{% extends 'layouts/main.html' %}", page, name)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,153 @@
+import contextlib
+import datetime
+import os
+import tempfile
+import unittest
+
+# a scratch SQLite database; must be set before the app reads its config
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.gettempdir(), 'fyyur_test.db')
+os.environ['SHOW_BOUNDARY_SCHEDULER'] = '0'
+os.environ['WTF_CSRF_ENABLED'] = '0'
+
+from boundaries import BoundaryScheduler, ProcessLock
+from clock import Clock
+import app as fyyur
+
+#----------------------------------------------------------------------------#
+# The show boundary scheduler against a frozen clock: nothing happens until
+# a show starts, then its venue and artist counters move and their cached
+# pages go, and only one process sharing the lock file runs it.
+#----------------------------------------------------------------------------#
+
+T = datetime.datetime(2030, 5, 1, 20, 0)
+
+class SchedulerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = Clock('UTC')
+        self.clock.freeze(T)
+        self.boundaries = {('venue', 1): T + datetime.timedelta(hours=1), ('artist', 2): T + datetime.timedelta(hours=3)}
+        self.passed = []
+        self.scheduler = BoundaryScheduler(self.clock, self.load, self.record, contextlib.nullcontext, reload_interval=86400)
+
+    def load(self, now, keys=None):
+        return dict((key, instant) for key, instant in self.boundaries.items()
+                    if instant > now and (keys is None or key in keys))
+
+    def record(self, keys, now):
+        self.passed.append((sorted(keys), now))
+
+    def test_due_only_once_the_clock_reaches_the_boundary(self):
+        self.assertEqual(self.scheduler.tick(), [])
+        self.assertEqual(self.scheduler.sleep_seconds(), 3600)
+        self.clock.advance(datetime.timedelta(minutes=59))
+        self.assertEqual(self.scheduler.tick(), [])
+        self.clock.advance(datetime.timedelta(minutes=1))
+        self.assertEqual(self.scheduler.tick(), [('venue', 1)])
+        self.assertEqual(self.passed, [([('venue', 1)], T + datetime.timedelta(hours=1))])
+        self.assertEqual(self.scheduler.sleep_seconds(), 7200)
+        self.clock.advance(datetime.timedelta(hours=5))
+        self.assertEqual(self.scheduler.tick(), [('artist', 2)])
+        self.assertIsNone(self.scheduler.index.peek())
+
+
+class ProcessLockTest(unittest.TestCase):
+
+    def setUp(self):
+        self.path = os.path.join(tempfile.gettempdir(), 'fyyur_test_boundaries.lock')
+
+    def test_one_holder(self):
+        first, second = ProcessLock(self.path), ProcessLock(self.path)
+        try:
+            self.assertTrue(first.acquire())
+            self.assertFalse(second.acquire())
+            first.release()
+            self.assertTrue(second.acquire())
+        finally:
+            first.release()
+            second.release()
+
+    def test_scheduler_not_started_without_the_lock(self):
+        holder = ProcessLock(self.path)
+        self.assertTrue(holder.acquire())
+        try:
+            scheduler = BoundaryScheduler(Clock('UTC'), lambda now, keys=None: {}, lambda keys, now: None,
+                                          contextlib.nullcontext, lock_path=self.path)
+            self.assertFalse(scheduler.start())
+            self.assertIsNone(scheduler.thread)
+            # its writes are not indexed either
+            scheduler.offer('venue', 1, datetime.datetime.now() + datetime.timedelta(days=1))
+            self.assertEqual(len(scheduler.index), 0)
+        finally:
+            holder.release()
+
+
+class ShowBoundaryTest(unittest.TestCase):
+
+    def setUp(self):
+        self.context = fyyur.app.app_context()
+        self.context.push()
+        db = fyyur.db
+        db.drop_all()
+        db.create_all()
+        fyyur.clock.freeze(T)
+        venue = fyyur.Venue(name='Venue', genres=['Jazz'])
+        artist = fyyur.Artist(name='Artist', genres=['Jazz'])
+        db.session.add_all([venue, artist])
+        db.session.flush()
+        for hours in (2, 26):
+            start_time = T + datetime.timedelta(hours=hours)
+            db.session.add(fyyur.Show(venue_id=venue.id, artist_id=artist.id, start_time=start_time,
+                                      end_time=start_time + fyyur.DEFAULT_DURATION))
+        db.session.commit()
+        self.venue_id, self.artist_id = venue.id, artist.id
+        fyyur.refresh_show_counts(full=True)
+        for cache in (fyyur.entity_cache, fyyur.page_cache, fyyur.feed_cache):
+            cache.clear()
+        fyyur.show_boundaries.loaded_at = None
+
+    def tearDown(self):
+        fyyur.clock.unfreeze()
+        fyyur.show_boundaries.loaded_at = None
+        fyyur.show_boundaries.index.replace({})
+        fyyur.db.session.remove()
+        self.context.pop()
+
+    def counts(self):
+        venue = fyyur.VenueShowCount.query.filter_by(venue_id=self.venue_id).one()
+        artist = fyyur.ArtistShowCount.query.filter_by(artist_id=self.artist_id).one()
+        return (venue.upcoming, venue.past), (artist.upcoming, artist.past)
+
+    def test_boundary_refresh(self):
+        scheduler = fyyur.show_boundaries
+        self.assertEqual(scheduler.tick(), [])
+        self.assertEqual(scheduler.index.get('venue', self.venue_id), T + datetime.timedelta(hours=2))
+        self.assertEqual(self.counts(), ((2, 0), (2, 0)))
+        payload = fyyur.cached_venue(self.venue_id, detail=True)
+        self.assertEqual(len(payload['upcoming_shows']), 2)
+        version = fyyur.page_cache.backend.version(fyyur.page_cache.version_key())
+
+        fyyur.clock.advance(datetime.timedelta(hours=2))
+        self.assertEqual(sorted(scheduler.tick()), [('artist', self.artist_id), ('venue', self.venue_id)])
+        fyyur.db.session.expire_all()
+        self.assertEqual(self.counts(), ((1, 1), (1, 1)))
+        # the payload cached before the boundary is dropped, the pages bumped
+        payload = fyyur.cached_venue(self.venue_id, detail=True)
+        self.assertEqual((len(payload['past_shows']), len(payload['upcoming_shows'])), (1, 1))
+        self.assertGreater(fyyur.page_cache.backend.version(fyyur.page_cache.version_key()), version)
+        # the following boundary is the next show
+        self.assertEqual(scheduler.index.get('venue', self.venue_id), T + datetime.timedelta(hours=26))
+
+    def test_refresh_claims_its_window_once(self):
+        fyyur.clock.advance(datetime.timedelta(hours=3))
+        stale = fyyur.db.session.get(fyyur.ShowCountRefresh, 1).refreshed_at
+        self.assertEqual(fyyur.refresh_show_counts(), 1)
+        # a concurrent refresh that read the watermark before that commit
+        claimed = fyyur.ShowCountRefresh.query.filter_by(id=1, refreshed_at=stale).update(
+            {fyyur.ShowCountRefresh.refreshed_at: fyyur.clock.naive()}, synchronize_session=False)
+        self.assertEqual(claimed, 0)
+        fyyur.db.session.rollback()
+        self.assertEqual(self.counts(), ((1, 1), (1, 1)))
+
+if __name__ == '__main__':
+    unittest.main()
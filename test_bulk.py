@@ -0,0 +1,77 @@
+import csv
+import datetime
+import json
+import os
+import tempfile
+import unittest
+
+# a scratch SQLite database; must be set before the app reads its config
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.gettempdir(), 'fyyur_test.db')
+os.environ['SHOW_BOUNDARY_SCHEDULER'] = '0'
+os.environ['WTF_CSRF_ENABLED'] = '0'
+
+import app as fyyur
+
+#----------------------------------------------------------------------------#
+# import-catalogue resolves a show's venue and artist by id when the row
+# gives one, and by name (+ city) only without one.
+#----------------------------------------------------------------------------#
+
+START = datetime.datetime(2030, 5, 1, 20, 0)
+
+class ImportShowsTest(unittest.TestCase):
+
+    def setUp(self):
+        with fyyur.app.app_context():
+            db = fyyur.db
+            db.drop_all()
+            db.create_all()
+            # two venues sharing a name and a city
+            venues = [fyyur.Venue(name='Dup', city='Austin', state='TX', genres=['Jazz']) for n in range(2)]
+            artist = fyyur.Artist(name='Band', genres=['Jazz'])
+            db.session.add_all(venues + [artist])
+            db.session.commit()
+            self.venue_ids = [venue.id for venue in venues]
+            self.artist_id = artist.id
+        self.path = os.path.join(tempfile.gettempdir(), 'fyyur_test_shows.csv')
+
+    def run_import(self, rows):
+        with open(self.path, 'w', newline='') as f:
+            writer = csv.DictWriter(f, ['start_time', 'venue_id', 'venue_name', 'venue_city', 'artist_id'])
+            writer.writeheader()
+            for n, row in enumerate(rows):
+                start_time = START + datetime.timedelta(days=n)
+                writer.writerow(dict(row, start_time=start_time.strftime('%Y-%m-%d %H:%M:%S'), artist_id=self.artist_id))
+        return fyyur.app.test_cli_runner().invoke(args=['import-catalogue', 'shows', self.path])
+
+    def venues_of_shows(self):
+        with fyyur.app.app_context():
+            return [venue_id for venue_id, in fyyur.db.session.query(fyyur.Show.venue_id).order_by(fyyur.Show.start_time)]
+
+    def test_same_name_different_ids(self):
+        result = self.run_import([
+            {'venue_id': self.venue_ids[1], 'venue_name': 'Dup'},
+            {'venue_id': self.venue_ids[0], 'venue_name': 'Dup', 'venue_city': 'Austin'},
+        ])
+        self.assertEqual(result.exit_code, 0, result.stderr)
+        self.assertEqual(result.stdout.strip(), 'imported 2 shows, rejected 0')
+        self.assertEqual(self.venues_of_shows(), [self.venue_ids[1], self.venue_ids[0]])
+
+    def test_shared_name_without_an_id(self):
+        result = self.run_import([
+            {'venue_name': 'Dup', 'venue_city': 'Austin'},
+            {'venue_id': 'x'},
+            {'venue_id': 999},
+        ])
+        self.assertEqual(result.exit_code, 1)
+        self.assertEqual(result.stdout.strip(), 'imported 0 shows, rejected 3')
+        errors = [json.loads(line.split(': ', 1)[1]) for line in result.stderr.splitlines() if line.startswith('line ')]
+        self.assertEqual([error['venue_id'] for error in errors], [
+            ["2 venues match 'Dup', add the city or the id"],
+            ['venue_id must be a number'],
+            ['no venue with id 999'],
+        ])
+        self.assertEqual(self.venues_of_shows(), [])
+
+if __name__ == '__main__':
+    unittest.main()
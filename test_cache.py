@@ -0,0 +1,172 @@
+import datetime
+import os
+import runpy
+import tempfile
+import unittest
+
+# a scratch SQLite database; must be set before the app reads its config
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.gettempdir(), 'fyyur_test.db')
+os.environ['SHOW_BOUNDARY_SCHEDULER'] = '0'
+os.environ['WTF_CSRF_ENABLED'] = '0'
+
+from cache import EntityCache, LRUBackend, NullBackend, make_backend
+import app as fyyur
+
+#----------------------------------------------------------------------------#
+# The caches drop what a write made stale.
+#----------------------------------------------------------------------------#
+
+class Log(object):
+
+    def __init__(self):
+        self.warnings = []
+
+    def warning(self, message, *args):
+        self.warnings.append(message % args)
+
+
+class Server(object):
+    # the bits of gunicorn's arbiter that on_starting reads
+
+    def __init__(self, workers):
+        self.cfg = type('Config', (object,), {'workers': workers})()
+        self.log = Log()
+
+
+class LocalCachesTest(unittest.TestCase):
+
+    def setUp(self):
+        self.environ = dict(os.environ)
+        os.environ.pop('CACHE_URL', None)
+        os.environ.pop('LOCAL_CACHES', None)
+        self.on_starting = runpy.run_path(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'gunicorn.conf.py'))['on_starting']
+
+    def tearDown(self):
+        os.environ.clear()
+        os.environ.update(self.environ)
+
+    def test_several_workers_without_a_shared_cache(self):
+        server = Server(3)
+        self.on_starting(server)
+        self.assertEqual(os.environ.get('LOCAL_CACHES'), '0')
+        self.assertEqual(len(server.log.warnings), 1)
+        self.assertIsInstance(make_backend({'LOCAL_CACHES': False}, 10), NullBackend)
+
+    def test_one_worker_or_a_shared_cache(self):
+        self.on_starting(Server(1))
+        self.assertNotIn('LOCAL_CACHES', os.environ)
+        os.environ['CACHE_URL'] = 'redis://localhost:6379/0'
+        self.on_starting(Server(3))
+        self.assertNotIn('LOCAL_CACHES', os.environ)
+        self.assertIsInstance(make_backend({'LOCAL_CACHES': True}, 10), LRUBackend)
+
+
+class EntityCacheTest(unittest.TestCase):
+
+    def test_invalidate_drops_every_variant(self):
+        cache = EntityCache(LRUBackend())
+        cache.get_or_load('venue', 1, lambda: {'name': 'Old'})
+        cache.get_or_load('venue', 1, lambda: {'name': 'Old', 'shows': []}, 'detail')
+        cache.invalidate('venue', [1])
+        self.assertEqual(cache.get_or_load('venue', 1, lambda: {'name': 'New'}), {'name': 'New'})
+        self.assertEqual(cache.get_or_load('venue', 1, lambda: {'name': 'New', 'shows': []}, 'detail')['name'], 'New')
+        self.assertEqual((cache.hits, cache.misses), (0, 4))
+
+    def test_racing_reader_stores_under_the_old_version(self):
+        cache = EntityCache(LRUBackend())
+        stale_key = cache.key('venue', 1, 'format')
+        cache.invalidate('venue', [1])
+        # a reader that built its key before the write stores its payload
+        # where nobody looks any more
+        cache.backend.set(stale_key, {'name': 'Old'})
+        self.assertEqual(cache.get_or_load('venue', 1, lambda: {'name': 'New'}), {'name': 'New'})
+
+    def test_missing_entity_not_cached(self):
+        cache = EntityCache(LRUBackend())
+        self.assertIsNone(cache.get_or_load('venue', 1, lambda: None))
+        self.assertEqual(cache.get_or_load('venue', 1, lambda: {'name': 'New'}), {'name': 'New'})
+
+
+class AppCacheTest(unittest.TestCase):
+    # no app context is kept pushed between requests, which would share its g
+
+    def setUp(self):
+        with fyyur.app.app_context():
+            db = fyyur.db
+            db.drop_all()
+            db.create_all()
+            venue = fyyur.Venue(name='Old Hall', city='Austin', state='TX', genres=['Jazz'])
+            artist = fyyur.Artist(name='Trio', city='Austin', state='TX', genres=['Jazz'])
+            db.session.add_all([venue, artist])
+            db.session.flush()
+            start_time = datetime.datetime.now() + datetime.timedelta(days=7)
+            db.session.add(fyyur.Show(venue_id=venue.id, artist_id=artist.id, start_time=start_time,
+                                      end_time=start_time + fyyur.DEFAULT_DURATION))
+            db.session.commit()
+            self.venue_id, self.artist_id = venue.id, artist.id
+        for cache in (fyyur.entity_cache, fyyur.page_cache, fyyur.feed_cache, fyyur.facet_cache):
+            cache.clear()
+        self.client = fyyur.app.test_client()
+
+    def cached(self):
+        with fyyur.app.app_context():
+            return fyyur.cached_venue(self.venue_id, detail=True), fyyur.cached_artist(self.artist_id, detail=True)
+
+    def edit_venue(self, name):
+        # from another client: the writer's own reads skip the page cache
+        response = fyyur.app.test_client().post('/venues/%d/edit' % self.venue_id, data={
+            'name': name, 'city': 'Austin', 'state': 'TX', 'address': '1 Main St', 'genres': 'Jazz',
+            'facebook_link': 'https://www.facebook.com/venue'})
+        self.assertEqual(response.status_code, 302)
+
+    def test_edit_drops_the_venue_and_its_artists(self):
+        venue, artist = self.cached()
+        self.assertEqual(artist['upcoming_shows'][0]['venue_name'], 'Old Hall')
+        misses = fyyur.entity_cache.misses
+        self.cached()
+        self.assertEqual(fyyur.entity_cache.misses, misses)
+        self.edit_venue('New Hall')
+        venue, artist = self.cached()
+        self.assertEqual(venue['name'], 'New Hall')
+        # the artist's payload lists the venue by name
+        self.assertEqual(artist['upcoming_shows'][0]['venue_name'], 'New Hall')
+        self.assertEqual(fyyur.entity_cache.misses, misses + 2)
+
+    def test_delete_drops_the_venue_and_its_artists(self):
+        self.cached()
+        self.assertEqual(fyyur.app.test_client().delete('/venues/%d' % self.venue_id).status_code, 200)
+        venue, artist = self.cached()
+        self.assertIsNone(venue)
+        self.assertEqual(artist['upcoming_shows'], [])
+
+    def test_write_bumps_the_page_version(self):
+        version = fyyur.page_cache.backend.version(fyyur.page_cache.version_key())
+        self.assertIn('Old Hall', self.client.get('/venues').get_data(as_text=True))
+        hits = fyyur.page_cache.hits
+        self.client.get('/venues')
+        self.assertEqual(fyyur.page_cache.hits, hits + 1)
+        self.edit_venue('New Hall')
+        self.assertGreater(fyyur.page_cache.backend.version(fyyur.page_cache.version_key()), version)
+        misses = fyyur.page_cache.misses
+        self.assertIn('New Hall', self.client.get('/venues').get_data(as_text=True))
+        self.assertEqual(fyyur.page_cache.misses, misses + 1)
+
+    def test_not_modified(self):
+        response = self.client.get('/venues')
+        etag, body = response.headers['ETag'], response.get_data(as_text=True)
+        self.assertIn('no-cache', response.headers['Cache-Control'])
+        response = self.client.get('/venues', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.get_data(), b'')
+        self.assertEqual(fyyur.page_cache.not_modified, 1)
+        # the same data renders the same tag, cached or not
+        fyyur.page_cache.clear()
+        self.assertEqual(self.client.get('/venues').headers['ETag'], etag)
+        # after a write the old tag no longer matches
+        self.edit_venue('New Hall')
+        response = self.client.get('/venues', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response.get_data(as_text=True), body)
+
+if __name__ == '__main__':
+    unittest.main()
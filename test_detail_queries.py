@@ -0,0 +1,86 @@
+import datetime
+import os
+import tempfile
+import unittest
+
+# a scratch SQLite database; must be set before the app reads its config
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.gettempdir(), 'fyyur_test.db')
+os.environ['SHOW_BOUNDARY_SCHEDULER'] = '0'
+os.environ['WTF_CSRF_ENABLED'] = '0'
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+import app as fyyur
+
+#----------------------------------------------------------------------------#
+# Detail pages issue the same number of SQL statements whether the venue or
+# artist has one show or hundreds: no query per show or per counterpart.
+#----------------------------------------------------------------------------#
+
+SHOW_COUNTS = (1, 10, 200)
+
+class DetailQueryCountTest(unittest.TestCase):
+
+    def setUp(self):
+        self.context = fyyur.app.app_context()
+        self.context.push()
+        fyyur.db.drop_all()
+        fyyur.db.create_all()
+        for cache in (fyyur.entity_cache, fyyur.page_cache, fyyur.feed_cache):
+            cache.clear()
+        self.client = fyyur.app.test_client()
+        self.statements = 0
+        event.listen(Engine, 'before_cursor_execute', self.count)
+
+    def tearDown(self):
+        event.remove(Engine, 'before_cursor_execute', self.count)
+        fyyur.db.session.remove()
+        self.context.pop()
+
+    def count(self, *args):
+        self.statements += 1
+
+    def seed(self, kind, shows):
+        # a venue or artist with that many shows, each with its own
+        # counterpart, half of them past and half upcoming; returns its id
+        db = fyyur.db
+        model = fyyur.Venue if kind == 'venue' else fyyur.Artist
+        owner = model(name='Owner', city='Austin', state='TX', genres=['Jazz'])
+        db.session.add(owner)
+        db.session.flush()
+        start = fyyur.clock.naive() - datetime.timedelta(days=shows // 2)
+        for n in range(shows):
+            other = (fyyur.Artist if kind == 'venue' else fyyur.Venue)(name='Other %d' % n, genres=['Jazz'])
+            db.session.add(other)
+            db.session.flush()
+            start_time = start + datetime.timedelta(days=n, hours=1)
+            show = fyyur.Show(start_time=start_time, end_time=start_time + fyyur.DEFAULT_DURATION)
+            if kind == 'venue':
+                show.venue_id, show.artist_id = owner.id, other.id
+            else:
+                show.venue_id, show.artist_id = other.id, owner.id
+            db.session.add(show)
+        db.session.commit()
+        return owner.id
+
+    def statements_for(self, url):
+        self.statements = 0
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200, url)
+        return self.statements
+
+    def check_constant(self, kind):
+        counts = {}
+        for shows in SHOW_COUNTS:
+            id = self.seed(kind, shows)
+            counts[shows] = self.statements_for('/%ss/%d' % (kind, id))
+        self.assertEqual(len(set(counts.values())), 1, 'statements per show count: %r' % counts)
+
+    def test_venue_page(self):
+        self.check_constant('venue')
+
+    def test_artist_page(self):
+        self.check_constant('artist')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,125 @@
+import json
+import os
+import tempfile
+import unittest
+
+# a scratch SQLite database; must be set before the app reads its config
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.gettempdir(), 'fyyur_test.db')
+os.environ['SHOW_BOUNDARY_SCHEDULER'] = '0'
+os.environ['WTF_CSRF_ENABLED'] = '0'
+
+from facets import NO_FILTERS, make_filters
+import app as fyyur
+
+#----------------------------------------------------------------------------#
+# Genre/area filters and facet counts, and the genre index tables that the
+# mapper events keep in step with venue and artist writes.
+#----------------------------------------------------------------------------#
+
+class FacetTest(unittest.TestCase):
+
+    def setUp(self):
+        self.context = fyyur.app.app_context()
+        self.context.push()
+        db = fyyur.db
+        db.drop_all()
+        db.create_all()
+        for cache in (fyyur.entity_cache, fyyur.page_cache, fyyur.facet_cache):
+            cache.clear()
+        self.venues = {}
+        for name, genres, city, state in (
+            ('Jazz Club', ['Jazz', 'Blues'], 'New York', 'NY'),
+            ('Blues Bar', ['Blues'], 'New York', 'NY'),
+            ('Jazz Hall', ['Jazz'], 'San Francisco', 'CA'),
+        ):
+            self.venues[name] = fyyur.Venue(name=name, genres=genres, city=city, state=state)
+        db.session.add_all(self.venues.values())
+        db.session.commit()
+
+    def tearDown(self):
+        fyyur.db.session.remove()
+        self.context.pop()
+
+    def indexed(self, venue):
+        return sorted(genre for genre, in fyyur.db.session.query(fyyur.VenueGenre.genre).filter(
+            fyyur.VenueGenre.venue_id == venue.id))
+
+    def names(self, filters):
+        ids = fyyur.venue_facets.matching_ids(filters)
+        return sorted(venue.name for venue in self.venues.values() if venue.id in ids)
+
+    def test_make_filters(self):
+        self.assertEqual(make_filters(['Jazz', 'Blues', 'Jazz', '']), (('Blues', 'Jazz'), None, None))
+        self.assertEqual(make_filters([], '', ''), NO_FILTERS)
+
+    def test_index_follows_writes(self):
+        venue = self.venues['Jazz Club']
+        self.assertEqual(self.indexed(venue), ['Blues', 'Jazz'])
+        venue.genres = ['Soul']
+        fyyur.db.session.commit()
+        self.assertEqual(self.indexed(venue), ['Soul'])
+        # a write that leaves the genres alone keeps the rows
+        venue.phone = '555-0100'
+        fyyur.db.session.commit()
+        self.assertEqual(self.indexed(venue), ['Soul'])
+        venue_id = venue.id
+        fyyur.db.session.delete(venue)
+        fyyur.db.session.commit()
+        self.assertEqual(fyyur.VenueGenre.query.filter_by(venue_id=venue_id).count(), 0)
+
+    def test_artist_index_follows_writes(self):
+        artist = fyyur.Artist(name='Trio', genres=['Jazz', 'Funk'])
+        fyyur.db.session.add(artist)
+        fyyur.db.session.commit()
+        indexed = lambda: sorted(genre for genre, in fyyur.db.session.query(fyyur.ArtistGenre.genre).filter(
+            fyyur.ArtistGenre.artist_id == artist.id))
+        self.assertEqual(indexed(), ['Funk', 'Jazz'])
+        artist.genres = []
+        fyyur.db.session.commit()
+        self.assertEqual(indexed(), [])
+
+    def test_filters(self):
+        self.assertEqual(self.names(make_filters(['Jazz'])), ['Jazz Club', 'Jazz Hall'])
+        # every given genre, not any of them
+        self.assertEqual(self.names(make_filters(['Jazz', 'Blues'])), ['Jazz Club'])
+        self.assertEqual(self.names(make_filters(['Jazz'], state='CA')), ['Jazz Hall'])
+        self.assertEqual(self.names(make_filters(city='New York', state='NY')), ['Blues Bar', 'Jazz Club'])
+        self.assertEqual(self.names(make_filters(['Punk'])), [])
+
+    def test_counts(self):
+        self.assertEqual(fyyur.venue_facets.counts(), {
+            'genres': [['Blues', 2], ['Jazz', 2]],
+            'areas': [['New York', 'NY', 2], ['San Francisco', 'CA', 1]],
+        })
+        self.assertEqual(fyyur.venue_facets.counts(make_filters(state='NY')), {
+            'genres': [['Blues', 2], ['Jazz', 1]],
+            'areas': [['New York', 'NY', 2]],
+        })
+
+    def test_counts_follow_writes(self):
+        self.assertEqual(fyyur.venue_facets.counts()['genres'], [['Blues', 2], ['Jazz', 2]])
+        self.venues['Blues Bar'].genres = ['Jazz']
+        fyyur.db.session.commit()
+        self.assertEqual(fyyur.venue_facets.counts()['genres'], [['Jazz', 3], ['Blues', 1]])
+
+    def test_rebuild(self):
+        # a core insert, as the bulk import does, skips the mapper events
+        fyyur.db.session.execute(fyyur.Venue.__table__.insert(), [{'name': 'Imported', 'genres': ['Punk']}])
+        fyyur.db.session.commit()
+        self.assertEqual(self.names(make_filters(['Punk'])), [])
+        fyyur.venue_facets.rebuild()
+        self.assertEqual(fyyur.venue_facets.counts(make_filters(['Punk']))['genres'], [['Punk', 1]])
+
+    def test_pages(self):
+        client = fyyur.app.test_client()
+        page = client.get('/venues?genre=Jazz&genre=Blues').get_data(as_text=True)
+        self.assertIn('Jazz Club', page)
+        self.assertNotIn('Blues Bar', page)
+        self.assertNotIn('Jazz Hall', page)
+        response = client.get('/api/v1/venues/facets?state=CA')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.get_data(as_text=True)),
+                         {'genres': [['Jazz', 1]], 'areas': [['San Francisco', 'CA', 1]]})
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,109 @@
+import datetime
+import os
+import tempfile
+import unittest
+
+# a scratch SQLite database; must be set before the app reads its config
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.gettempdir(), 'fyyur_test.db')
+os.environ['SHOW_BOUNDARY_SCHEDULER'] = '0'
+os.environ['WTF_CSRF_ENABLED'] = '0'
+
+from dateutil import tz
+import ical
+import app as fyyur
+
+#----------------------------------------------------------------------------#
+# Calendar feeds: RFC 5545 escaping, 75-octet folding and UTC times, and the
+# month pages' ?month argument.
+#----------------------------------------------------------------------------#
+
+class FormatTest(unittest.TestCase):
+
+    def test_escape(self):
+        self.assertEqual(ical.escape('Jazz; Blues, Soul\\Funk\nLate'), 'Jazz\\; Blues\\, Soul\\\\Funk\\nLate')
+        self.assertEqual(ical.escape('a\r\nb'), 'a\\nb')
+        self.assertEqual(ical.escape(None), '')
+
+    def test_fold(self):
+        self.assertEqual(ical.fold('x' * 75), 'x' * 75)
+        folded = ical.fold('SUMMARY:' + 'x' * 200)
+        lines = folded.split('\r\n')
+        self.assertTrue(all(len(line.encode('utf-8')) <= 75 for line in lines))
+        self.assertTrue(all(line.startswith(' ') for line in lines[1:]))
+        self.assertEqual(''.join(line[1:] if n else line for n, line in enumerate(lines)), 'SUMMARY:' + 'x' * 200)
+
+    def test_fold_keeps_utf8_sequences(self):
+        line = 'SUMMARY:' + u'é' * 100
+        lines = ical.fold(line).split('\r\n')
+        self.assertTrue(all(len(part.encode('utf-8')) <= 75 for part in lines))
+        self.assertEqual(''.join(part[1:] if n else part for n, part in enumerate(lines)), line)
+
+    def test_utc(self):
+        moment = datetime.datetime(2030, 12, 1, 21, 0, tzinfo=tz.tzoffset(None, 3600))
+        self.assertEqual(ical.utc(moment), '20301201T200000Z')
+        self.assertEqual(ical.utc(datetime.datetime(2030, 12, 1, 20, 0, tzinfo=tz.tzutc())), '20301201T200000Z')
+
+    def test_calendar(self):
+        start = datetime.datetime(2030, 12, 1, 20, 0, tzinfo=tz.tzutc())
+        body = ical.calendar('Bar, Grill', [ical.event('show-1@fyyur', start, start + datetime.timedelta(hours=2),
+                                                       'Band at Bar', 'Bar, 1 Main St')])
+        self.assertTrue(body.endswith('END:VCALENDAR\r\n'))
+        self.assertNotIn('\n', body.replace('\r\n', ''))
+        lines = body.split('\r\n')
+        for line in ('X-WR-CALNAME:Bar\\, Grill', 'DTSTART:20301201T200000Z', 'DTEND:20301201T220000Z',
+                     'LOCATION:Bar\\, 1 Main St', 'UID:show-1@fyyur'):
+            self.assertIn(line, lines)
+
+
+class FeedTest(unittest.TestCase):
+
+    def setUp(self):
+        with fyyur.app.app_context():
+            db = fyyur.db
+            db.drop_all()
+            db.create_all()
+            venue = fyyur.Venue(name='Bar; Grill', address='1 Main St', city='Austin', state='TX', genres=['Jazz'])
+            artist = fyyur.Artist(name='The Band, Again', genres=['Jazz'])
+            db.session.add_all([venue, artist])
+            db.session.flush()
+            self.start_time = (fyyur.clock.naive() + datetime.timedelta(days=3)).replace(hour=20, minute=0, second=0, microsecond=0)
+            db.session.add(fyyur.Show(venue_id=venue.id, artist_id=artist.id, start_time=self.start_time,
+                                      end_time=self.start_time + fyyur.DEFAULT_DURATION))
+            db.session.commit()
+            self.venue_id, self.artist_id = venue.id, artist.id
+        for cache in (fyyur.entity_cache, fyyur.page_cache, fyyur.feed_cache):
+            cache.clear()
+        self.client = fyyur.app.test_client()
+
+    def test_venue_feed(self):
+        response = self.client.get('/venues/%d/calendar.ics' % self.venue_id)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.mimetype, 'text/calendar')
+        lines = response.get_data(as_text=True).split('\r\n')
+        self.assertIn('X-WR-CALNAME:Bar\\; Grill', lines)
+        self.assertIn('SUMMARY:The Band\\, Again at Bar\\; Grill', lines)
+        self.assertIn('DTSTART:' + ical.utc(fyyur.clock.aware(self.start_time)), lines)
+        self.assertTrue([line for line in lines if line.startswith('DTSTAMP:') and line.endswith('Z')])
+        # unchanged: a 304 from the cache
+        again = self.client.get('/venues/%d/calendar.ics' % self.venue_id,
+                                headers={'If-None-Match': response.headers['ETag']})
+        self.assertEqual(again.status_code, 304)
+
+    def test_artist_feed(self):
+        response = self.client.get('/artists/%d/calendar.ics' % self.artist_id)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('DTEND:' + ical.utc(fyyur.clock.aware(self.start_time + fyyur.DEFAULT_DURATION)),
+                      response.get_data(as_text=True).split('\r\n'))
+        self.assertEqual(self.client.get('/artists/999/calendar.ics').status_code, 404)
+
+    def test_month_page(self):
+        month = self.start_time.strftime('%Y-%m')
+        response = self.client.get('/venues/%d/calendar?month=%s' % (self.venue_id, month))
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('The Band, Again', response.get_data(as_text=True))
+        for month in ('2030-13', 'May', '2030-5-1'):
+            self.assertEqual(self.client.get('/venues/%d/calendar?month=%s' % (self.venue_id, month)).status_code, 400, month)
+            self.assertEqual(self.client.get('/artists/%d/calendar?month=%s' % (self.artist_id, month)).status_code, 400, month)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,98 @@
+import datetime
+import json
+import os
+import tempfile
+import unittest
+
+# a scratch SQLite database; must be set before the app reads its config
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.gettempdir(), 'fyyur_test.db')
+os.environ['SHOW_BOUNDARY_SCHEDULER'] = '0'
+os.environ['WTF_CSRF_ENABLED'] = '0'
+
+import app as fyyur
+
+#----------------------------------------------------------------------------#
+# Matching artists to free venues and venues to free artists: the NOT EXISTS
+# probe drops whoever is booked in the window, and the endpoints serve it.
+#----------------------------------------------------------------------------#
+
+T = datetime.datetime(2030, 5, 1, 20, 0)
+
+def hours(n):
+    return datetime.timedelta(hours=n)
+
+class MatchingTest(unittest.TestCase):
+    # no app context is kept pushed between requests, which would share its g
+
+    def setUp(self):
+        with fyyur.app.app_context():
+            db = fyyur.db
+            db.drop_all()
+            db.create_all()
+            venues = [fyyur.Venue(name=name, state=state, genres=genres, seeking_talent=seeking)
+                      for name, state, genres, seeking in (
+                          ('Booked Hall', 'NY', ['Jazz'], True),
+                          ('Free Hall', 'NY', ['Jazz', 'Blues'], True),
+                          ('West Hall', 'CA', ['Jazz'], True),
+                          ('Closed Hall', 'NY', ['Jazz'], False),
+                          ('Rock Hall', 'NY', ['Rock'], True),
+                      )]
+            artists = [fyyur.Artist(name=name, state='NY', genres=['Jazz', 'Blues'], seeking_venue=True)
+                       for name in ('Booked Band', 'Free Band')]
+            db.session.add_all(venues + artists)
+            db.session.flush()
+            db.session.add(fyyur.Show(venue_id=venues[0].id, artist_id=artists[0].id,
+                                      start_time=T, end_time=T + hours(2)))
+            db.session.commit()
+            self.venue_ids = dict((venue.name, venue.id) for venue in venues)
+            self.artist_ids = dict((artist.name, artist.id) for artist in artists)
+        for cache in (fyyur.entity_cache, fyyur.page_cache, fyyur.feed_cache, fyyur.facet_cache):
+            cache.clear()
+
+    def find(self, matching, genres, start_time, end_time):
+        with fyyur.app.app_context():
+            return [(row['name'], row['genre_overlap'])
+                    for row in matching.find(genres, 'NY', start_time, end_time)]
+
+    def get(self, path, start_time):
+        response = fyyur.app.test_client().get(path, query_string={'start': start_time.isoformat()})
+        self.assertEqual(response.status_code, 200)
+        return json.loads(response.get_data(as_text=True))
+
+    def test_booked_venue_excluded(self):
+        # an hour into the booked show: only the free venue
+        self.assertEqual(self.find(fyyur.venue_matching, ['Jazz', 'Blues'], T + hours(1), T + hours(3)),
+                         [('Free Hall', 2)])
+        # once the show is over both, most genres in common first
+        self.assertEqual(self.find(fyyur.venue_matching, ['Jazz', 'Blues'], T + hours(2), T + hours(4)),
+                         [('Free Hall', 2), ('Booked Hall', 1)])
+
+    def test_booked_artist_excluded(self):
+        self.assertEqual(self.find(fyyur.artist_matching, ['Jazz'], T - hours(1), T + hours(1)),
+                         [('Free Band', 1)])
+        self.assertEqual(self.find(fyyur.artist_matching, ['Jazz'], T - hours(2), T),
+                         [('Booked Band', 1), ('Free Band', 1)])
+
+    def test_nothing_to_match_on(self):
+        self.assertEqual(self.find(fyyur.venue_matching, [], T, T + hours(2)), [])
+
+    def test_artist_matches_endpoint(self):
+        data = self.get('/api/v1/artists/%d/matches' % self.artist_ids['Free Band'], T + hours(1))
+        self.assertEqual(data['end_time'], (T + hours(1) + fyyur.DEFAULT_DURATION).isoformat())
+        self.assertEqual([venue['name'] for venue in data['venues']], ['Free Hall'])
+
+    def test_venue_matches_endpoint(self):
+        data = self.get('/api/v1/venues/%d/matches' % self.venue_ids['Free Hall'], T + hours(1))
+        self.assertEqual([artist['name'] for artist in data['artists']], ['Free Band'])
+        data = self.get('/api/v1/venues/%d/matches' % self.venue_ids['Free Hall'], T + hours(2))
+        self.assertEqual([artist['name'] for artist in data['artists']], ['Booked Band', 'Free Band'])
+
+    def test_bad_requests(self):
+        client = fyyur.app.test_client()
+        path = '/api/v1/artists/%d/matches' % self.artist_ids['Free Band']
+        self.assertEqual(client.get(path).status_code, 400)
+        self.assertEqual(client.get(path, query_string={'start': T.isoformat(), 'end': T.isoformat()}).status_code, 400)
+        self.assertEqual(client.get('/api/v1/artists/999/matches', query_string={'start': T.isoformat()}).status_code, 404)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,45 @@
+import datetime
+import unittest
+
+from sqlalchemy import Column, DateTime, Integer, MetaData, String, Table
+from pagination import decode_cursor, encode_cursor
+
+#----------------------------------------------------------------------------#
+# Cursors round-trip their keys, and a tampered cursor is a ValueError (a
+# 400 in the controllers) before any of it reaches SQL.
+#----------------------------------------------------------------------------#
+
+rows = Table('rows', MetaData(), Column('id', Integer), Column('name', String), Column('start_time', DateTime))
+SHOW_KEYS = (rows.c.start_time, rows.c.id)
+NAME_KEYS = (rows.c.name, rows.c.id)
+
+class CursorTest(unittest.TestCase):
+
+    def test_round_trip(self):
+        start_time = datetime.datetime(2030, 5, 1, 20, 30)
+        self.assertEqual(decode_cursor(encode_cursor([start_time, 7]), SHOW_KEYS), [start_time, 7])
+        self.assertEqual(decode_cursor(encode_cursor(['The Dueling Pianos', 3]), NAME_KEYS), ['The Dueling Pianos', 3])
+
+    def test_wrong_types(self):
+        tampered = [
+            (SHOW_KEYS, ['2030-05-01T20:30:00', '7']),
+            (SHOW_KEYS, ['2030-05-01T20:30:00', 7.5]),
+            (SHOW_KEYS, ['2030-05-01T20:30:00', True]),
+            (SHOW_KEYS, [12, 7]),
+            (SHOW_KEYS, ['not a date', 7]),
+            (NAME_KEYS, [42, 3]),
+            (NAME_KEYS, [None, 3]),
+            (NAME_KEYS, [['a'], 3]),
+            (NAME_KEYS, ['a', {'id': 3}]),
+        ]
+        for keys, values in tampered:
+            with self.assertRaises(ValueError, msg=repr(values)):
+                decode_cursor(encode_cursor(values), keys)
+
+    def test_not_a_cursor(self):
+        for cursor in ('', 'x', '!!!', encode_cursor(['a']), encode_cursor({'a': 1})):
+            with self.assertRaises(ValueError, msg=cursor):
+                decode_cursor(cursor, NAME_KEYS)
+
+if __name__ == '__main__':
+    unittest.main()
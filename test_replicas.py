@@ -0,0 +1,148 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+# a scratch SQLite database; must be set before the app reads its config
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.gettempdir(), 'fyyur_test.db')
+os.environ['SHOW_BOUNDARY_SCHEDULER'] = '0'
+os.environ['WTF_CSRF_ENABLED'] = '0'
+
+from flask import g
+from sqlalchemy import create_engine
+from replicas import STICKY_COOKIE
+import app as fyyur
+
+#----------------------------------------------------------------------------#
+# Replica routing against two SQLite files: the primary, and a copy of it
+# taken before the writes a test makes, standing in for a lagging replica.
+#----------------------------------------------------------------------------#
+
+PRIMARY = os.path.join(tempfile.gettempdir(), 'fyyur_test.db')
+REPLICA = os.path.join(tempfile.gettempdir(), 'fyyur_test_replica.db')
+
+class ReplicaTest(unittest.TestCase):
+    # no app context is kept pushed: requests would share its g, and with
+    # it one request's write
+
+    def setUp(self):
+        with fyyur.app.app_context():
+            db = fyyur.db
+            db.drop_all()
+            db.create_all()
+            artist = fyyur.Artist(name='OLDNAME', city='Austin', state='TX', genres=['Jazz'])
+            db.session.add(artist)
+            db.session.commit()
+            self.artist_id = artist.id
+        for cache in (fyyur.entity_cache, fyyur.page_cache, fyyur.feed_cache, fyyur.facet_cache):
+            cache.clear()
+        shutil.copy(PRIMARY, REPLICA)
+        self.attach('sqlite:///' + REPLICA)
+
+    def tearDown(self):
+        for engine in fyyur.replicas.engines:
+            engine.dispose()
+        fyyur.replicas.engines = []
+        fyyur.replicas.health = {}
+
+    def attach(self, url):
+        # the router as REPLICA_DATABASE_URLS=url would have built it
+        for engine in fyyur.replicas.engines:
+            engine.dispose()
+        engine = create_engine(url)
+        fyyur.replicas.engines = [engine]
+        fyyur.replicas.health = {engine: (None, True, None)}
+
+    def rename_on_primary(self, name):
+        with fyyur.app.app_context():
+            fyyur.db.session.get(fyyur.Artist, self.artist_id).name = name
+            fyyur.db.session.commit()
+
+    def edit_artist(self, client, name):
+        response = client.post('/artists/%d/edit' % self.artist_id, data={
+            'name': name, 'city': 'Austin', 'state': 'TX', 'genres': 'Jazz',
+            'facebook_link': 'https://www.facebook.com/artist'})
+        self.assertEqual(response.status_code, 302)
+
+    def page(self, client, path):
+        response = client.get(path)
+        self.assertEqual(response.status_code, 200, path)
+        return response.get_data(as_text=True)
+
+
+class RoutingTest(ReplicaTest):
+
+    def test_get_bind(self):
+        replica = fyyur.replicas.engines[0]
+        select = fyyur.db.select(fyyur.Artist)
+        with fyyur.app.test_request_context('/artists'):
+            session = fyyur.db.session
+            # outside read_only views everything goes to the primary
+            self.assertIs(session.get_bind(clause=select), fyyur.db.engine)
+            g.replica = replica
+            self.assertIs(session.get_bind(clause=select), replica)
+            self.assertIs(session.get_bind(clause=select.with_for_update()), fyyur.db.engine)
+            self.assertIs(session.get_bind(clause=fyyur.db.update(fyyur.Artist).values(name='x')), fyyur.db.engine)
+            with fyyur.replicas.primary():
+                self.assertIs(session.get_bind(clause=select), fyyur.db.engine)
+            self.assertIs(session.get_bind(clause=select), replica)
+            # once the request has written, its reads stay on the primary
+            g.db_wrote = True
+            self.assertIs(session.get_bind(clause=select), fyyur.db.engine)
+
+    def test_reads_go_to_the_replica(self):
+        # the primary is ahead of the replica: what a page shows tells
+        # which one it read
+        self.rename_on_primary('NEWNAME')
+        self.assertIn('OLDNAME', self.page(fyyur.app.test_client(), '/api/v1/artists'))
+
+    def test_writes_go_to_the_primary(self):
+        client = fyyur.app.test_client()
+        self.edit_artist(client, 'NEWNAME')
+        with fyyur.app.app_context():
+            self.assertEqual(fyyur.db.session.get(fyyur.Artist, self.artist_id).name, 'NEWNAME')
+        replica = fyyur.replicas.engines[0]
+        with replica.connect() as connection:
+            name = connection.exec_driver_sql('SELECT name FROM "Artist"').scalar()
+        self.assertEqual(name, 'OLDNAME')
+
+    def test_sticky_after_write(self):
+        writer, reader = fyyur.app.test_client(), fyyur.app.test_client()
+        self.edit_artist(writer, 'NEWNAME')
+        self.assertIsNotNone(writer.get_cookie(STICKY_COOKIE))
+        self.assertIn('NEWNAME', self.page(writer, '/api/v1/artists'))
+        self.assertIn('OLDNAME', self.page(reader, '/api/v1/artists'))
+
+    def test_fallback_when_replica_is_down(self):
+        self.attach('sqlite:///' + os.path.join(tempfile.gettempdir(), 'no-such-dir', 'replica.db'))
+        fallbacks = fyyur.replicas.decisions['fallback']
+        self.rename_on_primary('NEWNAME')
+        self.assertIn('NEWNAME', self.page(fyyur.app.test_client(), '/api/v1/artists'))
+        self.assertEqual(fyyur.replicas.decisions['fallback'], fallbacks + 1)
+        self.assertEqual([usable for url, usable, lag in fyyur.replicas.status()], [False])
+
+
+class ReadYourWritesTest(ReplicaTest):
+    # the page cache on, a replica lagging behind the primary
+
+    def test_writer_sees_its_edit(self):
+        writer, reader = fyyur.app.test_client(), fyyur.app.test_client()
+        self.edit_artist(writer, 'NEWNAME')
+        # the redirect's page shows the flash message, so is never cached
+        self.assertIn('NEWNAME', self.page(writer, '/artists/%d' % self.artist_id))
+        # another client misses the cache first and stores the page
+        self.assertIn('NEWNAME', self.page(reader, '/artists?limit=200'))
+        # the writer, still on the primary, skips the cache altogether
+        hits = fyyur.page_cache.hits
+        self.assertIn('NEWNAME', self.page(writer, '/artists?limit=200'))
+        self.assertEqual(fyyur.page_cache.hits, hits)
+
+    def test_cached_pages_are_rendered_from_the_primary(self):
+        self.page(fyyur.app.test_client(), '/artists')
+        misses = fyyur.page_cache.misses
+        self.edit_artist(fyyur.app.test_client(), 'NEWNAME')
+        self.assertIn('NEWNAME', self.page(fyyur.app.test_client(), '/artists'))
+        self.assertEqual(fyyur.page_cache.misses, misses + 1)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,138 @@
+import datetime
+import os
+import tempfile
+import unittest
+
+# a scratch SQLite database; must be set before the app reads its config
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.gettempdir(), 'fyyur_test.db')
+os.environ['SHOW_BOUNDARY_SCHEDULER'] = '0'
+os.environ['WTF_CSRF_ENABLED'] = '0'
+
+from schedule import MAX_DURATION, ScheduleIndex, show_end_time, sweep_conflicts
+import app as fyyur
+
+#----------------------------------------------------------------------------#
+# Bookings of one venue or artist may not overlap: the in-memory index used
+# by imports, the sweep over a whole table, and the create-show form.
+#----------------------------------------------------------------------------#
+
+T = datetime.datetime(2030, 5, 1, 20, 0)
+
+def hours(n):
+    return datetime.timedelta(hours=n)
+
+class EndTimeTest(unittest.TestCase):
+
+    def test_default_duration_and_end_time(self):
+        self.assertEqual(show_end_time(T), T + hours(2))
+        self.assertEqual(show_end_time(T, duration=45), T + datetime.timedelta(minutes=45))
+        self.assertEqual(show_end_time(T, duration=45, end_time=T + hours(3)), T + hours(3))
+
+    def test_refused(self):
+        for end_time in (T, T - hours(1), T + MAX_DURATION + datetime.timedelta(minutes=1)):
+            with self.assertRaises(ValueError, msg=end_time):
+                show_end_time(T, end_time=end_time)
+        self.assertEqual(show_end_time(T, end_time=T + MAX_DURATION), T + MAX_DURATION)
+
+
+class ScheduleIndexTest(unittest.TestCase):
+
+    def setUp(self):
+        self.index = ScheduleIndex()
+        self.assertEqual(self.index.book(1, 1, T, T + hours(2), ('show', 1)), [])
+
+    def test_overlapping(self):
+        self.assertEqual(self.index.overlapping('venue', 1, T + hours(1), T + hours(3)), [(T, T + hours(2), ('show', 1))])
+        # touching ends do not overlap
+        self.assertEqual(self.index.overlapping('venue', 1, T + hours(2), T + hours(3)), [])
+        self.assertEqual(self.index.overlapping('venue', 1, T - hours(1), T), [])
+        self.assertEqual(self.index.overlapping('venue', 2, T, T + hours(2)), [])
+
+    def test_long_booking_found_from_its_end(self):
+        # starts MAX_DURATION before the probe: still inside the bisected range
+        self.index.book(2, 2, T - MAX_DURATION + hours(1), T + hours(1), ('show', 2))
+        self.assertEqual([ref for start, end, ref in self.index.overlapping('venue', 2, T, T + hours(1))], [('show', 2)])
+
+    def test_book_refuses_venue_and_artist_overlaps(self):
+        conflicts = self.index.book(1, 2, T + hours(1), T + hours(3), ('line', 2))
+        self.assertEqual([(c.kind, c.key, c.other_ref) for c in conflicts], [('venue', 1, ('show', 1))])
+        conflicts = self.index.book(2, 1, T + hours(1), T + hours(3), ('line', 3))
+        self.assertEqual([(c.kind, c.key, c.other_ref) for c in conflicts], [('artist', 1, ('show', 1))])
+        self.assertEqual(len(self.index), 2)
+        # another venue and artist, or after the show ends: booked
+        self.assertEqual(self.index.book(2, 2, T, T + hours(2), ('line', 4)), [])
+        self.assertEqual(self.index.book(1, 1, T + hours(2), T + hours(4), ('line', 5)), [])
+        self.assertEqual(len(self.index), 6)
+
+    def test_unbook(self):
+        self.index.unbook(1, 1, T, T + hours(2), ('show', 1))
+        self.assertEqual(len(self.index), 0)
+        self.assertEqual(self.index.book(1, 1, T + hours(1), T + hours(3), ('line', 2)), [])
+        # unbooking what is not there changes nothing
+        self.index.unbook(1, 1, T, T + hours(2), ('show', 1))
+        self.assertEqual(len(self.index), 2)
+
+
+class SweepTest(unittest.TestCase):
+
+    def test_pairs_reported_once(self):
+        rows = [
+            (1, T, T + hours(2), 10),
+            (1, T + hours(1), T + hours(3), 11),
+            (1, T + hours(2), T + hours(4), 12),
+            (1, T + hours(5), T + hours(6), 13),
+            # a new key starts a new schedule
+            (2, T + hours(5), T + hours(7), 14),
+            # rows without times book nothing
+            (2, None, None, 15),
+            (2, T + hours(6), None, 16),
+        ]
+        pairs = [(c.key, c.ref[1], c.other_ref[1]) for c in sweep_conflicts('venue', rows)]
+        self.assertEqual(pairs, [(1, 11, 10), (1, 12, 11)])
+
+
+class CreateShowTest(unittest.TestCase):
+
+    def setUp(self):
+        self.context = fyyur.app.app_context()
+        self.context.push()
+        db = fyyur.db
+        db.drop_all()
+        db.create_all()
+        venues = [fyyur.Venue(name='Venue %d' % n, genres=['Jazz']) for n in range(2)]
+        artists = [fyyur.Artist(name='Artist %d' % n, genres=['Jazz']) for n in range(2)]
+        db.session.add_all(venues + artists)
+        db.session.commit()
+        self.venue_ids = [venue.id for venue in venues]
+        self.artist_ids = [artist.id for artist in artists]
+        db.session.remove()
+        self.context.pop()
+        self.client = fyyur.app.test_client()
+
+    def post(self, venue, artist, start_time, duration=120):
+        return self.client.post('/shows/create', data={
+            'venue_id': self.venue_ids[venue], 'artist_id': self.artist_ids[artist],
+            'start_time': start_time.strftime('%Y-%m-%d %H:%M:%S'), 'duration': duration})
+
+    def shows(self):
+        with fyyur.app.app_context():
+            return fyyur.Show.query.count()
+
+    def test_overlapping_show_refused(self):
+        self.assertEqual(self.post(0, 0, T).status_code, 200)
+        # same venue, other artist, an hour in
+        response = self.post(0, 1, T + hours(1))
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('overlaps another booking', response.get_data(as_text=True))
+        # same artist, other venue
+        self.assertEqual(self.post(1, 0, T + hours(1)).status_code, 400)
+        self.assertEqual(self.shows(), 1)
+
+    def test_adjacent_show_listed(self):
+        self.assertEqual(self.post(0, 0, T).status_code, 200)
+        self.assertEqual(self.post(0, 1, T + hours(2)).status_code, 200)
+        self.assertEqual(self.post(1, 0, T + hours(2)).status_code, 200)
+        self.assertEqual(self.shows(), 3)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,120 @@
+import datetime
+import os
+import tempfile
+import unittest
+
+# a scratch SQLite database; must be set before the app reads its config
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.gettempdir(), 'fyyur_test.db')
+os.environ['SHOW_BOUNDARY_SCHEDULER'] = '0'
+os.environ['WTF_CSRF_ENABLED'] = '0'
+
+from facets import make_filters
+from search import InMemorySearch, SearchBackend, similarity, trigrams
+import app as fyyur
+
+#----------------------------------------------------------------------------#
+# Name search: the trigram similarity that ranks results, and the in-process
+# index that serves it off postgres.
+#----------------------------------------------------------------------------#
+
+class SimilarityTest(unittest.TestCase):
+
+    def test_trigrams(self):
+        self.assertEqual(trigrams('Ab'), set(['  a', ' ab', 'ab ']))
+        self.assertEqual(trigrams('a B'), set(['  a', ' a ', '  b', ' b ']))
+        self.assertEqual(trigrams(''), set())
+
+    def test_similarity(self):
+        self.assertEqual(similarity('Jazz', 'jazz'), 1.0)
+        self.assertEqual(similarity('Jazz', ''), 0.0)
+        self.assertGreater(similarity('Jazz', 'Jazz Club'), similarity('Jazz', 'All That Jazz Club'))
+
+    def test_backend_is_abstract(self):
+        with self.assertRaises(TypeError):
+            SearchBackend(fyyur.db, fyyur.Venue, fyyur.VenueShowCount.venue_id, fyyur.VenueShowCount.upcoming)
+
+
+class InMemorySearchTest(unittest.TestCase):
+
+    def setUp(self):
+        self.context = fyyur.app.app_context()
+        self.context.push()
+        db = fyyur.db
+        db.drop_all()
+        db.create_all()
+        self.venues = {}
+        for name, city, state in (
+            ('All That Jazz Club', 'New York', 'NY'),
+            ('Jazz', 'New York', 'NY'),
+            ('Jazz Club', 'San Francisco', 'CA'),
+            ('Blues Bar', 'New York', 'NY'),
+            ('100% Rock', 'Austin', 'TX'),
+        ):
+            self.venues[name] = fyyur.Venue(name=name, city=city, state=state, genres=['Jazz'])
+        artist = fyyur.Artist(name='Trio', genres=['Jazz'])
+        db.session.add_all(list(self.venues.values()) + [artist])
+        db.session.flush()
+        start_time = datetime.datetime.now() + datetime.timedelta(days=7)
+        db.session.add(fyyur.Show(venue_id=self.venues['Jazz Club'].id, artist_id=artist.id,
+                                  start_time=start_time, end_time=start_time + fyyur.DEFAULT_DURATION))
+        db.session.commit()
+        fyyur.refresh_show_counts(full=True)
+        fyyur.venue_search.invalidate()
+
+    def tearDown(self):
+        fyyur.db.session.remove()
+        self.context.pop()
+
+    def names(self, term, filters=None):
+        return [row['name'] for row in fyyur.venue_search.search(term, filters)['data']]
+
+    def test_backend(self):
+        fyyur.venue_search.search('')
+        self.assertIsInstance(fyyur.venue_search.backend, InMemorySearch)
+
+    def test_ranking(self):
+        # the closest name first, then by name
+        self.assertEqual(self.names('jazz'), ['Jazz', 'Jazz Club', 'All That Jazz Club'])
+        self.assertEqual(self.names('CLUB'), ['Jazz Club', 'All That Jazz Club'])
+        self.assertEqual(self.names('Punk'), [])
+
+    def test_substring_not_trigram_match(self):
+        # every trigram of the term is in "Jazz Club", but not the term
+        self.assertEqual(self.names('club jazz'), [])
+        self.assertEqual(self.names('z C'), ['Jazz Club', 'All That Jazz Club'])
+
+    def test_short_and_special_terms(self):
+        self.assertEqual(len(self.names('')), 5)
+        self.assertEqual(self.names('Ja'), ['Jazz', 'Jazz Club', 'All That Jazz Club'])
+        self.assertEqual(self.names('0%'), ['100% Rock'])
+        self.assertEqual(self.names('_'), [])
+
+    def test_counts_and_limit(self):
+        result = fyyur.venue_search.search('jazz')
+        self.assertEqual(result['count'], 3)
+        self.assertEqual([row['num_upcoming_shows'] for row in result['data']], [0, 1, 0])
+        backend = fyyur.venue_search.backend
+        backend.limit = 2
+        try:
+            result = fyyur.venue_search.search('jazz')
+        finally:
+            backend.limit = 50
+        self.assertEqual(result['count'], 3)
+        self.assertEqual([row['name'] for row in result['data']], ['Jazz', 'Jazz Club'])
+
+    def test_filters(self):
+        self.assertEqual(self.names('jazz', make_filters(state='NY')), ['Jazz', 'All That Jazz Club'])
+        self.assertEqual(self.names('jazz', make_filters(['Blues'])), [])
+
+    def test_index_follows_commits(self):
+        self.assertEqual(self.names('Blues'), ['Blues Bar'])
+        self.venues['Blues Bar'].name = 'Soul Bar'
+        fyyur.db.session.commit()
+        self.assertEqual(self.names('Blues'), [])
+        self.assertEqual(self.names('soul'), ['Soul Bar'])
+        fyyur.db.session.delete(self.venues['Jazz'])
+        fyyur.db.session.commit()
+        self.assertEqual(self.names('jazz'), ['Jazz Club', 'All That Jazz Club'])
+
+if __name__ == '__main__':
+    unittest.main()
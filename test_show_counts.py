@@ -0,0 +1,88 @@
+import datetime
+import os
+import tempfile
+import unittest
+
+# a scratch SQLite database; must be set before the app reads its config
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.gettempdir(), 'fyyur_test.db')
+os.environ['SHOW_BOUNDARY_SCHEDULER'] = '0'
+os.environ['WTF_CSRF_ENABLED'] = '0'
+
+from sqlalchemy import inspect
+import app as fyyur
+
+#----------------------------------------------------------------------------#
+# The per-venue/per-artist show counters follow every insert, edit and
+# delete of a show, including edits of an instance a commit has expired,
+# whose old values are not loaded when the edit is made.
+#----------------------------------------------------------------------------#
+
+class ShowCountTest(unittest.TestCase):
+
+    def setUp(self):
+        self.context = fyyur.app.app_context()
+        self.context.push()
+        db = fyyur.db
+        db.drop_all()
+        db.create_all()
+        self.now = fyyur.clock.naive()
+        self.venues = [fyyur.Venue(name='Venue %d' % n, genres=['Jazz']) for n in range(2)]
+        self.artists = [fyyur.Artist(name='Artist %d' % n, genres=['Jazz']) for n in range(2)]
+        db.session.add_all(self.venues + self.artists)
+        db.session.commit()
+        fyyur.refresh_show_counts(self.now, full=True)
+
+    def tearDown(self):
+        fyyur.db.session.remove()
+        self.context.pop()
+
+    def counts(self, key, id):
+        # (upcoming, past) of one counter row
+        row = key.class_.query.filter(key == id).first()
+        return (row.upcoming, row.past) if row is not None else (0, 0)
+
+    def venue_counts(self, n):
+        return self.counts(fyyur.VenueShowCount.venue_id, self.venues[n].id)
+
+    def artist_counts(self, n):
+        return self.counts(fyyur.ArtistShowCount.artist_id, self.artists[n].id)
+
+    def add_show(self, days):
+        # a show days from now at venue 0 with artist 0, committed, so the
+        # instance is expired when it is returned
+        start_time = self.now + datetime.timedelta(days=days)
+        show = fyyur.Show(venue_id=self.venues[0].id, artist_id=self.artists[0].id,
+                          start_time=start_time, end_time=start_time + fyyur.DEFAULT_DURATION)
+        fyyur.db.session.add(show)
+        fyyur.db.session.commit()
+        return show
+
+    def test_insert_and_delete(self):
+        show = self.add_show(3)
+        self.assertEqual(self.venue_counts(0), (1, 0))
+        self.assertEqual(self.artist_counts(0), (1, 0))
+        fyyur.db.session.delete(show)
+        fyyur.db.session.commit()
+        self.assertEqual(self.venue_counts(0), (0, 0))
+        self.assertEqual(self.artist_counts(0), (0, 0))
+
+    def test_expired_show_moved_to_another_venue_and_artist(self):
+        show = self.add_show(3)
+        self.assertIn('venue_id', inspect(show).expired_attributes)
+        show.venue_id = self.venues[1].id
+        show.artist_id = self.artists[1].id
+        fyyur.db.session.commit()
+        self.assertEqual((self.venue_counts(0), self.venue_counts(1)), ((0, 0), (1, 0)))
+        self.assertEqual((self.artist_counts(0), self.artist_counts(1)), ((0, 0), (1, 0)))
+
+    def test_expired_show_moved_into_the_past(self):
+        show = self.add_show(3)
+        self.assertIn('start_time', inspect(show).expired_attributes)
+        show.start_time = self.now - datetime.timedelta(days=3)
+        show.end_time = show.start_time + fyyur.DEFAULT_DURATION
+        fyyur.db.session.commit()
+        self.assertEqual(self.venue_counts(0), (0, 1))
+        self.assertEqual(self.artist_counts(0), (0, 1))
+
+if __name__ == '__main__':
+    unittest.main()
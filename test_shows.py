@@ -0,0 +1,94 @@
+import datetime
+import os
+import re
+import tempfile
+import unittest
+
+# a scratch SQLite database; must be set before the app reads its config
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.gettempdir(), 'fyyur_test.db')
+os.environ['SHOW_BOUNDARY_SCHEDULER'] = '0'
+os.environ['WTF_CSRF_ENABLED'] = '0'
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+import app as fyyur
+
+#----------------------------------------------------------------------------#
+# The /shows listing: one joined query per page whatever its size, paged in
+# start time order.
+#----------------------------------------------------------------------------#
+
+T = datetime.datetime(2030, 5, 1, 20, 0)
+
+class ShowListingTest(unittest.TestCase):
+
+    def setUp(self):
+        with fyyur.app.app_context():
+            db = fyyur.db
+            db.drop_all()
+            db.create_all()
+            venues = [fyyur.Venue(name='Venue %d' % n, genres=['Jazz']) for n in range(3)]
+            artists = [fyyur.Artist(name='Artist %d' % n, genres=['Jazz'], image_link='/artist/%d.png' % n)
+                       for n in range(4)]
+            db.session.add_all(venues + artists)
+            db.session.flush()
+            # listed out of start order, one booking a day per venue
+            for n in reversed(range(30)):
+                start_time = T + datetime.timedelta(days=n // 3)
+                db.session.add(fyyur.Show(venue_id=venues[n % 3].id, artist_id=artists[n % 4].id,
+                                          start_time=start_time, end_time=start_time + fyyur.DEFAULT_DURATION))
+            db.session.commit()
+            shows = fyyur.Show.query.order_by(fyyur.Show.start_time, fyyur.Show.id).all()
+            self.expected = [(show.artist.name, show.venue.name) for show in shows]
+            self.first = (shows[0].artist_id, shows[0].artist.image_link, shows[0].venue_id)
+        for cache in (fyyur.entity_cache, fyyur.page_cache, fyyur.feed_cache, fyyur.facet_cache):
+            cache.clear()
+        self.client = fyyur.app.test_client()
+        self.statements = 0
+        event.listen(Engine, 'before_cursor_execute', self.count)
+
+    def tearDown(self):
+        event.remove(Engine, 'before_cursor_execute', self.count)
+
+    def count(self, *args):
+        self.statements += 1
+
+    def listing(self, query_string):
+        self.statements = 0
+        response = self.client.get('/shows', query_string=query_string)
+        self.assertEqual(response.status_code, 200)
+        page = response.get_data(as_text=True)
+        shows = re.findall(r'<a href="/artists/\d+">([^<]+)</a></h5>\s*<p>playing at</p>\s*'
+                           r'<h5><a href="/venues/\d+">([^<]+)</a>', page)
+        cursor = re.search(r'after=([^&"]+)', page.replace('&amp;', '&'))
+        return shows, cursor.group(1) if cursor else None
+
+    def test_one_statement_per_page(self):
+        shows, cursor = self.listing({'limit': 2})
+        self.assertEqual(len(shows), 2)
+        small = self.statements
+        shows, cursor = self.listing({'limit': 30})
+        self.assertEqual(len(shows), 30)
+        self.assertEqual(self.statements, small)
+        self.assertLessEqual(self.statements, 1)
+
+    def test_pages_in_start_order(self):
+        listed = []
+        cursor = None
+        while True:
+            shows, cursor = self.listing({'limit': 7, 'after': cursor} if cursor else {'limit': 7})
+            listed.extend(shows)
+            if cursor is None:
+                break
+        self.assertEqual(listed, self.expected)
+
+    def test_row_fields(self):
+        page = self.client.get('/shows', query_string={'limit': 1}).get_data(as_text=True)
+        artist_id, image_link, venue_id = self.first
+        self.assertIn('src="%s"' % image_link, page)
+        self.assertIn('href="/artists/%d"' % artist_id, page)
+        self.assertIn('href="/venues/%d"' % venue_id, page)
+        self.assertIn('Wednesday May, 1, 2030 at 8:00PM', page)
+
+if __name__ == '__main__':
+    unittest.main()
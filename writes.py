@@ -0,0 +1,102 @@
+import logging
+from sqlalchemy import exc
+
+#----------------------------------------------------------------------------#
+# Unit of work.
+#
+# Every create/edit/delete request runs its writes in one UnitOfWork: the
+# form is validated first, the rows a show refers to are checked before
+# anything is added, and the session is committed once at the end, so all
+# changes go out in a single flush. Any failure rolls the session back and
+# closes it, which hands its connection back to the pool; a failed request
+# never leaves a broken transaction behind for the next one on the worker.
+#----------------------------------------------------------------------------#
+
+log = logging.getLogger(__name__)
+
+
+class WriteError(Exception):
+    # a write that was refused or failed; message is shown to the user,
+    # errors maps form fields to their messages
+
+    def __init__(self, message, errors=None):
+        super(WriteError, self).__init__(message)
+        self.message = message
+        self.errors = errors or {}
+
+    def describe(self):
+        # "message: field: error; field: error" for a flash message
+        details = '; '.join('%s: %s' % (field, ' '.join(messages)) for field, messages in sorted(self.errors.items()))
+        return '%s: %s' % (self.message, details) if details else self.message
+
+
+class UnitOfWork(object):
+
+    def __init__(self, session):
+        self.session = session
+        self.callbacks = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        if type is None:
+            try:
+                self.session.commit()
+            except exc.IntegrityError as e:
+                self.abort()
+                log.warning('write refused by the database: %s', e.orig)
+                raise WriteError('it conflicts with existing data')
+            except exc.SQLAlchemyError:
+                self.abort()
+                log.exception('write failed')
+                raise WriteError('the database could not save it, please try again')
+            except BaseException:
+                self.abort()
+                raise
+            for callback in self.callbacks:
+                callback()
+            return False
+        self.abort()
+        if isinstance(value, exc.SQLAlchemyError):
+            log.exception('write failed')
+            raise WriteError('the database could not save it, please try again')
+        return False
+
+    def abort(self):
+        try:
+            self.session.rollback()
+        finally:
+            self.session.close()
+
+    def validate(self, form):
+        # the form's data, or WriteError with the form's errors
+        if not form.validate():
+            raise WriteError('the form is not valid', form.errors)
+        return form.data
+
+    def require(self, model, id, field):
+        # up-front foreign key check: id must be an existing model row.
+        # Pending objects are not flushed for it, so the unit still writes
+        # everything in one flush at commit.
+        try:
+            id = int(id)
+        except (TypeError, ValueError):
+            raise WriteError('the form is not valid', {field: ['Not a valid id.']})
+        with self.session.no_autoflush:
+            found = self.session.query(model.id).filter(model.id == id).first()
+        if found is None:
+            label = model.__tablename__.lower()
+            raise WriteError('the form is not valid', {field: ['No %s with id %d.' % (label, id)]})
+        return id
+
+    def add(self, entity):
+        self.session.add(entity)
+        return entity
+
+    def delete(self, entity):
+        self.session.delete(entity)
+
+    def after_commit(self, callback):
+        # runs only once the commit succeeded, e.g. cache invalidation
+        self.callbacks.append(callback)
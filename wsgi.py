@@ -0,0 +1,15 @@
+import os
+
+#----------------------------------------------------------------------------#
+# WSGI entry point for production servers:
+#
+#   gunicorn -c gunicorn.conf.py wsgi:application
+#
+# The prod profile is the default here; FYYUR_ENV still overrides it.
+#----------------------------------------------------------------------------#
+
+os.environ.setdefault('FYYUR_ENV', 'prod')
+
+from app import app
+
+application = app